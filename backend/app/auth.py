@@ -1,3 +1,4 @@
+import os
 from datetime import datetime, timedelta
 from jose import ExpiredSignatureError, JWTError, jwt
 from passlib.context import CryptContext
@@ -6,9 +7,26 @@ SECRET_KEY = "d9a3f0b6c82e4f1b9d7a1c4e6f3b8a7d9e2c5f8a4b6d7c9e1f2a3b4c5d6e7"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Cost parameters for new hashes. Stored hashes at any other cost are
+# rehashed on the next successful login (see verify_and_rehash).
+PASSWORD_BCRYPT_ROUNDS = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", "12"))
+PASSWORD_PBKDF2_ROUNDS = int(os.getenv("PASSWORD_PBKDF2_ROUNDS", "29000"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=PASSWORD_BCRYPT_ROUNDS,
+    bcrypt__min_rounds=PASSWORD_BCRYPT_ROUNDS,
+    bcrypt__max_rounds=PASSWORD_BCRYPT_ROUNDS,
+)
 # fallback context if bcrypt backend fails for any reason (e.g., missing/incorrect bcrypt lib)
-fallback_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+fallback_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__default_rounds=PASSWORD_PBKDF2_ROUNDS,
+    pbkdf2_sha256__min_rounds=PASSWORD_PBKDF2_ROUNDS,
+    pbkdf2_sha256__max_rounds=PASSWORD_PBKDF2_ROUNDS,
+)
 
 def verify_ws_token(token: str):
     try:
@@ -99,6 +117,27 @@ def identify_hash_scheme(hashed_password: str):
     return None
 
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True when a stored hash was made with a cost other than the configured one."""
+    scheme = identify_hash_scheme(hashed_password)
+    for context in (pwd_context, fallback_context):
+        if scheme in context.schemes():
+            try:
+                return context.needs_update(hashed_password)
+            except Exception:
+                return False
+    return False
+
+
+def verify_and_rehash(plain_password, hashed_password):
+    """Return (verified, new hash or None); a new hash is only made for a correct password."""
+    if not verify_password(plain_password, hashed_password):
+        return False, None
+    if not password_needs_rehash(hashed_password):
+        return True, None
+    return True, hash_password(plain_password)
+
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
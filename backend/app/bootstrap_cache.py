@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+
+logger = logging.getLogger("app.bootstrap_cache")
+
+# Safety net for writes that don't invalidate explicitly (e.g. presence fields)
+BOOTSTRAP_CACHE_TTL_SECONDS = float(os.getenv("BOOTSTRAP_CACHE_TTL_SECONDS", "300"))
+BOOTSTRAP_CACHE_MAX_ENTRIES = int(os.getenv("BOOTSTRAP_CACHE_MAX_ENTRIES", "20000"))
+BOOTSTRAP_REBUILD_INTERVAL_SECONDS = float(os.getenv("BOOTSTRAP_REBUILD_INTERVAL_SECONDS", "1"))
+BOOTSTRAP_REBUILD_CONCURRENCY = int(os.getenv("BOOTSTRAP_REBUILD_CONCURRENCY", "4"))
+
+
+def _dumps(value):
+    return json.dumps(jsonable_encoder(value), ensure_ascii=False, separators=(",", ":"))
+
+
+class BootstrapCache:
+    """Per-user cache of the relational part of /users/bootstrap.
+
+    The friends / spaces / member-profiles part of the payload is cached
+    pre-serialized, together with the generation of every space and user it
+    was built from. Writers call `invalidate_space` / `invalidate_user`, which
+    bump the generation and queue the affected requesters for a background
+    rebuild. An entry is valid while its key (the requester's own friend and
+    space lists) and all recorded generations still match. The requester's own
+    document is never cached; it is already loaded by authentication.
+
+    `loader(user_id)` must return the requester document and
+    `builder(requester)` the `{"friends", "spaces", "users"}` parts; both are
+    set by the users routes.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, rebuild_interval: float, rebuild_concurrency: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.rebuild_interval = rebuild_interval
+        self.rebuild_concurrency = max(1, rebuild_concurrency)
+        self.builder = None
+        self.loader = None
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._space_generations = {}
+        self._user_generations = {}
+        # dependency -> requesters whose cached payload includes it
+        self._space_dependents = {}
+        self._user_dependents = {}
+        self._dirty = set()
+        self._task: asyncio.Task | None = None
+        self.hits_total = 0
+        self.misses_total = 0
+        self.not_modified_total = 0
+        self.rebuilds_total = 0
+
+    @staticmethod
+    def cache_key(requester):
+        lists = [[str(v) for v in requester.get("friends") or []], [str(v) for v in requester.get("spaces") or []]]
+        return hashlib.sha1(json.dumps(lists).encode()).hexdigest()
+
+    def invalidate_space(self, space_id):
+        self._bump(self._space_generations, self._space_dependents, space_id)
+
+    def invalidate_user(self, user_id):
+        self._bump(self._user_generations, self._user_dependents, user_id)
+
+    def _bump(self, generations, dependents, key):
+        if key is None:
+            return
+        key = str(key)
+        with self._lock:
+            generations[key] = generations.get(key, 0) + 1
+            self._dirty |= dependents.get(key, set())
+
+    def _valid(self, entry, key):
+        if entry is None or entry["key"] != key or time.monotonic() - entry["builtAt"] > self.ttl:
+            return False
+        return all(self._space_generations.get(k, 0) == g for k, g in entry["spaces"].items()) and all(
+            self._user_generations.get(k, 0) == g for k, g in entry["users"].items()
+        )
+
+    def _build(self, requester):
+        user_id = str(requester.get("id"))
+        key = self.cache_key(requester)
+        with self._lock:
+            # Generations are read before building so a write racing with the
+            # build leaves the entry stale rather than wrongly fresh
+            space_ids = {str(v) for v in requester.get("spaces") or []}
+            spaces_before = {k: self._space_generations.get(k, 0) for k in space_ids}
+            users_snapshot = dict(self._user_generations)
+        parts = self.builder(requester)
+        body = _dumps(parts)
+        user_ids = {str(u.get("id")) for u in parts.get("friends", []) + parts.get("users", []) if u and u.get("id") is not None}
+        user_ids |= {str(v) for v in requester.get("friends") or []}
+        entry = {
+            "key": key,
+            "body": body,
+            "digest": hashlib.sha1(body.encode()).hexdigest(),
+            "spaces": spaces_before,
+            "users": {k: users_snapshot.get(k, 0) for k in user_ids},
+            "builtAt": time.monotonic(),
+        }
+        with self._lock:
+            old = self._entries.pop(user_id, None)
+            if old:
+                self._forget(user_id, old)
+            if len(self._entries) >= self.max_entries:
+                oldest_id = min(self._entries, key=lambda uid: self._entries[uid]["builtAt"])
+                self._forget(oldest_id, self._entries.pop(oldest_id))
+            self._entries[user_id] = entry
+            for k in entry["spaces"]:
+                self._space_dependents.setdefault(k, set()).add(user_id)
+            for k in entry["users"]:
+                self._user_dependents.setdefault(k, set()).add(user_id)
+        return entry
+
+    def _forget(self, user_id, entry):
+        for k in entry["spaces"]:
+            self._space_dependents.get(k, set()).discard(user_id)
+        for k in entry["users"]:
+            self._user_dependents.get(k, set()).discard(user_id)
+
+    def get(self, requester, user_payload):
+        """Return (body_json, etag) for the full payload, with `user_payload` as its "user"."""
+        user_id = str(requester.get("id"))
+        key = self.cache_key(requester)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            valid = self._valid(entry, key)
+        if valid:
+            self.hits_total += 1
+        else:
+            self.misses_total += 1
+            entry = self._build(requester)
+
+        user_json = _dumps(user_payload)
+        body = '{"user":' + user_json + "," + entry["body"][1:]
+        etag = '"' + hashlib.sha1((entry["digest"] + user_json).encode()).hexdigest() + '"'
+        return body, etag
+
+    def start(self):
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            try:
+                await self.rebuild_dirty()
+            except Exception as exc:
+                logger.warning("Bootstrap rebuild failed: %s", exc)
+
+    async def rebuild_dirty(self):
+        with self._lock:
+            dirty = [uid for uid in self._dirty if uid in self._entries]
+            self._dirty = set()
+        if not dirty or not self.builder or not self.loader:
+            return 0
+        slots = asyncio.Semaphore(self.rebuild_concurrency)
+
+        async def _rebuild(user_id):
+            async with slots:
+                try:
+                    requester = await run_in_threadpool(self.loader, user_id)
+                    if requester:
+                        await run_in_threadpool(self._build, requester)
+                        self.rebuilds_total += 1
+                except Exception as exc:
+                    logger.warning("Bootstrap rebuild for %s failed: %s", user_id, exc)
+
+        await asyncio.gather(*(_rebuild(uid) for uid in dirty))
+        return len(dirty)
+
+    def snapshot(self):
+        return {
+            "entries": len(self._entries),
+            "pendingRebuilds": len(self._dirty),
+            "hits": self.hits_total,
+            "misses": self.misses_total,
+            "notModified": self.not_modified_total,
+            "rebuilds": self.rebuilds_total,
+        }
+
+
+bootstrap_cache = BootstrapCache(
+    ttl=BOOTSTRAP_CACHE_TTL_SECONDS,
+    max_entries=BOOTSTRAP_CACHE_MAX_ENTRIES,
+    rebuild_interval=BOOTSTRAP_REBUILD_INTERVAL_SECONDS,
+    rebuild_concurrency=BOOTSTRAP_REBUILD_CONCURRENCY,
+)
@@ -0,0 +1,113 @@
+import logging
+import re
+import time
+from datetime import datetime, timezone
+
+from pymongo import DeleteOne, UpdateOne
+
+from app.database import attachment_refs_collection, messages_collection
+
+logger = logging.getLogger("app.core.attachment_refs")
+
+# One document per message that carries attachments:
+#   {_id: "<chatId>:<messageKey>", chatId, messageKey, fileIds: [...]}
+# with a multikey index on fileIds, so "which chats reference this file" is a
+# single indexed lookup instead of an $or scan over messages.
+_ID_FIELDS = ("fileId", "id", "drive_file_id")
+_URL_FIELDS = ("url", "webViewLink", "public_url")
+_DOWNLOAD_URL_RE = re.compile(r"/upload/file/([^/?#]+)/download")
+# Written by the backfill once every existing message has been indexed; until
+# then lookups that miss fall back to scanning messages.
+_BACKFILL_MARKER_ID = "__backfill_complete__"
+_READY_CACHE_TTL_SECONDS = 60.0
+_ready_cache = {"ready": False, "checkedAt": 0.0}
+
+
+def attachment_file_ids(message: dict):
+    ids = set()
+    for attachment in (message or {}).get("attachments") or []:
+        if not isinstance(attachment, dict):
+            continue
+        for key in _ID_FIELDS:
+            value = attachment.get(key)
+            if value is not None and str(value):
+                ids.add(str(value))
+        for key in _URL_FIELDS:
+            match = _DOWNLOAD_URL_RE.search(str(attachment.get(key) or ""))
+            if match:
+                ids.add(match.group(1))
+    return sorted(ids)
+
+
+def _ref_id(chat_id, message_key):
+    return f"{chat_id}:{message_key}"
+
+
+def _sync_op(chat_id, message_key, message):
+    file_ids = attachment_file_ids(message)
+    ref_id = _ref_id(chat_id, message_key)
+    if not file_ids:
+        return DeleteOne({"_id": ref_id})
+    return UpdateOne(
+        {"_id": ref_id},
+        {"$set": {"chatId": str(chat_id), "messageKey": str(message_key), "fileIds": file_ids}},
+        upsert=True,
+    )
+
+
+def sync_message_refs(chat_id, message_key, message: dict):
+    """Record the files a message references (or drop its entry if it has none)."""
+    if message_key is None:
+        return
+    attachment_refs_collection.bulk_write([_sync_op(chat_id, message_key, message)])
+
+
+def drop_message_refs(chat_id, message_key):
+    attachment_refs_collection.delete_one({"_id": _ref_id(chat_id, message_key)})
+
+
+def refs_ready() -> bool:
+    now = time.monotonic()
+    if _ready_cache["ready"] or now - _ready_cache["checkedAt"] < _READY_CACHE_TTL_SECONDS:
+        return _ready_cache["ready"]
+    _ready_cache["ready"] = attachment_refs_collection.count_documents({"_id": _BACKFILL_MARKER_ID}, limit=1) > 0
+    _ready_cache["checkedAt"] = now
+    return _ready_cache["ready"]
+
+
+def chat_ids_for_file(file_id: str):
+    return attachment_refs_collection.distinct("chatId", {"fileIds": str(file_id)})
+
+
+def backfill_attachment_refs(batch_size: int = 500):
+    """Index attachments of every existing message, then mark the index complete."""
+    stats = {"messages": 0, "indexed": 0}
+    ops = []
+    cursor = messages_collection.find(
+        {"message.attachments.0": {"$exists": True}},
+        {"chatId": 1, "message.id": 1, "message.attachments": 1},
+    ).batch_size(batch_size)
+    for doc in cursor:
+        message = doc.get("message") or {}
+        message_key = message.get("id")
+        if message_key is None:
+            message_key = doc["_id"]
+        stats["messages"] += 1
+        op = _sync_op(doc.get("chatId"), message_key, message)
+        if isinstance(op, UpdateOne):
+            stats["indexed"] += 1
+        ops.append(op)
+        if len(ops) >= batch_size:
+            attachment_refs_collection.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        attachment_refs_collection.bulk_write(ops, ordered=False)
+
+    attachment_refs_collection.update_one(
+        {"_id": _BACKFILL_MARKER_ID},
+        {"$set": {"completedAt": datetime.now(timezone.utc).isoformat(), **stats}},
+        upsert=True,
+    )
+    _ready_cache["ready"] = True
+    logger.info("Attachment refs backfill complete: %s", stats)
+    return stats
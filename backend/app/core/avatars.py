@@ -0,0 +1,170 @@
+import base64
+import binascii
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from app.core.file_storage import release_content, store_deduplicated
+from app.core.previews import delete_previews, is_previewable, queue_previews
+from app.database import files_collection, users_collection
+
+logger = logging.getLogger("app.core.avatars")
+
+# Variants rendered eagerly for avatar files (must be THUMBNAIL_SIZES entries);
+# avatar_url points at AVATAR_URL_SIZE and clients can ask for the others
+AVATAR_VARIANT_SIZES = (128, 256, 512)
+AVATAR_URL_SIZE = 256
+# Inline images larger than this are left alone rather than decoded
+AVATAR_MAX_SOURCE_BYTES = int(os.getenv("AVATAR_MAX_SOURCE_BYTES", str(10 * 1024 * 1024)))
+AVATAR_FILE_PURPOSE = "avatar"
+
+_DATA_URL_RE = re.compile(r"^data:([^;,]*)((?:;[^;,]*)*),", re.IGNORECASE)
+
+
+def is_data_url(value) -> bool:
+    return isinstance(value, str) and value[:5].lower() == "data:"
+
+
+def decode_data_url(value):
+    """(mimetype, bytes) for an inline image, or None if it is not one we can store."""
+    if not is_data_url(value):
+        return None
+    match = _DATA_URL_RE.match(value)
+    if not match:
+        return None
+    mimetype = (match.group(1) or "").strip().lower()
+    payload = value[match.end():]
+    # base64 inflates by 4/3; refuse before decoding anything oversized
+    if len(payload) * 3 // 4 > AVATAR_MAX_SOURCE_BYTES:
+        return None
+    if ";base64" not in match.group(2).lower():
+        return None
+    try:
+        data = base64.b64decode(payload, validate=False)
+    except (binascii.Error, ValueError):
+        return None
+    if not data or not is_previewable({"mimetype": mimetype, "size": len(data)}):
+        return None
+    return mimetype, data
+
+
+def avatar_file_url(file_id, version=None, size: int = AVATAR_URL_SIZE):
+    url = f"/upload/file/{file_id}/thumbnail?size={size}"
+    return f"{url}&v={version}" if version is not None else url
+
+
+def store_avatar(user_id, data_url):
+    """Move an inline data-URL avatar into the file store.
+
+    Returns the new file id, or None when the value is not an image we can
+    render (it is then left inline). The file document is marked as an
+    avatar so any signed-in user may load it, as they could the inline value.
+    """
+    decoded = decode_data_url(data_url)
+    if not decoded:
+        return None
+    mimetype, data = decoded
+    sha256 = hashlib.sha256(data).hexdigest()
+    filename = f"avatar{mimetypes.guess_extension(mimetype) or ''}"
+    doc_id = files_collection.insert_one({
+        "userId": str(user_id),
+        "filename": filename,
+        "mimetype": mimetype,
+        "size": len(data),
+        "status": "uploading",
+        "purpose": AVATAR_FILE_PURPOSE,
+        "createdAt": datetime.now(timezone.utc).isoformat(),
+    }).inserted_id
+
+    fd, path = tempfile.mkstemp(prefix="avatar-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        stored, deduplicated = store_deduplicated(path, filename, sha256, len(data), file_doc_id=doc_id)
+    except Exception as exc:
+        files_collection.update_one({"_id": doc_id}, {"$set": {"status": "error", "error": str(exc)}})
+        raise
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    download_path = f"/upload/file/{doc_id}/download"
+    files_collection.update_one(
+        {"_id": doc_id},
+        {"$set": {"status": "done", "fileId": str(doc_id), "name": filename, "webViewLink": download_path, "sha256": sha256, "deduplicated": deduplicated, "contentLinked": True, **stored}},
+    )
+    try:
+        queue_previews({"_id": doc_id, "filename": filename, "mimetype": mimetype, "sha256": sha256, **stored, "size": len(data)}, AVATAR_VARIANT_SIZES)
+    except Exception as exc:
+        # The thumbnail route renders missing variants on first request
+        logger.warning("Failed to queue avatar variants for file %s: %s", doc_id, exc)
+    return str(doc_id)
+
+
+def release_avatar(file_id):
+    """Delete a replaced avatar file and drop its content reference."""
+    try:
+        oid = ObjectId(str(file_id))
+    except InvalidId:
+        return
+    # Only avatar files: avatar_file_id is never trusted to point elsewhere
+    doc = files_collection.find_one_and_delete({"_id": oid, "purpose": AVATAR_FILE_PURPOSE})
+    if doc and release_content(doc):
+        delete_previews(doc)
+
+
+def extract_avatar_data_urls(batch_size: int = 100, limit: int | None = None):
+    """Move inline data-URL avatars on existing users into the file store.
+
+    Users are read `batch_size` at a time with only the avatar fields. Each
+    rewrite is conditional on `avatar_url` being unchanged, so a profile
+    save that lands mid-run wins. Safe to re-run: converted users no longer
+    match.
+    """
+    stats = {"converted": 0, "skipped": 0, "changed": 0, "failed": 0}
+    cursor = users_collection.find(
+        {"avatar_url": {"$regex": "^data:"}},
+        {"_id": 1, "id": 1, "avatar_url": 1, "avatar_version": 1, "avatar_file_id": 1},
+    ).batch_size(batch_size)
+    if limit:
+        cursor = cursor.limit(int(limit))
+
+    for user in cursor:
+        try:
+            file_id = store_avatar(user.get("id"), user.get("avatar_url"))
+        except Exception as exc:
+            stats["failed"] += 1
+            logger.error("Failed to extract avatar for user %s: %s", user.get("id"), exc)
+            continue
+        if not file_id:
+            stats["skipped"] += 1
+            continue
+        version = user.get("avatar_version") or int(time.time() * 1000)
+        result = users_collection.update_one(
+            {"_id": user["_id"], "avatar_url": user.get("avatar_url")},
+            {"$set": {"avatar_url": avatar_file_url(file_id, version), "avatar_file_id": file_id, "avatar_version": version, "avatar_updated_at": version}},
+        )
+        if result.modified_count:
+            stats["converted"] += 1
+            previous_file_id = user.get("avatar_file_id")
+        else:
+            # Lost to a concurrent profile save; the file we just stored is unused
+            stats["changed"] += 1
+            previous_file_id = file_id
+        if previous_file_id:
+            try:
+                release_avatar(previous_file_id)
+            except Exception as exc:
+                logger.warning("Failed to release avatar file %s: %s", previous_file_id, exc)
+    logger.info("Avatar extraction complete: %s", stats)
+    return stats
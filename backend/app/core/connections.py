@@ -0,0 +1,173 @@
+import logging
+import time
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app.database import connections_collection, users_collection
+
+logger = logging.getLogger("app.core.connections")
+
+# One edge document per pair of users:
+#   {_id: "<userA>:<userB>", userA, userB, state, requestId, fromId, updatedAt}
+# userA/userB are the two ids as strings in sorted order, so looking up the
+# relationship with any set of users is a single `_id $in` query. state is
+# "pending" (fromId sent requestId and it is unanswered) or "connected".
+# The `friends` arrays on user documents stay authoritative for friend lists.
+PENDING = "pending"
+CONNECTED = "connected"
+CONNECTION_REQUEST_TYPES = ("friend_request", "connection_invite")
+# Written by the backfill once existing friendships and requests are loaded;
+# until then relationship checks keep reading the user documents.
+_BACKFILL_MARKER_ID = "__backfill_complete__"
+_READY_CACHE_TTL_SECONDS = 60.0
+_ready_cache = {"ready": False, "checkedAt": 0.0}
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def edge_id(user_id, other_id):
+    user_a, user_b = sorted((str(user_id), str(other_id)))
+    return f"{user_a}:{user_b}"
+
+
+def _edge_fields(user_id, other_id):
+    user_a, user_b = sorted((str(user_id), str(other_id)))
+    return {"userA": user_a, "userB": user_b}
+
+
+def _request_op(from_id, to_id, request_id):
+    # $setOnInsert only: never downgrades an existing connection
+    return UpdateOne(
+        {"_id": edge_id(from_id, to_id)},
+        {
+            "$setOnInsert": {
+                **_edge_fields(from_id, to_id),
+                "state": PENDING,
+                "fromId": str(from_id),
+                "requestId": request_id,
+                "updatedAt": _now(),
+            }
+        },
+        upsert=True,
+    )
+
+
+def _connect_op(user_id, other_id):
+    return UpdateOne(
+        {"_id": edge_id(user_id, other_id)},
+        {"$set": {**_edge_fields(user_id, other_id), "state": CONNECTED, "updatedAt": _now()}},
+        upsert=True,
+    )
+
+
+def record_request(from_id, to_id, request_id):
+    """Record a pending connection request unless the pair already has an edge."""
+    try:
+        connections_collection.bulk_write([_request_op(from_id, to_id, request_id)])
+    except DuplicateKeyError:
+        pass
+
+
+def record_connection(user_id, other_id):
+    connections_collection.bulk_write([_connect_op(user_id, other_id)])
+
+
+def clear_request(user_id, other_id):
+    """Drop a pending request between the pair (declined or withdrawn)."""
+    connections_collection.delete_one({"_id": edge_id(user_id, other_id), "state": PENDING})
+
+
+def connections_ready() -> bool:
+    now = time.monotonic()
+    if _ready_cache["ready"] or now - _ready_cache["checkedAt"] < _READY_CACHE_TTL_SECONDS:
+        return _ready_cache["ready"]
+    _ready_cache["ready"] = connections_collection.count_documents({"_id": _BACKFILL_MARKER_ID}, limit=1) > 0
+    _ready_cache["checkedAt"] = now
+    return _ready_cache["ready"]
+
+
+def edge_between(user_id, other_id):
+    return connections_collection.find_one({"_id": edge_id(user_id, other_id)})
+
+
+def relationship_from_edge(user_id, edge):
+    """(relationshipStatus, incoming request id) for `user_id`'s side of an edge."""
+    if not edge:
+        return "can_connect", None
+    if edge.get("state") == CONNECTED:
+        return "connected", None
+    if str(edge.get("fromId")) == str(user_id):
+        return "outgoing_request", None
+    return "incoming_request", edge.get("requestId")
+
+
+def relationship_states(user_id, other_ids):
+    """Map each of `other_ids` (as str) to its relationship with `user_id`, in one query."""
+    user_id = str(user_id)
+    others = {str(other_id) for other_id in other_ids if other_id is not None} - {user_id}
+    states = {other_id: ("can_connect", None) for other_id in others}
+    if not others:
+        return states
+    edges = connections_collection.find({"_id": {"$in": [edge_id(user_id, other_id) for other_id in others]}})
+    for edge in edges:
+        other_id = edge["userB"] if edge["userA"] == user_id else edge["userA"]
+        states[other_id] = relationship_from_edge(user_id, edge)
+    return states
+
+
+def backfill_connections(batch_size: int = 500):
+    """Load pending requests and friendships from user documents, then mark the edges complete."""
+    stats = {"requests": 0, "connections": 0}
+    ops = []
+
+    def flush():
+        if ops:
+            connections_collection.bulk_write(ops, ordered=False)
+            ops.clear()
+
+    # Requests first: connections below overwrite the pending state
+    pending = {
+        "$elemMatch": {
+            "type": {"$in": list(CONNECTION_REQUEST_TYPES)},
+            "$or": [{"status": "pending"}, {"actionStatus": "pending"}],
+        }
+    }
+    cursor = users_collection.find({"notifications": pending}, {"id": 1, "notifications": 1}).batch_size(batch_size)
+    for user in cursor:
+        for notification in user.get("notifications") or []:
+            if notification.get("type") not in CONNECTION_REQUEST_TYPES:
+                continue
+            if "pending" not in (notification.get("status"), notification.get("actionStatus")):
+                continue
+            from_id = notification.get("fromId") or notification.get("senderId")
+            if from_id is None or str(from_id) == str(user.get("id")):
+                continue
+            ops.append(_request_op(from_id, user.get("id"), notification.get("id")))
+            stats["requests"] += 1
+            if len(ops) >= batch_size:
+                flush()
+    flush()
+
+    cursor = users_collection.find({"friends.0": {"$exists": True}}, {"id": 1, "friends": 1}).batch_size(batch_size)
+    for user in cursor:
+        for friend_id in user.get("friends") or []:
+            if friend_id is None or str(friend_id) == str(user.get("id")):
+                continue
+            ops.append(_connect_op(user.get("id"), friend_id))
+            stats["connections"] += 1
+            if len(ops) >= batch_size:
+                flush()
+    flush()
+
+    connections_collection.update_one(
+        {"_id": _BACKFILL_MARKER_ID},
+        {"$set": {"completedAt": _now(), **stats}},
+        upsert=True,
+    )
+    _ready_cache["ready"] = True
+    logger.info("Connections backfill complete: %s", stats)
+    return stats
@@ -1,6 +1,7 @@
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 import logging
+import threading
 from pathlib import Path
 
 _DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive"]
@@ -8,6 +9,7 @@ _DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive"]
 # Module-level singleton for Drive service
 _drive_service = None
 _drive_creds = None
+_thread_services = threading.local()
 
 
 def _default_service_account_path() -> Path:
@@ -43,3 +45,18 @@ def build_drive_service():
     except Exception as e:
         logging.getLogger("app.core.drive").exception("Failed to initialize Google Drive client: %s", e)
         raise
+
+
+def thread_drive_service():
+    """Drive client for the calling thread.
+
+    The underlying httplib2 connection is not thread-safe, so worker threads
+    (storage tiering, proxied downloads) each get their own client built from
+    the shared credentials.
+    """
+    service = getattr(_thread_services, "service", None)
+    if service is None:
+        build_drive_service()
+        service = build("drive", "v3", credentials=_drive_creds, cache_discovery=False)
+        _thread_services.service = service
+    return service
@@ -0,0 +1,762 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from gridfs import GridFSBucket
+from gridfs.errors import NoFile
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.core.drive import thread_drive_service
+from app.database import db, file_contents_collection, files_collection
+
+logger = logging.getLogger("app.core.file_storage")
+
+# Reads and writes move at most one chunk at a time, so memory per transfer is
+# bounded by the chunk size rather than the file size.
+FILE_CHUNK_SIZE_BYTES = int(os.getenv("FILE_CHUNK_SIZE_BYTES", str(255 * 1024)))
+
+# Backend used for new uploads ("mongo" or "local"). Existing files keep the
+# backend recorded in their `storage` field; documents without one are Mongo.
+FILE_STORAGE_BACKEND = os.getenv("FILE_STORAGE_BACKEND", "mongo").lower()
+FILE_STORAGE_DIR = os.path.abspath(
+    os.getenv("FILE_STORAGE_DIR")
+    or os.path.join(os.path.dirname(__file__), "..", "..", "uploaded_files")
+)
+
+# Cold tier: Google Drive, with tiered files proxied through a bounded local
+# read-through cache so repeat downloads don't go back to Drive.
+DRIVE_TIER_FOLDER_ID = os.getenv("DRIVE_TIER_FOLDER_ID") or os.getenv("GOOGLE_DRIVE_FOLDER_ID")
+DRIVE_CACHE_DIR = os.path.abspath(
+    os.getenv("DRIVE_CACHE_DIR")
+    or os.path.join(os.path.dirname(__file__), "..", "..", "drive_cache")
+)
+DRIVE_CACHE_MAX_BYTES = int(os.getenv("DRIVE_CACHE_MAX_BYTES", str(5 * 1024 * 1024 * 1024)))
+# Resumable upload/download chunk; Drive requires a multiple of 256 KiB
+DRIVE_TRANSFER_CHUNK_BYTES = max(1, int(os.getenv("DRIVE_TRANSFER_CHUNK_MB", "8"))) * 1024 * 1024
+DRIVE_TIER_AFTER_DAYS = int(os.getenv("DRIVE_TIER_AFTER_DAYS", "30"))
+DRIVE_TIERING_BATCH_SIZE = int(os.getenv("DRIVE_TIERING_BATCH_SIZE", "50"))
+DRIVE_TIERING_CONCURRENCY = int(os.getenv("DRIVE_TIERING_CONCURRENCY", "4"))
+# Last-access timestamps are written at most this often per content
+ACCESS_RECORD_INTERVAL_SECONDS = 3600
+
+
+def _sha256_of_path(path: str):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(FILE_CHUNK_SIZE_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StorageBackend(ABC):
+    """Where the bytes of a files_collection document live.
+
+    `store` takes a finished temp file and returns the fields to `$set` on the
+    file document; every other method takes that document back.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def store(self, path: str, filename: str | None, sha256: str | None = None, file_doc_id=None) -> dict:
+        ...
+
+    @abstractmethod
+    def has_content(self, doc) -> bool:
+        ...
+
+    @abstractmethod
+    def size(self, doc):
+        ...
+
+    @abstractmethod
+    def iter_range(self, doc, start: int, end: int | None, chunk_size: int = FILE_CHUNK_SIZE_BYTES):
+        """Yield bytes `start`..`end` (inclusive; None means to the end)."""
+
+    @abstractmethod
+    def delete(self, doc):
+        ...
+
+    def local_path(self, doc):
+        """Filesystem path the server can send directly, if the backend has one."""
+        return None
+
+
+class MongoStorageBackend(StorageBackend):
+    """GridFS chunks in the `file_blobs` bucket, referenced by `blobId`.
+
+    Also serves legacy documents that still carry their bytes inline in `data`
+    (see migrate_inline_blobs()).
+    """
+
+    name = "mongo"
+
+    def __init__(self, database, bucket_name: str = "file_blobs"):
+        self.blobs = database[f"{bucket_name}.files"]
+        self.bucket = GridFSBucket(database, bucket_name=bucket_name, chunk_size_bytes=FILE_CHUNK_SIZE_BYTES)
+
+    def store(self, path, filename, sha256=None, file_doc_id=None):
+        metadata = {"fileDocId": file_doc_id} if file_doc_id is not None else None
+        with open(path, "rb") as f:
+            blob_id = self.bucket.upload_from_stream(filename or "file", f, metadata=metadata)
+        return {"storage": self.name, "blobId": blob_id}
+
+    def has_content(self, doc):
+        return bool(doc.get("blobId") is not None or doc.get("data"))
+
+    def size(self, doc):
+        blob_id = doc.get("blobId")
+        if blob_id is not None:
+            if doc.get("size") is not None:
+                return int(doc["size"])
+            blob = self.blobs.find_one({"_id": blob_id}, {"length": 1})
+            return int(blob["length"]) if blob else None
+        data = doc.get("data")
+        return len(data) if data else None
+
+    def iter_range(self, doc, start, end, chunk_size=FILE_CHUNK_SIZE_BYTES):
+        blob_id = doc.get("blobId")
+        if blob_id is None:
+            data = doc.get("data")
+            if data:
+                yield bytes(data[start:None if end is None else end + 1])
+            return
+
+        try:
+            stream = self.bucket.open_download_stream(blob_id)
+        except NoFile:
+            logger.error("Blob %s for file %s is missing", blob_id, doc.get("_id"))
+            return
+        remaining = None if end is None else end - start + 1
+        try:
+            if start:
+                stream.seek(start)
+            while remaining is None or remaining > 0:
+                chunk = stream.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            stream.close()
+
+    def delete(self, doc):
+        if doc.get("blobId") is None:
+            return
+        try:
+            self.bucket.delete(doc["blobId"])
+        except NoFile:
+            pass
+
+
+class LocalStorageBackend(StorageBackend):
+    """Content-addressed files under FILE_STORAGE_DIR, e.g. `ab/cd/abcd…`.
+
+    The temp file is moved into place once (a rename on the same filesystem),
+    and downloads hand the path to FileResponse so the bytes are sent by the
+    server rather than read through Python.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def key_for(sha256: str):
+        return os.path.join(sha256[:2], sha256[2:4], sha256)
+
+    def _path(self, key: str):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError("storage key escapes storage root")
+        return path
+
+    def store(self, path, filename, sha256=None, file_doc_id=None):
+        sha256 = sha256 or _sha256_of_path(path)
+        key = self.key_for(sha256)
+        target = self._path(key)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # Stage next to the target, then rename: readers never see a partial file
+            fd, staging = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".incoming-")
+            os.close(fd)
+            try:
+                shutil.move(path, staging)
+                os.replace(staging, target)
+            except Exception:
+                if os.path.exists(staging):
+                    os.remove(staging)
+                raise
+        return {"storage": self.name, "storageKey": key}
+
+    def has_content(self, doc):
+        return self.local_path(doc) is not None
+
+    def size(self, doc):
+        path = self.local_path(doc)
+        return os.path.getsize(path) if path else None
+
+    def iter_range(self, doc, start, end, chunk_size=FILE_CHUNK_SIZE_BYTES):
+        path = self.local_path(doc)
+        if not path:
+            return
+        yield from self.iter_path(path, start, end, chunk_size)
+
+    @staticmethod
+    def iter_path(path, start, end, chunk_size=FILE_CHUNK_SIZE_BYTES):
+        remaining = None if end is None else end - start + 1
+        with open(path, "rb") as f:
+            f.seek(start)
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, doc):
+        path = self.local_path(doc)
+        if path:
+            os.remove(path)
+
+    def local_path(self, doc):
+        key = doc.get("storageKey")
+        if not key:
+            return None
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+
+class _TeeWriter:
+    """File-like target for MediaIoBaseDownload that also keeps the new bytes."""
+
+    def __init__(self, f):
+        self.f = f
+        self.pending = bytearray()
+
+    def write(self, data):
+        self.f.write(data)
+        self.pending.extend(data)
+        return len(data)
+
+    def take(self):
+        data = bytes(self.pending)
+        self.pending.clear()
+        return data
+
+
+class DriveStorageBackend(StorageBackend):
+    """Cold tier in Google Drive, referenced by `driveFileId`.
+
+    Files only get here through tier_cold_files(). Reads are proxied: a full
+    read streams from Drive to the client while filling the local cache, and
+    later reads (including ranges, via local_path) are served from the cache.
+    """
+
+    name = "drive"
+
+    def __init__(self, folder_id: str | None, cache_dir: str, cache_max_bytes: int):
+        self.folder_id = folder_id
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _cache_path(self, drive_file_id: str):
+        return os.path.join(self.cache_dir, "".join(c for c in drive_file_id if c.isalnum() or c in "-_"))
+
+    def store(self, path, filename, sha256=None, file_doc_id=None):
+        if not self.folder_id:
+            raise RuntimeError("DRIVE_TIER_FOLDER_ID / GOOGLE_DRIVE_FOLDER_ID is not set")
+        media = MediaFileUpload(path, mimetype="application/octet-stream", chunksize=DRIVE_TRANSFER_CHUNK_BYTES, resumable=True)
+        request = thread_drive_service().files().create(
+            body={"name": sha256 or filename or "file", "parents": [self.folder_id], "appProperties": {"sha256": sha256 or ""}},
+            media_body=media,
+            fields="id",
+            supportsAllDrives=True,
+        )
+        response = None
+        while response is None:
+            # Each call sends one chunk; an interrupted chunk is retried from
+            # the last acknowledged offset rather than from the start
+            _status, response = request.next_chunk(num_retries=3)
+        return {"storage": self.name, "driveFileId": response["id"]}
+
+    def has_content(self, doc):
+        return bool(doc.get("driveFileId"))
+
+    def size(self, doc):
+        if doc.get("size") is not None:
+            return int(doc["size"])
+        meta = thread_drive_service().files().get(fileId=doc["driveFileId"], fields="size", supportsAllDrives=True).execute()
+        return int(meta.get("size") or 0)
+
+    def iter_range(self, doc, start, end, chunk_size=FILE_CHUNK_SIZE_BYTES):
+        if not self.has_content(doc):
+            return
+        path = self.local_path(doc)
+        if path is None and (start or end is not None):
+            # Ranges need random access: fill the cache first, then serve from it
+            self._fill_cache(doc)
+            path = self.local_path(doc)
+        if path is not None:
+            yield from STORAGE_BACKENDS["local"].iter_path(path, start, end, chunk_size)
+            return
+        yield from self._stream_into_cache(doc)
+
+    def _download(self, doc, writer):
+        request = thread_drive_service().files().get_media(fileId=doc["driveFileId"], supportsAllDrives=True)
+        downloader = MediaIoBaseDownload(writer, request, chunksize=DRIVE_TRANSFER_CHUNK_BYTES)
+        done = False
+        while not done:
+            _status, done = downloader.next_chunk(num_retries=3)
+            yield
+
+    def _stream_into_cache(self, doc):
+        target = self._cache_path(doc["driveFileId"])
+        fd, staging = tempfile.mkstemp(dir=self.cache_dir, prefix=".incoming-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                tee = _TeeWriter(f)
+                for _ in self._download(doc, tee):
+                    data = tee.take()
+                    if data:
+                        yield data
+            os.replace(staging, target)
+        finally:
+            if os.path.exists(staging):
+                os.remove(staging)
+        self._prune_cache()
+
+    def _fill_cache(self, doc):
+        for _ in self._stream_into_cache(doc):
+            pass
+
+    def _prune_cache(self):
+        """Evict least recently used cache entries beyond DRIVE_CACHE_MAX_BYTES."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.startswith(".incoming-"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        for _mtime, size, path in sorted(entries):
+            if total <= self.cache_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def delete(self, doc):
+        if not doc.get("driveFileId"):
+            return
+        try:
+            thread_drive_service().files().delete(fileId=doc["driveFileId"], supportsAllDrives=True).execute()
+        except HttpError as exc:
+            if getattr(exc, "resp", None) is None or exc.resp.status != 404:
+                raise
+        try:
+            os.remove(self._cache_path(doc["driveFileId"]))
+        except OSError:
+            pass
+
+    def local_path(self, doc):
+        if not doc.get("driveFileId"):
+            return None
+        path = self._cache_path(doc["driveFileId"])
+        if not os.path.exists(path):
+            return None
+        # mtime doubles as the LRU clock for _prune_cache
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+
+STORAGE_BACKENDS = {
+    MongoStorageBackend.name: MongoStorageBackend(db),
+    LocalStorageBackend.name: LocalStorageBackend(FILE_STORAGE_DIR),
+    DriveStorageBackend.name: DriveStorageBackend(DRIVE_TIER_FOLDER_ID, DRIVE_CACHE_DIR, DRIVE_CACHE_MAX_BYTES),
+}
+
+if FILE_STORAGE_BACKEND not in STORAGE_BACKENDS:
+    logger.warning("Unknown FILE_STORAGE_BACKEND %r; using mongo", FILE_STORAGE_BACKEND)
+    FILE_STORAGE_BACKEND = MongoStorageBackend.name
+
+
+def active_backend() -> StorageBackend:
+    return STORAGE_BACKENDS[FILE_STORAGE_BACKEND]
+
+
+def backend_for(doc) -> StorageBackend:
+    return STORAGE_BACKENDS.get((doc or {}).get("storage") or MongoStorageBackend.name, STORAGE_BACKENDS["mongo"])
+
+
+def store_from_path(path: str, filename: str | None, sha256: str | None = None, file_doc_id=None):
+    """Store a finished temp file with the active backend; returns fields for the file doc."""
+    return active_backend().store(path, filename, sha256=sha256, file_doc_id=file_doc_id)
+
+
+def has_content(doc) -> bool:
+    return bool(doc) and backend_for(doc).has_content(doc)
+
+
+def content_length(doc):
+    """Size in bytes of the stored content, or None if there is none."""
+    return backend_for(doc).size(doc)
+
+
+def local_path(doc):
+    return backend_for(doc).local_path(doc)
+
+
+def iter_file_chunks(doc, chunk_size: int = FILE_CHUNK_SIZE_BYTES):
+    """Yield the bytes of a files_collection document one chunk at a time."""
+    return backend_for(doc).iter_range(doc, 0, None, chunk_size)
+
+
+def iter_file_range(doc, start: int, end: int, chunk_size: int = FILE_CHUNK_SIZE_BYTES):
+    """Yield bytes `start`..`end` (inclusive) without reading the rest of the file."""
+    return backend_for(doc).iter_range(doc, start, end, chunk_size)
+
+
+def delete_content(doc):
+    backend_for(doc).delete(doc)
+
+
+# Fields that locate stored bytes; copied from a file_contents entry onto every
+# file document that shares it, so downloads never need the extra lookup.
+CONTENT_FIELDS = ("storage", "blobId", "storageKey", "driveFileId", "size")
+
+
+def _content_fields(content):
+    return {key: content[key] for key in CONTENT_FIELDS if content.get(key) is not None}
+
+
+def _same_location(left, right):
+    return backend_for(left) is backend_for(right) and all(left.get(key) == right.get(key) for key in ("blobId", "storageKey", "driveFileId"))
+
+
+def _link_existing(sha256: str):
+    """Take a reference on existing content, unless it is being released."""
+    return file_contents_collection.find_one_and_update(
+        {"_id": sha256, "refCount": {"$gt": 0}},
+        {"$inc": {"refCount": 1}, "$set": {"lastLinkedAt": datetime.now(timezone.utc).isoformat()}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def store_deduplicated(path: str, filename: str | None, sha256: str, size: int, file_doc_id=None):
+    """Store a temp file unless identical content already exists.
+
+    Returns `(fields, deduplicated)` where `fields` are the content location
+    fields to `$set` on the file document. Each file document holds one
+    reference on its content; see release_content().
+    """
+    existing = _link_existing(sha256)
+    if existing:
+        return _content_fields(existing), True
+
+    stored = store_from_path(path, filename, sha256=sha256, file_doc_id=file_doc_id)
+    content = {"_id": sha256, "refCount": 1, "size": size, "createdAt": datetime.now(timezone.utc).isoformat(), **stored}
+    try:
+        file_contents_collection.insert_one(content)
+        return _content_fields(content), False
+    except DuplicateKeyError:
+        pass
+
+    # Someone stored the same bytes concurrently: use theirs and drop ours,
+    # unless both land on the same location (content-addressed backends)
+    existing = _link_existing(sha256)
+    if not existing:
+        raise RuntimeError(f"content {sha256} disappeared while linking")
+    if not _same_location(existing, content):
+        try:
+            backend_for(stored).delete(stored)
+        except Exception as exc:
+            logger.warning("Failed to drop duplicate content for %s: %s", sha256, exc)
+    return _content_fields(existing), True
+
+
+def _location_in_use_elsewhere(doc):
+    key = next((k for k in ("storageKey", "driveFileId") if doc.get(k)), "blobId")
+    if doc.get(key) is None:
+        return False
+    return files_collection.count_documents({"_id": {"$ne": doc.get("_id")}, key: doc[key]}, limit=1) > 0
+
+
+def release_content(doc):
+    """Drop a file document's reference; delete the bytes with the last one.
+
+    Returns True when the bytes were deleted.
+    """
+    sha256 = doc.get("sha256")
+    if not sha256 or not doc.get("contentLinked"):
+        # Unshared (pre-dedupe or not yet backfilled) content holds no
+        # reference, even when a file_contents entry exists for its hash; its
+        # location may still be the shared copy or another unlinked doc's
+        if has_content(doc) and not _location_in_use_elsewhere(doc):
+            delete_content(doc)
+            return True
+        return False
+
+    content = file_contents_collection.find_one_and_update(
+        {"_id": sha256},
+        {"$inc": {"refCount": -1}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if content and content.get("refCount", 0) <= 0:
+        if file_contents_collection.delete_one({"_id": sha256, "refCount": {"$lte": 0}}).deleted_count:
+            delete_content(content)
+            return True
+    return False
+
+
+def backfill_content_refs():
+    """Create file_contents entries for files stored before de-duplication.
+
+    Files with the same hash are pointed at one copy and the redundant copies
+    are deleted. Safe to re-run; files already linked are left alone.
+    """
+    pipeline = [
+        {"$match": {"sha256": {"$type": "string"}, "status": "done", "contentLinked": {"$ne": True}}},
+        {"$group": {"_id": "$sha256", "ids": {"$push": "$_id"}}},
+    ]
+    linked = 0
+    freed = 0
+    for group in files_collection.aggregate(pipeline, allowDiskUse=True):
+        sha256 = group["_id"]
+        docs = list(files_collection.find({"_id": {"$in": group["ids"]}}, {f: 1 for f in CONTENT_FIELDS + ("data", "sha256")}))
+        docs = [d for d in docs if has_content(d) and not d.get("data")]
+        if not docs:
+            continue
+
+        content = file_contents_collection.find_one({"_id": sha256})
+        if not content:
+            canonical = docs[0]
+            content = {"_id": sha256, "refCount": 0, "createdAt": datetime.now(timezone.utc).isoformat(), **_content_fields(canonical)}
+            content.setdefault("size", content_length(canonical))
+            file_contents_collection.insert_one(content)
+
+        target = _content_fields(content)
+        for d in docs:
+            files_collection.update_one({"_id": d["_id"]}, {"$set": {**target, "contentLinked": True}})
+            file_contents_collection.update_one({"_id": sha256}, {"$inc": {"refCount": 1}})
+            linked += 1
+            if not _same_location(d, content):
+                try:
+                    delete_content(d)
+                    freed += 1
+                except Exception as exc:
+                    logger.warning("Failed to delete redundant copy for file %s: %s", d["_id"], exc)
+    return {"linked": linked, "freedCopies": freed}
+
+
+def dedupe_report():
+    """Logical bytes referenced by file documents vs physical bytes stored."""
+    logical = next(iter(files_collection.aggregate([
+        {"$match": {"status": "done"}},
+        {"$group": {"_id": None, "files": {"$sum": 1}, "bytes": {"$sum": {"$ifNull": ["$size", 0]}},
+                    "deduplicated": {"$sum": {"$cond": [{"$eq": ["$deduplicated", True]}, 1, 0]}}}},
+    ])), {"files": 0, "bytes": 0, "deduplicated": 0})
+    physical = next(iter(file_contents_collection.aggregate([
+        {"$group": {"_id": None, "contents": {"$sum": 1}, "bytes": {"$sum": {"$ifNull": ["$size", 0]}},
+                    "references": {"$sum": "$refCount"}}},
+    ])), {"contents": 0, "bytes": 0, "references": 0})
+    unshared = next(iter(files_collection.aggregate([
+        {"$match": {"status": "done", "contentLinked": {"$ne": True}, "deduplicated": {"$ne": True}}},
+        {"$lookup": {"from": file_contents_collection.name, "localField": "sha256", "foreignField": "_id", "as": "c"}},
+        {"$match": {"c": {"$size": 0}}},
+        {"$group": {"_id": None, "bytes": {"$sum": {"$ifNull": ["$size", 0]}}}},
+    ])), {"bytes": 0})
+
+    stored_bytes = physical["bytes"] + unshared["bytes"]
+    saved = max(0, logical["bytes"] - stored_bytes)
+    return {
+        "files": logical["files"],
+        "deduplicatedUploads": logical["deduplicated"],
+        "uniqueContents": physical["contents"],
+        "logicalBytes": logical["bytes"],
+        "storedBytes": stored_bytes,
+        "savedBytes": saved,
+        "savedRatio": round(saved / logical["bytes"], 4) if logical["bytes"] else 0.0,
+    }
+
+
+def _migrate_one(doc_id):
+    doc = files_collection.find_one({"_id": doc_id, "data": {"$exists": True}}, {"data": 1, "filename": 1, "blobId": 1})
+    if not doc:
+        return False
+
+    mongo = STORAGE_BACKENDS["mongo"]
+    blob_id = doc.get("blobId")
+    data = bytes(doc.get("data") or b"")
+    if blob_id is None:
+        # Re-use a blob left behind by an interrupted earlier run
+        existing = mongo.blobs.find_one({"metadata.fileDocId": doc_id}, {"_id": 1})
+        if existing:
+            blob_id = existing["_id"]
+        else:
+            blob_id = mongo.bucket.upload_from_stream(
+                doc.get("filename") or "file",
+                io.BytesIO(data),
+                metadata={"fileDocId": doc_id},
+            )
+
+    files_collection.update_one(
+        {"_id": doc_id},
+        {
+            "$set": {"storage": mongo.name, "blobId": blob_id, "sha256": hashlib.sha256(data).hexdigest(), "size": len(data)},
+            "$unset": {"data": ""},
+        },
+    )
+    return True
+
+
+def migrate_inline_blobs(limit: int | None = None):
+    """Move legacy inline `data` blobs into chunked storage.
+
+    Documents are loaded one at a time so only a single legacy blob is held in
+    memory. Safe to re-run: migrated documents no longer have `data`, and a
+    blob uploaded before an interruption is found again by its fileDocId.
+    """
+    cursor = files_collection.find({"data": {"$exists": True}}, {"_id": 1})
+    if limit:
+        cursor = cursor.limit(int(limit))
+
+    migrated = 0
+    failed = 0
+    for doc in cursor:
+        try:
+            if _migrate_one(doc["_id"]):
+                migrated += 1
+        except Exception as exc:
+            failed += 1
+            logger.error("Failed to migrate inline blob for file %s: %s", doc["_id"], exc)
+    return {"migrated": migrated, "failed": failed}
+
+
+_recent_access = {}
+
+
+def record_access(doc):
+    """Note that a file's content was read, so tiering keeps hot files in primary storage."""
+    sha256 = doc.get("sha256")
+    if not sha256:
+        return
+    now = time.monotonic()
+    last = _recent_access.get(sha256)
+    if last is not None and now - last < ACCESS_RECORD_INTERVAL_SECONDS:
+        return
+    if len(_recent_access) > 50_000:
+        _recent_access.clear()
+    _recent_access[sha256] = now
+    file_contents_collection.update_one({"_id": sha256}, {"$set": {"lastAccessedAt": datetime.now(timezone.utc).isoformat()}})
+
+
+def _location_filter(content):
+    return {key: content[key] for key in ("blobId", "storageKey") if content.get(key) is not None}
+
+
+def _tier_one(sha256: str):
+    content = file_contents_collection.find_one({"_id": sha256})
+    if not content or content.get("storage") == DriveStorageBackend.name or content.get("refCount", 0) <= 0:
+        return "skipped", 0
+    source = backend_for(content)
+    old_location = _location_filter(content)
+    if not old_location or not source.has_content(content):
+        return "skipped", 0
+
+    path = source.local_path(content)
+    spooled = None
+    if not path:
+        fd, spooled = tempfile.mkstemp(prefix="tier-")
+        with os.fdopen(fd, "wb") as f:
+            for chunk in source.iter_range(content, 0, None):
+                f.write(chunk)
+        path = spooled
+    try:
+        stored = STORAGE_BACKENDS[DriveStorageBackend.name].store(path, None, sha256=sha256)
+    finally:
+        if spooled:
+            os.remove(spooled)
+
+    moved = {"$set": {**stored, "tieredAt": datetime.now(timezone.utc).isoformat()}, "$unset": {"blobId": "", "storageKey": ""}}
+    swapped = file_contents_collection.update_one({"_id": sha256, "refCount": {"$gt": 0}, **old_location}, moved)
+    if not swapped.modified_count:
+        # Released or moved while we uploaded; drop our copy
+        STORAGE_BACKENDS[DriveStorageBackend.name].delete(stored)
+        return "skipped", 0
+
+    # Each $or branch is an index lookup (sha256, and the sparse blobId /
+    # storageKey indexes), so repointing never scans the files collection
+    docs_filter = {"$or": [{"sha256": sha256, "contentLinked": True}, old_location]}
+    files_collection.update_many(docs_filter, {"$set": stored, "$unset": {"blobId": "", "storageKey": ""}})
+    source.delete(content)
+    # An upload that linked this content just before the swap may have
+    # written the old location after the pass above; point it at Drive too
+    files_collection.update_many({"sha256": sha256, **old_location}, {"$set": stored, "$unset": {"blobId": "", "storageKey": ""}})
+    return "tiered", int(content.get("size") or 0)
+
+
+def tier_cold_files(days: int | None = None, limit: int | None = None):
+    """Move content nobody has read for `days` days from primary storage to Drive.
+
+    Works on shared contents (file_contents), so every de-duplicated file
+    document moves with its content. Contents are processed in batches of
+    DRIVE_TIERING_BATCH_SIZE with at most DRIVE_TIERING_CONCURRENCY uploads
+    in flight; files that were never linked (see backfill_content_refs) stay
+    where they are.
+    """
+    days = DRIVE_TIER_AFTER_DAYS if days is None else days
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    cursor = file_contents_collection.find(
+        {
+            "storage": {"$ne": DriveStorageBackend.name},
+            "refCount": {"$gt": 0},
+            "$or": [
+                {"lastAccessedAt": {"$lt": cutoff}},
+                {"lastAccessedAt": {"$exists": False}, "createdAt": {"$lt": cutoff}},
+            ],
+        },
+        {"_id": 1},
+    )
+    if limit:
+        cursor = cursor.limit(int(limit))
+    candidates = [doc["_id"] for doc in cursor]
+
+    stats = {"candidates": len(candidates), "tiered": 0, "tieredBytes": 0, "skipped": 0, "failed": 0}
+
+    def _run(sha256):
+        try:
+            return _tier_one(sha256)
+        except Exception as exc:
+            logger.error("Failed to tier content %s: %s", sha256, exc)
+            return "failed", 0
+
+    batch_size = max(1, DRIVE_TIERING_BATCH_SIZE)
+    with ThreadPoolExecutor(max_workers=max(1, DRIVE_TIERING_CONCURRENCY)) as pool:
+        for i in range(0, len(candidates), batch_size):
+            for outcome, size in pool.map(_run, candidates[i:i + batch_size]):
+                stats[outcome] += 1
+                if outcome == "tiered":
+                    stats["tieredBytes"] += size
+            logger.info("Tiering progress: %s", stats)
+    return stats
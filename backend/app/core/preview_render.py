@@ -0,0 +1,42 @@
+"""Image/PDF rendering for previews.
+
+Kept free of app imports (database, settings) because it is what the preview
+worker processes load.
+"""
+import io
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # previews are disabled without Pillow
+    Image = ImageOps = None
+
+try:
+    import fitz  # PyMuPDF, for first-page PDF rasters
+except ImportError:
+    fitz = None
+
+
+def render_variants(source_path: str, kind: str, sizes):
+    """Runs in a worker process: returns {size: (webp_bytes, width, height)}."""
+    if kind == "pdf":
+        with fitz.open(source_path) as pdf:
+            page = pdf.load_page(0)
+            # Render at a resolution good enough for the largest size asked for
+            zoom = max(sizes) / max(page.rect.width, page.rect.height, 1)
+            pix = page.get_pixmap(matrix=fitz.Matrix(max(zoom, 0.1), max(zoom, 0.1)), alpha=False)
+            base = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    else:
+        base = Image.open(source_path)
+        base.draft("RGB", (max(sizes), max(sizes)))  # cheap JPEG downscale on decode
+        base = ImageOps.exif_transpose(base)
+        if base.mode not in ("RGB", "RGBA"):
+            base = base.convert("RGBA" if "A" in base.getbands() else "RGB")
+
+    variants = {}
+    for size in sorted(sizes, reverse=True):
+        img = base.copy()
+        img.thumbnail((size, size))
+        out = io.BytesIO()
+        img.save(out, format="WEBP", quality=80, method=4)
+        variants[size] = (out.getvalue(), img.width, img.height)
+    return variants
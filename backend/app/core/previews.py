@@ -0,0 +1,163 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+
+from bson.binary import Binary
+
+from app.core.file_storage import iter_file_chunks, local_path
+from app.core.preview_render import Image, fitz, render_variants
+from app.database import file_previews_collection
+
+logger = logging.getLogger("app.core.previews")
+
+# Longest-edge sizes we render; requests are rounded up to the nearest one so
+# every client shares the same few cached variants.
+THUMBNAIL_SIZES = (128, 256, 512, 1024)
+DEFAULT_THUMBNAIL_SIZE = 256
+# Variants rendered eagerly after upload; larger ones are rendered on request.
+EAGER_THUMBNAIL_SIZES = (256, 512)
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", "2"))
+PREVIEW_TIMEOUT_SECONDS = float(os.getenv("PREVIEW_TIMEOUT_SECONDS", "30"))
+# Don't try to decode anything bigger than this (decompression bombs, huge scans)
+PREVIEW_MAX_SOURCE_BYTES = int(os.getenv("PREVIEW_MAX_SOURCE_BYTES", str(50 * 1024 * 1024)))
+PREVIEW_MIME_TYPE = "image/webp"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _worker_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Never fork: this process holds a MongoClient and many threads,
+            # and the pool is created lazily from a request thread
+            _pool = ProcessPoolExecutor(max_workers=max(1, PREVIEW_WORKERS), mp_context=_worker_context())
+        return _pool
+
+
+def shutdown_previews():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def thumbnail_size(requested) -> int:
+    try:
+        requested = int(requested)
+    except (TypeError, ValueError):
+        return DEFAULT_THUMBNAIL_SIZE
+    for size in THUMBNAIL_SIZES:
+        if requested <= size:
+            return size
+    return THUMBNAIL_SIZES[-1]
+
+
+def _source_kind(mimetype, filename=None):
+    mimetype = (mimetype or "").lower()
+    name = (filename or "").lower()
+    if mimetype.startswith("image/") and mimetype != "image/svg+xml":
+        return "image" if Image is not None else None
+    if mimetype == "application/pdf" or name.endswith(".pdf"):
+        return "pdf" if Image is not None and fitz is not None else None
+    return None
+
+
+def is_previewable(doc) -> bool:
+    if not doc or (doc.get("size") or 0) > PREVIEW_MAX_SOURCE_BYTES:
+        return False
+    return _source_kind(doc.get("mimetype"), doc.get("filename")) is not None
+
+
+def _preview_key(doc, size: int):
+    # Keyed by content hash so de-duplicated files share their previews
+    return f"{doc.get('sha256') or doc.get('_id')}:{size}"
+
+
+def _materialize_source(doc):
+    """Return (path, is_temp) for a file's bytes, spooling non-local storage to disk."""
+    path = local_path(doc)
+    if path:
+        return path, False
+    fd, tmp = tempfile.mkstemp(prefix="preview-src-")
+    with os.fdopen(fd, "wb") as f:
+        for chunk in iter_file_chunks(doc):
+            f.write(chunk)
+    return tmp, True
+
+
+def _store_variants(doc, variants):
+    now = datetime.now(timezone.utc).isoformat()
+    for size, (data, width, height) in variants.items():
+        file_previews_collection.update_one(
+            {"_id": _preview_key(doc, size)},
+            {"$set": {"data": Binary(data), "mimetype": PREVIEW_MIME_TYPE, "width": width, "height": height, "size": len(data), "createdAt": now}},
+            upsert=True,
+        )
+
+
+def _submit(doc, sizes):
+    kind = _source_kind(doc.get("mimetype"), doc.get("filename"))
+    source, is_temp = _materialize_source(doc)
+    try:
+        future = _executor().submit(render_variants, source, kind, tuple(sizes))
+    except Exception:
+        if is_temp:
+            _remove_quietly(source)
+        raise
+    if is_temp:
+        future.add_done_callback(lambda _f: _remove_quietly(source))
+    return future
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def queue_previews(doc, sizes=EAGER_THUMBNAIL_SIZES):
+    """Render preview variants in the background after an upload completes."""
+    if not is_previewable(doc):
+        return None
+
+    def _done(future):
+        try:
+            _store_variants(doc, future.result())
+        except Exception as exc:
+            logger.warning("Preview generation failed for file %s: %s", doc.get("_id"), exc)
+
+    future = _submit(doc, sizes)
+    future.add_done_callback(_done)
+    return future
+
+
+def get_or_render_preview(doc, size: int):
+    """Cached variant for a file, rendering it now (lazily, e.g. for legacy files) if missing."""
+    cached = file_previews_collection.find_one({"_id": _preview_key(doc, size)})
+    if cached:
+        return cached
+    if not is_previewable(doc):
+        return None
+
+    variants = _submit(doc, (size,)).result(timeout=PREVIEW_TIMEOUT_SECONDS)
+    _store_variants(doc, variants)
+    data, width, height = variants[size]
+    return {"_id": _preview_key(doc, size), "data": data, "mimetype": PREVIEW_MIME_TYPE, "width": width, "height": height}
+
+
+def delete_previews(doc):
+    key = doc.get("sha256") or doc.get("_id")
+    file_previews_collection.delete_many({"_id": {"$in": [f"{key}:{size}" for size in THUMBNAIL_SIZES]}})
@@ -0,0 +1,49 @@
+import base64
+import hashlib
+import hmac
+import os
+import time
+
+from app.core.config import SECRET_KEY
+
+# Separate key so rotating it only invalidates file links, not sessions;
+# falls back to a key derived from the JWT secret.
+FILE_URL_SIGNING_KEY = (
+    os.getenv("FILE_URL_SIGNING_KEY")
+    or hmac.new(SECRET_KEY.encode(), b"signed-file-urls", hashlib.sha256).hexdigest()
+).encode()
+# Links stay valid for between one and two windows. Expiry is rounded to the
+# window so every request in the same window mints the identical URL, which
+# is what lets browsers and proxies cache it.
+SIGNED_URL_TTL_SECONDS = max(60, int(os.getenv("SIGNED_URL_TTL_SECONDS", "3600")))
+
+
+def _signature(file_id: str, expires: int) -> str:
+    mac = hmac.new(FILE_URL_SIGNING_KEY, f"{file_id}:{expires}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(mac).rstrip(b"=").decode()
+
+
+def signed_expiry(now: float | None = None) -> int:
+    now = int(now if now is not None else time.time())
+    return (now // SIGNED_URL_TTL_SECONDS + 2) * SIGNED_URL_TTL_SECONDS
+
+
+def sign_file_url(path: str, file_id: str, expires: int | None = None) -> str:
+    """Append exp/sig query params granting access to `file_id` until `expires`."""
+    expires = expires or signed_expiry()
+    separator = "&" if "?" in path else "?"
+    return f"{path}{separator}exp={expires}&sig={_signature(str(file_id), expires)}"
+
+
+def verify_file_signature(file_id: str, expires, signature) -> bool:
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if not signature or expires < time.time():
+        return False
+    return hmac.compare_digest(_signature(str(file_id), expires), str(signature))
+
+
+def seconds_until(expires) -> int:
+    return max(0, int(expires) - int(time.time()))
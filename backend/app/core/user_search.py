@@ -0,0 +1,95 @@
+import logging
+import re
+
+from pymongo import UpdateOne
+
+from app.database import users_collection
+
+logger = logging.getLogger("app.core.user_search")
+
+# Edge n-grams (word prefixes) of a user's name, email, company and position
+# are stored on the user document as `search_tokens` behind a multikey index,
+# so typeahead is one indexed equality lookup instead of regex scans.
+SEARCH_TOKEN_MAX_LENGTH = 20
+_WORD_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def _words(text):
+    return [word for word in _WORD_RE.split(str(text or "").lower()) if word]
+
+
+def _edge_ngrams(words):
+    tokens = set()
+    for word in words:
+        for length in range(1, min(len(word), SEARCH_TOKEN_MAX_LENGTH) + 1):
+            tokens.add(word[:length])
+    return tokens
+
+
+def _profile_value(source, key):
+    profile = source.get("professionalProfile") if isinstance(source.get("professionalProfile"), dict) else {}
+    return source.get(key) or profile.get(key)
+
+
+def build_search_tokens(source):
+    if not isinstance(source, dict):
+        return []
+    email = str(source.get("email") or "").lower()
+    local_part, _, domain = email.partition("@")
+    words = _words(source.get("name"))
+    words += _words(local_part)
+    if local_part:
+        words.append(local_part)
+    words += _words(domain.split(".")[0] if domain else "")
+    words += _words(_profile_value(source, "companyName"))
+    words += _words(_profile_value(source, "position"))
+    return sorted(_edge_ngrams(words))
+
+
+def search_terms(query: str):
+    """Index lookup terms for a typed query: its words, cut to the token length."""
+    terms = []
+    for word in _words(query):
+        term = word[:SEARCH_TOKEN_MAX_LENGTH]
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+def token_filter(terms):
+    if len(terms) == 1:
+        return {"search_tokens": terms[0]}
+    return {"search_tokens": {"$all": terms}}
+
+
+def relevance(candidate, query: str, terms):
+    """Lower is better: exact name, name prefix, name words, email, then profile fields."""
+    name = re.sub(r"\s+", " ", str(candidate.get("name") or "").strip().lower())
+    normalized_query = re.sub(r"\s+", " ", query.strip().lower())
+    if name == normalized_query:
+        return 0
+    if name.startswith(normalized_query):
+        return 1
+    name_words = _words(name)
+    if all(any(word.startswith(term) for word in name_words) for term in terms):
+        return 2
+    email_words = _words(candidate.get("email"))
+    if all(any(word.startswith(term) for word in name_words + email_words) for term in terms):
+        return 3
+    return 4
+
+
+def backfill_search_tokens(batch_size: int = 500):
+    """Compute `search_tokens` for every user. Safe to re-run."""
+    projection = {"_id": 1, "name": 1, "email": 1, "professionalProfile": 1, "companyName": 1, "position": 1}
+    ops = []
+    updated = 0
+    for user in users_collection.find({}, projection).batch_size(batch_size):
+        ops.append(UpdateOne({"_id": user["_id"]}, {"$set": {"search_tokens": build_search_tokens(user)}}))
+        if len(ops) >= batch_size:
+            updated += users_collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += users_collection.bulk_write(ops, ordered=False).modified_count
+    logger.info("Search token backfill updated %d users", updated)
+    return {"updated": updated}
@@ -0,0 +1,100 @@
+import os
+import zipfile
+from datetime import datetime
+
+# Already-compressed formats are stored as-is; deflating them again only burns CPU
+_STORED_MIME_PREFIXES = ("image/", "video/", "audio/")
+_STORED_MIME_TYPES = {
+    "application/zip",
+    "application/gzip",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+
+
+class _StreamSink:
+    """Write-only file object that hands written bytes back to the generator.
+
+    It has no tell()/seek(), so zipfile writes local headers with data
+    descriptors and never goes back to patch sizes into the output.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer.extend(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _compression_for(mimetype):
+    mimetype = (mimetype or "").lower()
+    if mimetype.startswith(_STORED_MIME_PREFIXES) or mimetype in _STORED_MIME_TYPES:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _timestamp(value):
+    try:
+        parsed = datetime.fromisoformat(str(value))
+        if parsed.year >= 1980:
+            return parsed.timetuple()[:6]
+    except (TypeError, ValueError):
+        pass
+    return datetime.now().timetuple()[:6]
+
+
+def unique_archive_names(filenames):
+    """Safe, non-colliding entry names: 'a.txt', 'a (2).txt', ..."""
+    seen = set()
+    names = []
+    for filename in filenames:
+        base = os.path.basename(str(filename or "").replace("\\", "/")).strip() or "file"
+        stem, ext = os.path.splitext(base)
+        candidate, n = base, 1
+        while candidate.lower() in seen:
+            n += 1
+            candidate = f"{stem} ({n}){ext}"
+        seen.add(candidate.lower())
+        names.append(candidate)
+    return names
+
+
+def stream_zip(entries):
+    """Yield a ZIP archive built on the fly.
+
+    `entries` is an iterable of (name, size, mimetype, created_at, chunks)
+    where `chunks` is a callable returning an iterator over the file bytes.
+    Only the chunk currently being copied is held in memory.
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, mode="w", allowZip64=True) as archive:
+        for name, size, mimetype, created_at, chunks in entries:
+            info = zipfile.ZipInfo(name, date_time=_timestamp(created_at))
+            info.compress_type = _compression_for(mimetype)
+            # Known up front so zipfile picks zip64 headers for large entries
+            info.file_size = int(size or 0)
+            with archive.open(info, mode="w", force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as entry:
+                for chunk in chunks():
+                    entry.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    data = sink.drain()
+    if data:
+        yield data
@@ -34,6 +34,17 @@ tasks_collection = db["tasks"]
 contexts_collection = db["contexts"]
 events_collection = db["events"]
 files_collection = db["files"]
+# sha256 -> stored content shared by every files_collection doc with that hash
+file_contents_collection = db["file_contents"]
+# "<sha256|fileId>:<size>" -> small rendered WebP preview variant
+file_previews_collection = db["file_previews"]
+upload_sessions_collection = db["upload_sessions"]
+# fileId -> chats whose messages attach it, for cheap download access checks
+attachment_refs_collection = db["attachment_refs"]
+# "<userA>:<userB>" -> friendship / pending connection request between the pair
+connections_collection = db["connections"]
+# userId -> materialized people-you-may-know candidates
+recommendations_collection = db["recommendations"]
 drafts_collection = db["drafts"]
 organizations_collection = db["organizations"]
 gmail_docs_collection = db["gmail_docs"]
@@ -183,10 +194,15 @@ def cleanup_gmail_doc_duplicates():
 try:
     users_collection.create_index("name")
     users_collection.create_index("name_search")
+    users_collection.create_index("search_tokens")
+    # Search candidates are read in name order within a token
+    users_collection.create_index([("search_tokens", 1), ("name_search", 1)])
     users_collection.create_index([("name", 1), ("id", 1)])
     users_collection.create_index("email")
     users_collection.create_index("email_normalized")
     users_collection.create_index("email_domain")
+    users_collection.create_index([("organizationId", 1), ("_id", 1)])
+    users_collection.create_index([("email_domain", 1), ("_id", 1)])
     users_collection.create_index("id", unique=True)
     users_collection.create_index("friends")
     users_collection.create_index([("notifications.type", 1), ("notifications.status", 1), ("notifications.fromId", 1)])
@@ -217,6 +233,20 @@ try:
     tasks_collection.create_index([("created_by", 1), ("timestamp", -1)])
     tasks_collection.create_index([("assigned_to", 1), ("timestamp", -1)])
 
+    files_collection.create_index("sha256")
+    # Storage locations: "is this blob still used by another file" checks on
+    # delete and repointing files when content moves tiers
+    files_collection.create_index("blobId", sparse=True)
+    files_collection.create_index("storageKey", sparse=True)
+    files_collection.create_index("driveFileId", sparse=True)
+    upload_sessions_collection.create_index([("userId", 1), ("createdAt", -1)])
+    upload_sessions_collection.create_index([("status", 1), ("expiresAt", 1)])
+    attachment_refs_collection.create_index("fileIds")
+    connections_collection.create_index([("userA", 1), ("state", 1)])
+    connections_collection.create_index([("userB", 1), ("state", 1)])
+    recommendations_collection.create_index("userId", unique=True)
+    recommendations_collection.create_index("computedAt")
+
     drafts_collection.create_index([("userId", 1), ("updatedAt", -1)])
     drafts_collection.create_index([("userId", 1), ("id", 1)], unique=True)
 
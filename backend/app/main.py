@@ -22,6 +22,7 @@ from app.routes.ws import router as ws_router
 from app.routes.events import router as events_router
 from app.routes.debug import router as debug_router
 from app.routes.upload import router as upload_router
+from app.routes.resumable_upload import router as resumable_upload_router
 from app.routes.orgs import router as orgs_router
 from app.routes.admin import router as admin_router
 from app.routes.tasks import router as tasks_router
@@ -31,6 +32,15 @@ from app.routes.gmail_docs import router as gmail_docs_router
 from app.routes.timesavers import router as timesavers_router
 from app.routes.notifications import router as notifications_router
 from app.core import drive as drive_core
+from app.presence_writer import presence_writer
+from app.upload_workers import upload_workers
+from app.routes.resumable_upload import session_sweeper
+from app.bootstrap_cache import bootstrap_cache
+from app.recommendations import recommendations
+from app.profile_fanout import profile_fanout
+from app.core.previews import shutdown_previews
+from app.password_hasher import password_hasher
+from app.ws_manager import manager
 from googleapiclient.errors import HttpError
 
 app = FastAPI()
@@ -62,6 +72,7 @@ app.include_router(ws_router)
 app.include_router(events_router)
 app.include_router(debug_router)
 app.include_router(upload_router)
+app.include_router(resumable_upload_router)
 app.include_router(orgs_router)
 app.include_router(tasks_router)
 app.include_router(admin_router)
@@ -105,6 +116,49 @@ def startup_checks():
         # Log error but allow app to start — uploads will fail with clear errors
         logger.error("Google Drive client failed to initialize at startup: %s", e)
 
+@app.on_event("startup")
+async def start_background_writers():
+    presence_writer.start()
+    upload_workers.start()
+    # After the workers: its first sweep re-queues interrupted finalizations
+    session_sweeper.start()
+    bootstrap_cache.start()
+    recommendations.start()
+    profile_fanout.start()
+
+
+@app.on_event("shutdown")
+async def flush_background_writers():
+    # Drain whatever sockets are still open so clients reconnect spread out
+    # rather than all at once. Servers that close sockets before lifespan
+    # shutdown should call POST /api/admin/ws/drain as a pre-stop hook instead.
+    try:
+        # Queued profile updates go out while their recipients are still connected
+        await profile_fanout.stop()
+    except Exception as e:
+        logger.error("Profile fan-out failed to stop cleanly: %s", e)
+    try:
+        await manager.drain()
+        # No time to wait out the reconnect window; clients that do reconnect
+        # elsewhere mark themselves online again
+        await manager.settle_drained_presence()
+    except Exception as e:
+        logger.error("WebSocket drain failed: %s", e)
+    try:
+        await presence_writer.stop()
+    except Exception as e:
+        logger.error("Final presence flush failed: %s", e)
+    await bootstrap_cache.stop()
+    await recommendations.stop()
+    await session_sweeper.stop()
+    try:
+        await upload_workers.stop()
+    except Exception as e:
+        logger.error("Upload workers failed to stop cleanly: %s", e)
+    shutdown_previews()
+    password_hasher.stop()
+
+
 @app.get("/")
 def read_root():
     return {"message": "Spaces API is running"}
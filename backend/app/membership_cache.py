@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app.database import spaces_collection, users_collection
+
+MEMBERSHIP_CACHE_MAX_ENTRIES = int(os.getenv("MEMBERSHIP_CACHE_MAX_ENTRIES", "50000"))
+# Safety net for membership writes that don't invalidate explicitly
+MEMBERSHIP_CACHE_TTL_SECONDS = float(os.getenv("MEMBERSHIP_CACHE_TTL_SECONDS", "600"))
+
+_SPACE_MEMBERSHIP_PROJECTION = {"_id": 0, "id": 1, "ownerId": 1, "createdBy": 1, "members": 1, "channels.members": 1}
+
+
+def _id_values(user_ids):
+    values = []
+    for user_id in user_ids:
+        values.append(user_id)
+        try:
+            values.append(int(user_id))
+        except (TypeError, ValueError):
+            pass
+    return values
+
+
+def space_member_ids(space):
+    member_ids = {space.get("ownerId"), space.get("createdBy"), *(space.get("members") or [])}
+    for channel in space.get("channels") or []:
+        if isinstance(channel, dict):
+            member_ids.update(channel.get("members") or [])
+    return {str(member_id) for member_id in member_ids if member_id is not None}
+
+
+def members_of_spaces(space_ids):
+    """Ids (as str) of everyone recorded on the given spaces' documents."""
+    members = set()
+    if not space_ids:
+        return members
+    for space in spaces_collection.find({"id": {"$in": _id_values(space_ids)}}, _SPACE_MEMBERSHIP_PROJECTION):
+        members |= space_member_ids(space)
+    return members
+
+
+class MembershipCache:
+    """Bounded LRU of user id -> ids of the spaces that user belongs to.
+
+    A user belongs to a space when they own or created it, are in its
+    members or any channel's members, or list it in their own `spaces`;
+    two users share a workspace when their sets intersect. Membership writes
+    call `invalidate_space(space_id, *user_ids)`, which drops every cached
+    user whose set contains the space plus the users passed in (e.g. a new
+    member).
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # space id -> cached users whose set contains it
+        self._space_dependents = {}
+        # Bumped by every invalidation; loads that overlap one are not cached
+        self._epoch = 0
+        self.hits_total = 0
+        self.misses_total = 0
+        self.invalidations_total = 0
+
+    def space_ids_for_many(self, user_ids):
+        """Map each user id (as str) to a frozenset of space ids, loading misses in one pass."""
+        user_ids = {str(user_id) for user_id in user_ids if user_id is not None}
+        result = {}
+        now = time.monotonic()
+        with self._lock:
+            for user_id in user_ids:
+                entry = self._entries.get(user_id)
+                if entry is not None and now - entry[1] <= self.ttl:
+                    self._entries.move_to_end(user_id)
+                    result[user_id] = entry[0]
+            epoch = self._epoch
+        self.hits_total += len(result)
+        missing = user_ids - result.keys()
+        if not missing:
+            return result
+
+        self.misses_total += len(missing)
+        loaded = {user_id: set() for user_id in missing}
+        query_ids = _id_values(missing)
+        membership_query = {
+            "$or": [
+                {"ownerId": {"$in": query_ids}},
+                {"createdBy": {"$in": query_ids}},
+                {"members": {"$in": query_ids}},
+                {"channels.members": {"$in": query_ids}},
+            ]
+        }
+        for space in spaces_collection.find(membership_query, _SPACE_MEMBERSHIP_PROJECTION):
+            if space.get("id") is None:
+                continue
+            for user_id in space_member_ids(space) & missing:
+                loaded[user_id].add(str(space["id"]))
+        for user in users_collection.find({"id": {"$in": query_ids}}, {"_id": 0, "id": 1, "spaces": 1}):
+            user_id = str(user.get("id"))
+            if user_id in loaded:
+                loaded[user_id].update(str(space_id) for space_id in user.get("spaces") or [] if space_id is not None)
+
+        with self._lock:
+            cacheable = self._epoch == epoch
+            for user_id, space_ids in loaded.items():
+                space_ids = frozenset(space_ids)
+                result[user_id] = space_ids
+                if cacheable:
+                    self._store(user_id, space_ids, now)
+        return result
+
+    def space_ids_for(self, user_id):
+        return self.space_ids_for_many([user_id]).get(str(user_id), frozenset())
+
+    def shares_space(self, user_id, other_id):
+        if user_id is None or other_id is None:
+            return False
+        space_ids = self.space_ids_for_many([user_id, other_id])
+        return bool(space_ids.get(str(user_id), frozenset()) & space_ids.get(str(other_id), frozenset()))
+
+    def sharing_with(self, user_id, candidate_ids):
+        """The subset of `candidate_ids` (as str) that share a space with `user_id`."""
+        candidate_ids = {str(candidate_id) for candidate_id in candidate_ids if candidate_id is not None}
+        if user_id is None or not candidate_ids:
+            return set()
+        space_ids = self.space_ids_for_many(candidate_ids | {str(user_id)})
+        own = space_ids.get(str(user_id), frozenset())
+        if not own:
+            return set()
+        return {candidate_id for candidate_id in candidate_ids if own & space_ids.get(candidate_id, frozenset())}
+
+    def _store(self, user_id, space_ids, now):
+        old = self._entries.pop(user_id, None)
+        if old is not None:
+            self._forget(user_id, old[0])
+        while len(self._entries) >= self.max_entries:
+            evicted_id, evicted = self._entries.popitem(last=False)
+            self._forget(evicted_id, evicted[0])
+        self._entries[user_id] = (space_ids, now)
+        for space_id in space_ids:
+            self._space_dependents.setdefault(space_id, set()).add(user_id)
+
+    def _forget(self, user_id, space_ids):
+        for space_id in space_ids:
+            dependents = self._space_dependents.get(space_id)
+            if dependents is not None:
+                dependents.discard(user_id)
+                if not dependents:
+                    del self._space_dependents[space_id]
+
+    def _drop(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._forget(user_id, entry[0])
+
+    def invalidate_space(self, space_id, *user_ids):
+        with self._lock:
+            self._epoch += 1
+            self.invalidations_total += 1
+            affected = set(self._space_dependents.get(str(space_id), set())) if space_id is not None else set()
+            affected |= {str(user_id) for user_id in user_ids if user_id is not None}
+            for user_id in affected:
+                self._drop(user_id)
+
+    def invalidate_user(self, *user_ids):
+        self.invalidate_space(None, *user_ids)
+
+    def snapshot(self):
+        return {
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "hits": self.hits_total,
+            "misses": self.misses_total,
+            "invalidations": self.invalidations_total,
+        }
+
+
+membership_cache = MembershipCache(max_entries=MEMBERSHIP_CACHE_MAX_ENTRIES, ttl=MEMBERSHIP_CACHE_TTL_SECONDS)
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.auth import hash_password, verify_and_rehash
+
+logger = logging.getLogger("app.password_hasher")
+
+
+class PasswordHashingBusy(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("password hashing queue full")
+        self.retry_after = retry_after
+
+
+def _timed(fn, *args):
+    # Runs in a worker process; the start time gives the caller its queue wait
+    return time.time(), fn(*args)
+
+
+class PasswordHasher:
+    """Runs password hashing and verification in a small dedicated process pool.
+
+    Hashing is deliberately slow and CPU-bound, so it stays out of the shared
+    threadpool (and away from the GIL) that the sync routes run on. At most
+    `queue_limit` operations may be waiting or running; beyond that `hash()`
+    and `verify()` raise PasswordHashingBusy so the route can answer 429
+    straight away instead of queueing behind a login burst.
+    """
+
+    def __init__(self, workers: int, queue_limit: int, retry_after: int):
+        self.workers = max(1, workers)
+        self.queue_limit = max(self.workers, queue_limit)
+        self.retry_after = max(1, retry_after)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed_total = 0
+        self.rejected_total = 0
+        self.failed_total = 0
+        self.rehashed_total = 0
+        self.queue_wait_seconds_total = 0.0
+        self.queue_wait_seconds_max = 0.0
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # Never fork this process (MongoClient, threads); see app.core.previews
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._pool
+
+    def _discard(self, pool):
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _submit(self, fn, *args):
+        # A worker that died breaks the whole pool; retry once on a fresh one
+        for attempt in range(2):
+            pool = self._executor()
+            try:
+                return await asyncio.wrap_future(pool.submit(_timed, fn, *args))
+            except BrokenProcessPool:
+                logger.warning("Password hashing pool broke; restarting it")
+                self._discard(pool)
+                if attempt:
+                    raise
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.queue_limit:
+            self.rejected_total += 1
+            raise PasswordHashingBusy(self.retry_after)
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        submitted_at = time.time()
+        try:
+            started_at, result = await self._submit(fn, *args)
+        except Exception:
+            self.failed_total += 1
+            raise
+        finally:
+            self.pending -= 1
+        wait = max(0.0, started_at - submitted_at)
+        self.queue_wait_seconds_total += wait
+        self.queue_wait_seconds_max = max(self.queue_wait_seconds_max, wait)
+        self.completed_total += 1
+        return result
+
+    async def hash(self, password):
+        return await self._run(hash_password, password)
+
+    async def verify(self, password, hashed_password):
+        """(verified, new hash or None) — see app.auth.verify_and_rehash."""
+        verified, new_hash = await self._run(verify_and_rehash, password, hashed_password)
+        if new_hash:
+            self.rehashed_total += 1
+        return verified, new_hash
+
+    def stop(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def snapshot(self):
+        return {
+            "workers": self.workers,
+            "queueLimit": self.queue_limit,
+            "pending": self.pending,
+            "peakPending": self.peak_pending,
+            "completed": self.completed_total,
+            "rejected": self.rejected_total,
+            "failed": self.failed_total,
+            "rehashed": self.rehashed_total,
+            "avgQueueWaitMs": round(self.queue_wait_seconds_total / self.completed_total * 1000, 1) if self.completed_total else 0.0,
+            "maxQueueWaitMs": round(self.queue_wait_seconds_max * 1000, 1),
+        }
+
+
+password_hasher = PasswordHasher(
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+    queue_limit=int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32")),
+    retry_after=int(os.getenv("PASSWORD_HASH_RETRY_AFTER_SECONDS", "2")),
+)
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict
+
+from fastapi.concurrency import run_in_threadpool
+from pymongo import UpdateOne
+
+from app.database import users_collection
+
+logger = logging.getLogger("app.presence_writer")
+
+PRESENCE_FLUSH_INTERVAL_SECONDS = float(os.getenv("PRESENCE_FLUSH_INTERVAL_SECONDS", "2"))
+
+
+class PresenceWriteBuffer:
+    """Write-behind buffer for `isOnline` / `lastActive` on user documents.
+
+    Socket handlers only record the latest state in memory; a background loop
+    flushes everything recorded during the window as one unordered
+    `bulk_write`. Repeated connect/disconnect for the same user inside a window
+    collapses into a single update carrying the final state.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+        self.recorded_total = 0
+        self.written_total = 0
+        self.flushes_total = 0
+        self.failed_flushes_total = 0
+
+    def record(self, user_id, is_online: bool, last_active: int | None = None):
+        if user_id is None:
+            return
+        self.recorded_total += 1
+        # keyed by str so int/str ids of the same user collapse, but the
+        # original value is kept for the Mongo filter
+        self._pending[str(user_id)] = {
+            "id": user_id,
+            "isOnline": bool(is_online),
+            "lastActive": int(last_active if last_active is not None else time.time()),
+        }
+
+    def start(self):
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancel the flush loop and write whatever is still buffered."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as exc:
+                logger.warning("Presence flush failed: %s", exc)
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            try:
+                written = await run_in_threadpool(self._write, list(batch.values()))
+            except Exception:
+                self.failed_flushes_total += 1
+                # put the batch back unless a newer state was recorded meanwhile
+                for key, state in batch.items():
+                    self._pending.setdefault(key, state)
+                raise
+            self.flushes_total += 1
+            self.written_total += written
+            return written
+
+    async def settle_offline(self, states):
+        """Mark `(user_id, last_active)` users offline if nothing newer was written.
+
+        Buffered states are flushed first. A user whose `lastActive` changed
+        (e.g. they reconnected to another instance) keeps their state.
+        """
+        await self.flush()
+        return await run_in_threadpool(self._write_offline, states)
+
+    @staticmethod
+    def _write_offline(states):
+        ops = [
+            UpdateOne({"id": user_id, "isOnline": True, "lastActive": int(last_active)}, {"$set": {"isOnline": False}})
+            for user_id, last_active in states
+        ]
+        return users_collection.bulk_write(ops, ordered=False).modified_count
+
+    @staticmethod
+    def _write(states):
+        ops = [
+            UpdateOne(
+                {"id": state["id"]},
+                {"$set": {"isOnline": state["isOnline"], "lastActive": state["lastActive"]}},
+            )
+            for state in states
+        ]
+        users_collection.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    def snapshot(self):
+        return {
+            "pending": len(self._pending),
+            "recorded": self.recorded_total,
+            "written": self.written_total,
+            "flushes": self.flushes_total,
+            "failedFlushes": self.failed_flushes_total,
+        }
+
+
+presence_writer = PresenceWriteBuffer(PRESENCE_FLUSH_INTERVAL_SECONDS)
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import os
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.membership_cache import members_of_spaces, membership_cache
+from app.ws_manager import manager
+
+logger = logging.getLogger("app.profile_fanout")
+
+# Updates for the same user inside this window go out as one frame (the
+# profile save and the client's follow-up broadcast call usually both land)
+PROFILE_FANOUT_COALESCE_SECONDS = float(os.getenv("PROFILE_FANOUT_COALESCE_SECONDS", "0.25"))
+
+
+def _space_audience(user_id):
+    return members_of_spaces(membership_cache.space_ids_for(user_id))
+
+
+class ProfileFanout:
+    """Delivers avatar/profile changes to everyone who can see the user, off the request path.
+
+    `publish()` only records the change. A background task picks it up,
+    narrows the audience to online users (friends plus the members of the
+    user's own spaces, found via the membership cache) and sends a single
+    pre-encoded `avatar_updated` frame to all of their sockets at once.
+    """
+
+    def __init__(self, coalesce_seconds: float):
+        self.coalesce_seconds = coalesce_seconds
+        # user_id -> (friend ids, latest avatar data)
+        self._pending = {}
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self.published_total = 0
+        self.delivered_total = 0
+        self.frames_total = 0
+        self.failed_total = 0
+
+    def publish(self, user_id, friend_ids, avatar_data: dict):
+        user_id = str(user_id)
+        friends, _ = self._pending.get(user_id, (set(), None))
+        friends |= {str(friend_id) for friend_id in friend_ids or [] if friend_id is not None}
+        self._pending[user_id] = (friends, avatar_data)
+        self.published_total += 1
+        self.start()
+        self._wakeup.set()
+
+    def start(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Deliver whatever is still queued rather than dropping it
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.coalesce_seconds)
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        for user_id, (friend_ids, avatar_data) in pending.items():
+            try:
+                await self._deliver(user_id, friend_ids, avatar_data)
+                self.delivered_total += 1
+            except Exception as exc:
+                self.failed_total += 1
+                logger.warning("Profile fan-out for %s failed: %s", user_id, exc)
+
+    async def _deliver(self, user_id, friend_ids, avatar_data):
+        online = set(manager.online_users)
+        recipients = (friend_ids | {user_id}) & online
+        if online - recipients:
+            # Sized by the user's own spaces, not by how many people are online
+            recipients |= await run_in_threadpool(_space_audience, user_id) & online
+        if not recipients:
+            return
+        message = {
+            "type": "notification",
+            "notification": {
+                "type": "avatar_updated",
+                "userId": user_id,
+                "avatarData": avatar_data,
+                "timestamp": int(time.time() * 1000),
+            },
+        }
+        self.frames_total += await manager.send_to_users(recipients, message)
+
+    def snapshot(self):
+        return {
+            "pending": len(self._pending),
+            "published": self.published_total,
+            "delivered": self.delivered_total,
+            "frames": self.frames_total,
+            "failed": self.failed_total,
+        }
+
+
+profile_fanout = ProfileFanout(coalesce_seconds=PROFILE_FANOUT_COALESCE_SECONDS)
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.database import recommendations_collection
+
+logger = logging.getLogger("app.recommendations")
+
+RECOMMENDATIONS_TOP_K = int(os.getenv("RECOMMENDATIONS_TOP_K", "50"))
+RECOMMENDATIONS_REFRESH_INTERVAL_SECONDS = float(os.getenv("RECOMMENDATIONS_REFRESH_INTERVAL_SECONDS", "5"))
+# Lists nobody invalidated (e.g. a friend's new connection) are recomputed
+# once they are this old
+RECOMMENDATIONS_STALE_AFTER_SECONDS = float(os.getenv("RECOMMENDATIONS_STALE_AFTER_SECONDS", "21600"))
+RECOMMENDATIONS_SWEEP_BATCH = int(os.getenv("RECOMMENDATIONS_SWEEP_BATCH", "100"))
+
+
+class RecommendationStore:
+    """Materialized people-you-may-know lists, one document per user.
+
+    `builder(requester, top_k)` returns the ranked candidate entries
+    (`{"id", "score", ...}`) and `loader(user_id)` the user document; both
+    are set by the users routes. Friendship and space membership writes call
+    `mark_dirty`; a background loop recomputes dirty users every few seconds
+    and sweeps lists older than `stale_after`. A user without a stored list
+    gets one computed on first read.
+    """
+
+    def __init__(self, top_k: int, refresh_interval: float, stale_after: float, sweep_batch: int):
+        self.top_k = max(1, top_k)
+        self.refresh_interval = refresh_interval
+        self.stale_after = stale_after
+        self.sweep_batch = max(1, sweep_batch)
+        self.builder = None
+        self.loader = None
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._task: asyncio.Task | None = None
+        self.reads_total = 0
+        self.computed_on_read_total = 0
+        self.refreshed_total = 0
+        self.failed_total = 0
+
+    def mark_dirty(self, *user_ids):
+        with self._lock:
+            self._dirty |= {str(user_id) for user_id in user_ids if user_id is not None}
+
+    def refresh(self, requester):
+        candidates = self.builder(requester, self.top_k)
+        recommendations_collection.update_one(
+            {"userId": str(requester.get("id"))},
+            {"$set": {"candidates": candidates, "computedAt": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        return candidates
+
+    def get(self, requester):
+        """Ranked candidate entries for `requester`, best first."""
+        self.reads_total += 1
+        doc = recommendations_collection.find_one({"userId": str(requester.get("id"))}, {"_id": 0, "candidates": 1})
+        if doc is not None:
+            return doc.get("candidates") or []
+        self.computed_on_read_total += 1
+        return self.refresh(requester)
+
+    def _refresh_user(self, user_id):
+        requester = self.loader(user_id)
+        if requester:
+            self.refresh(requester)
+        else:
+            recommendations_collection.delete_one({"userId": user_id})
+
+    def _stale_user_ids(self):
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.stale_after)
+        docs = recommendations_collection.find({"computedAt": {"$lt": cutoff}}, {"_id": 0, "userId": 1})
+        return [doc["userId"] for doc in docs.sort("computedAt", 1).limit(self.sweep_batch)]
+
+    async def refresh_pending(self):
+        with self._lock:
+            user_ids = set(self._dirty)
+            self._dirty = set()
+        if not self.builder or not self.loader:
+            return 0
+        user_ids |= set(await run_in_threadpool(self._stale_user_ids))
+        for user_id in user_ids:
+            try:
+                await run_in_threadpool(self._refresh_user, user_id)
+                self.refreshed_total += 1
+            except Exception as exc:
+                self.failed_total += 1
+                logger.warning("Recommendation refresh for %s failed: %s", user_id, exc)
+        return len(user_ids)
+
+    def start(self):
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh_pending()
+            except Exception as exc:
+                logger.warning("Recommendation refresh failed: %s", exc)
+
+    def snapshot(self):
+        return {
+            "pendingRefreshes": len(self._dirty),
+            "reads": self.reads_total,
+            "computedOnRead": self.computed_on_read_total,
+            "refreshed": self.refreshed_total,
+            "failed": self.failed_total,
+        }
+
+
+recommendations = RecommendationStore(
+    top_k=RECOMMENDATIONS_TOP_K,
+    refresh_interval=RECOMMENDATIONS_REFRESH_INTERVAL_SECONDS,
+    stale_after=RECOMMENDATIONS_STALE_AFTER_SECONDS,
+    sweep_batch=RECOMMENDATIONS_SWEEP_BATCH,
+)
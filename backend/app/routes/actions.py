@@ -1,6 +1,12 @@
 import re
 
 from fastapi import APIRouter, HTTPException, Request, status
+from app.bootstrap_cache import bootstrap_cache
+from app.core.avatars import is_data_url
+from app.core.connections import clear_request, connections_ready, edge_between, record_connection, record_request, relationship_from_edge
+from app.membership_cache import membership_cache
+from app.profile_fanout import profile_fanout
+from app.recommendations import recommendations
 from app.database import users_collection, spaces_collection
 from app.deps import get_request_user
 from app.routes.messages import _check_channel_access
@@ -9,15 +15,6 @@ from app.ws_manager import manager
 
 router = APIRouter(prefix="/actions")
 
-FRIEND_REQUEST_SENDER_PROJECTION = {
-    "id": 1,
-    "email": 1,
-    "organizationId": 1,
-    "invitePermissions": 1,
-    "friends": 1,
-    "spaces": 1,
-}
-
 FRIEND_REQUEST_RECIPIENT_PROJECTION = {
     "id": 1,
     "email": 1,
@@ -40,15 +37,6 @@ def id_query_values(value):
     return values
 
 
-def id_query_values_many(values):
-    expanded = []
-    for value in values or []:
-        for candidate in id_query_values(value):
-            if candidate not in expanded:
-                expanded.append(candidate)
-    return expanded
-
-
 def get_user_by_id(user_id):
     user = users_collection.find_one({"id": user_id})
     if user:
@@ -60,47 +48,7 @@ def get_user_by_id(user_id):
 
 
 def users_share_workspace_by_ids(left_id, right_id):
-    left_values = id_query_values(left_id)
-    right_values = id_query_values(right_id)
-    if not left_values or not right_values:
-        return False
-
-    left_user = users_collection.find_one({"id": {"$in": left_values}}, {"spaces": 1})
-    right_user = users_collection.find_one({"id": {"$in": right_values}}, {"spaces": 1})
-    left_space_ids = {str(space_id) for space_id in ((left_user or {}).get("spaces") or []) if space_id is not None}
-    right_space_ids = {str(space_id) for space_id in ((right_user or {}).get("spaces") or []) if space_id is not None}
-    if left_space_ids and left_space_ids.intersection(right_space_ids):
-        return True
-
-    left_membership_query = {
-        "$or": [
-            {"ownerId": {"$in": left_values}},
-            {"createdBy": {"$in": left_values}},
-            {"members": {"$in": left_values}},
-            {"channels.members": {"$in": left_values}},
-        ]
-    }
-    right_membership_query = {
-        "$or": [
-            {"ownerId": {"$in": right_values}},
-            {"createdBy": {"$in": right_values}},
-            {"members": {"$in": right_values}},
-            {"channels.members": {"$in": right_values}},
-        ]
-    }
-
-    left_space_query_ids = id_query_values_many(left_space_ids)
-    if left_space_query_ids:
-        left_membership_query["$or"].append({"id": {"$in": left_space_query_ids}})
-
-    right_space_query_ids = id_query_values_many(right_space_ids)
-    if right_space_query_ids:
-        right_membership_query["$or"].append({"id": {"$in": right_space_query_ids}})
-
-    return bool(spaces_collection.find_one(
-        {"$and": [left_membership_query, right_membership_query]},
-        {"_id": 1},
-    ))
+    return membership_cache.shares_space(left_id, right_id)
 
 
 def extract_email_domain(email):
@@ -130,6 +78,54 @@ def _space_manager_role(space, user_id, channel_id=None):
             return role
     return None
 
+def _edge_request_status(from_id, recipient_id):
+    relationship, request_id = relationship_from_edge(from_id, edge_between(from_id, recipient_id))
+    if relationship == "connected":
+        return {"status": "already_connected"}
+    if relationship == "incoming_request":
+        return {"status": "incoming_request", "notificationId": request_id}
+    if relationship == "outgoing_request":
+        return {"status": "pending"}
+    return None
+
+
+def _notification_request_status(sender_id_values, recipient_id):
+    # Until the connections backfill has run: look for a pending request
+    # embedded in either user's notifications
+    incoming_request = users_collection.find_one(
+        {
+            "id": {"$in": sender_id_values},
+            "notifications": {
+                "$elemMatch": {
+                    "type": {"$in": ["friend_request", "connection_invite"]},
+                    "$or": [{"status": "pending"}, {"actionStatus": "pending"}],
+                    "fromId": {"$in": id_query_values(recipient_id)},
+                }
+            },
+        },
+        {"notifications.$": 1},
+    )
+    if incoming_request:
+        notifications = incoming_request.get("notifications") or []
+        return {"status": "incoming_request", "notificationId": notifications[0].get("id") if notifications else None}
+
+    already_pending = users_collection.find_one(
+        {
+            "id": {"$in": id_query_values(recipient_id)},
+            "notifications": {
+                "$elemMatch": {
+                    "type": {"$in": ["friend_request", "connection_invite"]},
+                    "$or": [{"status": "pending"}, {"actionStatus": "pending"}],
+                    "fromId": {"$in": sender_id_values},
+                }
+            },
+        },
+        {"_id": 1},
+    )
+    if already_pending:
+        return {"status": "pending"}
+    return None
+
 @router.post("/send-friend-request")
 async def send_friend_request(request: Request, payload: dict):
     actor = require_actor(request)
@@ -143,14 +139,12 @@ async def send_friend_request(request: Request, payload: dict):
     if str(from_id) == str(to_id):
         raise HTTPException(status_code=400, detail="You cannot send a connection request to yourself")
 
-    sender = users_collection.find_one({"id": {"$in": sender_id_values}}, FRIEND_REQUEST_SENDER_PROJECTION)
+    # The authenticated actor is already the full sender document
+    sender = actor
     recipient = users_collection.find_one({"id": {"$in": recipient_id_values}}, FRIEND_REQUEST_RECIPIENT_PROJECTION)
     if recipient is None:
         raise HTTPException(status_code=404, detail="Recipient not found")
 
-    if sender is None:
-        raise HTTPException(status_code=404, detail="Sender not found")
-
     # Permission enforcement: if sender has company-only invite permission,
     # ensure recipient is in the same organization or domain
     try:
@@ -184,38 +178,12 @@ async def send_friend_request(request: Request, payload: dict):
         if any(str(friend_id) == str(recipient_id) for friend_id in sender.get("friends") or []):
             return {"status": "already_connected"}
 
-        incoming_request = users_collection.find_one(
-            {
-                "id": {"$in": sender_id_values},
-                "notifications": {
-                    "$elemMatch": {
-                        "type": {"$in": ["friend_request", "connection_invite"]},
-                        "$or": [{"status": "pending"}, {"actionStatus": "pending"}],
-                        "fromId": {"$in": id_query_values(recipient_id)},
-                    }
-                },
-            },
-            {"notifications.$": 1},
-        )
-        if incoming_request:
-            notifications = incoming_request.get("notifications") or []
-            return {"status": "incoming_request", "notificationId": notifications[0].get("id") if notifications else None}
-
-        already_pending = users_collection.find_one(
-            {
-                "id": {"$in": id_query_values(recipient_id)},
-                "notifications": {
-                    "$elemMatch": {
-                        "type": {"$in": ["friend_request", "connection_invite"]},
-                        "$or": [{"status": "pending"}, {"actionStatus": "pending"}],
-                        "fromId": {"$in": sender_id_values},
-                    }
-                },
-            },
-            {"_id": 1},
-        )
-        if already_pending:
-            return {"status": "pending"}
+        if connections_ready():
+            existing_request = _edge_request_status(from_id, recipient_id)
+        else:
+            existing_request = _notification_request_status(sender_id_values, recipient_id)
+        if existing_request:
+            return existing_request
     except HTTPException:
         raise
     except Exception:
@@ -244,6 +212,8 @@ async def send_friend_request(request: Request, payload: dict):
         },
     )
 
+    if created:
+        record_request(from_id, recipient_id, created.get("id"))
     return {"status": "sent", "notificationId": created.get("id") if created else None}
 
 @router.post("/accept-friend")
@@ -282,6 +252,8 @@ async def accept_friend(request: Request, payload: dict):
             {"id": friend_id},
             {"$addToSet": {"friends": user_id}}
         )
+        record_connection(user_id, friend_id)
+        recommendations.mark_dirty(user_id, friend_id)
 
         # Notify the original requester (friend_id) that their request was accepted
         try:
@@ -336,6 +308,7 @@ async def reject_friend(request: Request, payload: dict):
             processed = remove_result.modified_count > 0
         if not processed:
             return {"status": "rejected"}
+        clear_request(user_id, friend_id)
 
         # Notify the original requester that their request was rejected
         try:
@@ -498,6 +471,9 @@ async def remove_member(request: Request, payload: dict):
             updated_channels.append(ch)
 
         spaces_collection.update_one({"id": {"$in": id_query_values(space_id)}}, {"$set": {"channels": updated_channels}})
+    bootstrap_cache.invalidate_space(space.get("id") if space else space_id)
+    membership_cache.invalidate_space(space.get("id") if space else space_id, user_id_to_remove)
+    recommendations.mark_dirty(user_id_to_remove)
 
     # If removing from the whole space (no channel_id provided), also remove space from user's spaces
     if not channel_id:
@@ -649,57 +625,11 @@ async def broadcast_avatar_update(request: Request, payload: dict):
     if not user_id or not avatar_data:
         return {"error": "Missing userId or avatarData"}
     
-    # Get user's friends and space memberships - handle both string and int id types
-    user = users_collection.find_one({"id": user_id})
-    if not user:
-        # Try integer conversion if string lookup fails
-        try:
-            user = users_collection.find_one({"id": int(user_id)})
-        except (ValueError, TypeError):
-            pass
-    if not user:
-        # Try string conversion if original was int
-        user = users_collection.find_one({"id": str(user_id)})
-    if not user:
-        print(f"[broadcast-avatar] User not found: {user_id}")
-        return {"error": "User not found"}
-    
-    # Collect all users who should receive this update
-    recipients = set()
-    
-    # Add all friends
-    friends = user.get("friends", [])
-    for friend_id in friends:
-        if friend_id:
-            recipients.add(str(friend_id))
-    
-    # Add all members from spaces this user belongs to
-    user_spaces = user.get("spaces", [])
-    for space in spaces_collection.find({"id": {"$in": user_spaces}}):
-        members = space.get("members", [])
-        for member_id in members:
-            if member_id and str(member_id) != str(user_id):  # Don't send to self
-                recipients.add(str(member_id))
-    
-    print(f"[broadcast-avatar] User {user_id} has {len(friends)} friends and is in {len(user_spaces)} spaces. Broadcasting to {len(recipients)} recipients: {list(recipients)[:5]}...")
-    
-    # Create notification payload with cache-busting timestamp
-    ts = int(__import__('time').time() * 1000)
-    notif = {
-        "type": "avatar_updated",
-        "userId": user_id,
-        "avatarData": avatar_data,
-        "timestamp": ts
-    }
-    
-    # Broadcast to all recipients - ensure recipient_id is string for WebSocket lookup
-    sent_count = 0
-    for recipient_id in recipients:
-        try:
-            await manager.send_to_user(str(recipient_id), {"type": "notification", "notification": notif})
-            sent_count += 1
-        except Exception as e:
-            print(f"[broadcast-avatar] Failed to send to {recipient_id}: {e}")
-    
-    print(f"[broadcast-avatar] Sent avatar update to {sent_count}/{len(recipients)} recipients")
-    return {"status": "broadcasted", "recipients": len(recipients), "sent": sent_count}
+    # An inline image is moved to the file store by the profile save, which
+    # fans out the stored URL itself; don't race it with the raw data URL
+    if is_data_url(avatar_data.get("avatar_url")):
+        return {"status": "queued"}
+
+    # Delivered in the background to online friends and space co-members
+    profile_fanout.publish(user_id, actor.get("friends") or [], avatar_data)
+    return {"status": "queued"}
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from app.database import users_collection, organizations_collection, events_collection, notifications_collection
 from app.deps import require_admin_user
+from app.ws_manager import manager
 import time
 import statistics
 from bson import ObjectId
@@ -143,3 +144,35 @@ def admin_overview(domain: str = None, adminEmail: str = None, admin=Depends(req
         "recentEvents": recent,
         "employees": employees_summary
     }
+
+
+@router.post("/ws/drain")
+async def drain_websockets(waves: int = None, seconds: float = None, admin=Depends(require_admin_user)):
+    """Put this instance into drain mode ahead of a restart or redeploy.
+
+    New sockets are refused with a retry hint and existing sockets are told to
+    reconnect after a random delay, then closed in waves in the background.
+    """
+    if admin.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Platform admin access required")
+    if manager.draining:
+        return {"status": "already_draining"}
+
+    sockets = len(manager.all_sockets())
+    kwargs = {}
+    if waves is not None:
+        kwargs["waves"] = max(1, int(waves))
+    if seconds is not None:
+        kwargs["duration"] = max(0.0, float(seconds))
+    manager.start_drain(**kwargs)
+    return {"status": "draining", "sockets": sockets}
+
+
+@router.delete("/ws/drain")
+async def undrain_websockets(admin=Depends(require_admin_user)):
+    """Leave drain mode and accept sockets again, e.g. after a cancelled redeploy."""
+    if admin.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Platform admin access required")
+    if not manager.end_drain():
+        return {"status": "not_draining"}
+    return {"status": "accepting"}
@@ -4,6 +4,15 @@ from app.database import files_collection
 from bson import ObjectId
 from app.auth import verify_password, identify_hash_scheme
 from app.deps import require_admin_user
+from app.ws_admission import handshake_admission
+from app.presence_writer import presence_writer
+from app.upload_workers import upload_workers
+from app.bootstrap_cache import bootstrap_cache
+from app.membership_cache import membership_cache
+from app.password_hasher import password_hasher
+from app.profile_fanout import profile_fanout
+from app.recommendations import recommendations
+from app.ws_manager import manager
 
 router = APIRouter(prefix="/debug")
 
@@ -68,7 +77,7 @@ def recent_files(limit: int = 20, admin=Depends(require_admin_user)):
     in production. It returns limited fields to help diagnose upload issues.
     """
     docs = []
-    for d in files_collection.find().sort('createdAt', -1).limit(int(limit)):
+    for d in files_collection.find({}, {'data': 0}).sort('createdAt', -1).limit(int(limit)):
         # Convert ObjectId to string and include only safe fields
         docs.append({
             'id': str(d.get('_id')),
@@ -84,3 +93,52 @@ def recent_files(limit: int = 20, admin=Depends(require_admin_user)):
             'createdAt': d.get('createdAt')
         })
     return {'files': docs}
+
+
+@router.get('/upload-metrics')
+def upload_metrics(admin=Depends(require_admin_user)):
+    """Upload worker pool depth, rejections and job timings."""
+    return upload_workers.snapshot()
+
+
+@router.get('/ws-metrics')
+def ws_metrics(admin=Depends(require_admin_user)):
+    """Handshake admission, presence write-behind and current socket totals."""
+    return {
+        'handshakes': handshake_admission.snapshot(),
+        'presenceWrites': presence_writer.snapshot(),
+        'onlineUsers': len(manager.online_users),
+        'sockets': sum(len(group) for group in manager.active_connections.values()),
+        'chats': len(manager.active_connections),
+        'draining': manager.draining,
+    }
+
+
+@router.get('/bootstrap-cache')
+def bootstrap_cache_metrics(admin=Depends(require_admin_user)):
+    """Bootstrap payload cache hit rate and pending background rebuilds."""
+    return bootstrap_cache.snapshot()
+
+
+@router.get('/recommendations')
+def recommendation_metrics(admin=Depends(require_admin_user)):
+    """People-you-may-know reads, on-read computes and background refreshes."""
+    return recommendations.snapshot()
+
+
+@router.get('/membership-cache')
+def membership_cache_metrics(admin=Depends(require_admin_user)):
+    """User-to-spaces membership cache size, hit rate and invalidations."""
+    return membership_cache.snapshot()
+
+
+@router.get('/profile-fanout')
+def profile_fanout_metrics(admin=Depends(require_admin_user)):
+    """Avatar/profile change fan-out: queued, delivered and frames sent."""
+    return profile_fanout.snapshot()
+
+
+@router.get('/password-hasher')
+def password_hasher_metrics(admin=Depends(require_admin_user)):
+    """Password hashing pool: queue depth, queue wait, 429 rejections and rehashes."""
+    return password_hasher.snapshot()
@@ -2,10 +2,14 @@ from fastapi import APIRouter, Request, HTTPException
 from fastapi.concurrency import run_in_threadpool
 from starlette import status
 from app.ws_manager import manager
+from app.core.attachment_refs import drop_message_refs, sync_message_refs
 from app.database import messages_collection, spaces_collection
 from app.deps import get_request_user
+import logging
 import time
 
+logger = logging.getLogger("app.routes.messages")
+
 _ACCESS_CACHE_TTL_SECONDS = 2.0
 _channel_access_cache = {}
 
@@ -202,9 +206,14 @@ def _check_channel_access(chat_id: str, user_id: int):
     if not space:
         return False
 
+    allowed = _space_grants_channel_access(space, {str(val) for val in normalized_ids if val is not None}, user_id)
+    _channel_access_cache[cache_key] = (allowed, now + _ACCESS_CACHE_TTL_SECONDS)
+    return allowed
+
+
+def _space_grants_channel_access(space: dict, target_str_ids: set, user_id):
     # Locate the channel
     channel = None
-    target_str_ids = {str(val) for val in normalized_ids if val is not None}
     for ch in (space.get("channels") or []):
         try:
             if str(ch.get("id")) in target_str_ids:
@@ -243,18 +252,57 @@ def _check_channel_access(chat_id: str, user_id: int):
     try:
         norm_owner = _normalize_owner(owner_id)
         if norm_owner is not None and str(norm_owner) == str(user_id):
-            _channel_access_cache[cache_key] = (True, now + _ACCESS_CACHE_TTL_SECONDS)
             return True
     except Exception:
         pass
 
     # User has access if they are in space members, or in channel members
-    if _id_in_list(user_id, space_members) or _id_in_list(user_id, channel_members):
-        _channel_access_cache[cache_key] = (True, now + _ACCESS_CACHE_TTL_SECONDS)
-        return True
+    return _id_in_list(user_id, space_members) or _id_in_list(user_id, channel_members)
 
-    _channel_access_cache[cache_key] = (False, now + _ACCESS_CACHE_TTL_SECONDS)
-    return False
+
+def _accessible_chat_ids(chat_ids, user_id, stop_at_first: bool = False):
+    """Subset of `chat_ids` the user can read, using one spaces query for all channels."""
+    if user_id is None:
+        return set()
+
+    now = time.monotonic()
+    granted = set()
+    channel_ids = []
+    for chat_id in {str(cid) for cid in chat_ids if cid is not None}:
+        cached = _channel_access_cache.get((chat_id, str(user_id)))
+        if cached and cached[1] > now:
+            if cached[0]:
+                granted.add(chat_id)
+        elif chat_id.startswith("dm_"):
+            if _check_channel_access(chat_id, user_id):
+                granted.add(chat_id)
+        else:
+            channel_ids.append(chat_id)
+        if granted and stop_at_first:
+            return granted
+
+    if not channel_ids:
+        return granted
+
+    normalized_ids = set()
+    for chat_id in channel_ids:
+        normalized_ids |= _normalized_chat_ids(chat_id)
+    spaces = spaces_collection.find({
+        "channels.id": {"$in": list(normalized_ids)}
+    }, {"ownerId": 1, "createdBy": 1, "members": 1, "channels.id": 1, "channels.members": 1})
+
+    for space in spaces:
+        for chat_id in channel_ids:
+            target_str_ids = {str(val) for val in _normalized_chat_ids(chat_id)}
+            if chat_id not in granted and _space_grants_channel_access(space, target_str_ids, user_id):
+                granted.add(chat_id)
+    for chat_id in channel_ids:
+        _channel_access_cache[(chat_id, str(user_id))] = (chat_id in granted, now + _ACCESS_CACHE_TTL_SECONDS)
+    return granted
+
+
+def _has_access_to_any_chat(chat_ids, user_id):
+    return bool(_accessible_chat_ids(chat_ids, user_id, stop_at_first=True))
 
 
 def _fetch_messages(chat_id: str):
@@ -270,6 +318,17 @@ def _count_messages(chat_id: str):
     return messages_collection.count_documents({"chatId": chat_id})
 
 
+def _sync_attachment_refs(chat_id: str, message_key, message: dict):
+    # The refs only speed up file access checks; a failed write must not fail the message
+    try:
+        if message is None:
+            drop_message_refs(chat_id, message_key)
+        else:
+            sync_message_refs(chat_id, message_key, message)
+    except Exception as e:
+        logger.warning("Failed to update attachment refs for %s/%s: %s", chat_id, message_key, e)
+
+
 def _save_message_document(chat_id: str, message: dict):
     message_id = message.get("id")
     if message_id is not None:
@@ -278,13 +337,18 @@ def _save_message_document(chat_id: str, message: dict):
             {"$set": {"chatId": chat_id, "message": message}},
             upsert=True,
         )
+        _sync_attachment_refs(chat_id, message_id, message)
         return
 
-    messages_collection.insert_one({"chatId": chat_id, "message": message})
+    res = messages_collection.insert_one({"chatId": chat_id, "message": message})
+    if message.get("attachments"):
+        _sync_attachment_refs(chat_id, res.inserted_id, message)
 
 
 def _delete_message_documents(chat_id: str, message_id: str):
-    return messages_collection.delete_many(_message_filter(chat_id, message_id))
+    res = messages_collection.delete_many(_message_filter(chat_id, message_id))
+    _sync_attachment_refs(chat_id, message_id, None)
+    return res
 
 
 def _remove_message_attachment(chat_id: str, message_id: str, attachment_id: str):
@@ -313,6 +377,7 @@ def _remove_message_attachment(chat_id: str, message_id: str, attachment_id: str
         _message_filter(chat_id, message_id),
         {"$set": {"message.attachments": remaining, "message.attachmentsUpdatedAt": time.time()}}
     )
+    _sync_attachment_refs(chat_id, message_id, message)
     return {
         "found": True,
         "attachment_found": True,
@@ -446,6 +511,7 @@ def update_message(request: Request, chat_id: str, message_id: str, message: dic
 
     if res.matched_count == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found")
+    _sync_attachment_refs(chat_id, message_id, message)
 
     return {"status": "updated"}
 
@@ -4,6 +4,10 @@ import uuid
 
 from fastapi import APIRouter, HTTPException, Request, status
 
+from app.bootstrap_cache import bootstrap_cache
+from app.core.connections import clear_request, record_connection
+from app.membership_cache import membership_cache
+from app.recommendations import recommendations
 from app.database import notifications_collection, spaces_collection, users_collection
 from app.deps import get_request_user
 from app.ws_manager import manager
@@ -297,8 +301,11 @@ def _apply_membership(space_id, channel_id, user_id):
         )
     else:
         spaces_collection.update_one({"id": space.get("id")}, {"$addToSet": {"members": user_id}})
+    bootstrap_cache.invalidate_space(space.get("id"))
+    membership_cache.invalidate_space(space.get("id"), user_id)
 
     users_collection.update_one({"id": {"$in": id_query_values(user_id)}}, {"$addToSet": {"spaces": space.get("id")}})
+    recommendations.mark_dirty(user_id)
 
     return spaces_collection.find_one({"id": space.get("id")}, {"_id": 0})
 
@@ -324,6 +331,8 @@ async def accept_notification_for_user(user_id, notification_id):
             raise HTTPException(status_code=400, detail="Sender missing")
         users_collection.update_one({"id": {"$in": id_query_values(user_id)}}, {"$addToSet": {"friends": sender_id}})
         users_collection.update_one({"id": {"$in": id_query_values(sender_id)}}, {"$addToSet": {"friends": user_id}})
+        record_connection(user_id, sender_id)
+        recommendations.mark_dirty(user_id, sender_id)
         response_message = f"{_display_name(actor)} accepted your connection invite"
         await manager.send_to_user(str(user_id), {"type": "friends_updated"})
         await manager.send_to_user(str(sender_id), {"type": "friends_updated"})
@@ -382,6 +391,8 @@ async def decline_notification_for_user(user_id, notification_id):
 
     response_message = None
     if notification.get("type") in ("connection_invite", "friend_request"):
+        if sender_id is not None:
+            clear_request(user_id, sender_id)
         response_message = f"{_display_name(actor)} declined your connection invite"
     elif notification.get("type") in ("space_invite", "channel_invite"):
         metadata = notification.get("metadata") or {}
@@ -462,6 +473,10 @@ def withdraw_notification(request: Request, notification_id: str):
     if managed_notification_id and managed_recipient_id:
         _set_notification_fields(managed_recipient_id, managed_notification_id, {"actionStatus": "withdrawn", "status": "read", "updatedAt": now})
     _set_notification_fields(actor.get("id"), notification_id, {"actionStatus": "withdrawn", "status": "read", "updatedAt": now})
+    # On the sender's own copy the other side of the request is its recipient
+    other_id = managed_recipient_id or notification.get("senderId") or notification.get("fromId")
+    if notification.get("type") in ("connection_invite", "friend_request") and other_id is not None:
+        clear_request(actor.get("id"), other_id)
     return {"status": "withdrawn", "notificationId": notification_id}
 
 
@@ -0,0 +1,498 @@
+from datetime import datetime, timedelta, timezone
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+
+from bson import ObjectId
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pymongo import ReturnDocument
+from starlette import status
+
+from app.database import files_collection, upload_sessions_collection
+from app.deps import get_request_user
+from app.routes.upload import _cors_headers, _do_upload_and_update, _queue_full_response, _status_notifier
+from app.upload_workers import UploadQueueFull, upload_workers
+
+router = APIRouter(prefix="/upload/resumable")
+logger = logging.getLogger("app.routes.resumable_upload")
+
+# Partial uploads live on disk next to the backend (not in /tmp) so they
+# survive worker restarts; the session document records who owns which file.
+RESUMABLE_UPLOAD_DIR = os.path.abspath(
+    os.getenv("RESUMABLE_UPLOAD_DIR")
+    or os.path.join(os.path.dirname(__file__), "..", "..", "upload_sessions")
+)
+os.makedirs(RESUMABLE_UPLOAD_DIR, exist_ok=True)
+
+MAX_RESUMABLE_UPLOAD_BYTES = int(os.getenv("MAX_RESUMABLE_UPLOAD_BYTES", str(5 * 1024 * 1024 * 1024)))
+MAX_CHUNK_BYTES = int(os.getenv("RESUMABLE_MAX_CHUNK_BYTES", str(64 * 1024 * 1024)))
+RECOMMENDED_CHUNK_BYTES = 8 * 1024 * 1024
+SESSION_TTL = timedelta(hours=int(os.getenv("RESUMABLE_SESSION_TTL_HOURS", "24")))
+# An append holds a short lease so two requests can't write the same session
+APPEND_LEASE = timedelta(seconds=120)
+# Finalizing holds a longer one, renewed while the upload is queued or running;
+# once it lapses (the holder died) a retry or any sweeper may take over
+FINALIZE_LEASE = timedelta(seconds=int(os.getenv("RESUMABLE_FINALIZE_LEASE_SECONDS", "300")))
+_WRITE_BUFFER_BYTES = 1024 * 1024
+# How often expired sessions are cleaned up and interrupted finalizations resumed
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("RESUMABLE_SESSION_SWEEP_INTERVAL_SECONDS", "300"))
+_SWEEP_BATCH = 100
+
+# Finalizations queued or running in this process, whose leases it renews;
+# `finalizeOwner` on the session names the process holding the lease
+_active_finalizations = set()
+_FINALIZE_OWNER = uuid.uuid4().hex
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _part_path(upload_id: str):
+    return os.path.join(RESUMABLE_UPLOAD_DIR, f"{upload_id}.part")
+
+
+def _current_offset(upload_id: str):
+    # The bytes on disk are the source of truth: an append that wrote data but
+    # died before updating the session is still counted.
+    try:
+        return os.path.getsize(_part_path(upload_id))
+    except OSError:
+        return 0
+
+
+def _require_user(request: Request):
+    user = get_request_user(request)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication required")
+    return user
+
+
+def _get_session(upload_id: str, user):
+    session = upload_sessions_collection.find_one({"_id": upload_id, "userId": str(user.get("id"))})
+    if not session:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    if session.get("status") != "open":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Upload session is {session.get('status')}")
+    return session
+
+
+def _session_state(session, offset: int):
+    return {
+        "upload_id": session["_id"],
+        "filename": session.get("filename"),
+        "size": session.get("size"),
+        "offset": offset,
+        "chunk_size": RECOMMENDED_CHUNK_BYTES,
+        "expires_at": session.get("expiresAt"),
+    }
+
+
+def _staged_path(upload_id: str):
+    return f"{_part_path(upload_id)}.final"
+
+
+def _remove_part(upload_id: str):
+    try:
+        os.remove(_part_path(upload_id))
+    except OSError:
+        pass
+
+
+def _expire_stale_sessions():
+    now = _now().isoformat()
+    expired = 0
+    while True:
+        batch = list(upload_sessions_collection.find({"status": "open", "expiresAt": {"$lt": now}}, {"_id": 1}).limit(_SWEEP_BATCH))
+        for session in batch:
+            _remove_part(session["_id"])
+            upload_sessions_collection.update_one({"_id": session["_id"], "status": "open"}, {"$set": {"status": "expired"}})
+        expired += len(batch)
+        if len(batch) < _SWEEP_BATCH:
+            return expired
+
+
+@router.post("")
+def create_upload_session(request: Request, payload: dict):
+    """Start a resumable upload: {filename, mimetype, size} -> upload_id."""
+    user = _require_user(request)
+    filename = str(payload.get("filename") or "").strip()
+    try:
+        size = int(payload.get("size"))
+    except (TypeError, ValueError):
+        size = -1
+    if not filename or size < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="filename and size required")
+    if size > MAX_RESUMABLE_UPLOAD_BYTES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too large")
+
+    upload_id = uuid.uuid4().hex
+    open(_part_path(upload_id), "wb").close()
+    now = _now()
+    session = {
+        "_id": upload_id,
+        "userId": str(user.get("id")),
+        "filename": filename,
+        "mimetype": payload.get("mimetype") or "application/octet-stream",
+        "size": size,
+        "offset": 0,
+        "status": "open",
+        "createdAt": now.isoformat(),
+        "expiresAt": (now + SESSION_TTL).isoformat(),
+    }
+    upload_sessions_collection.insert_one(session)
+    return JSONResponse(_session_state(session, 0), status_code=201, headers=_cors_headers())
+
+
+@router.get("/{upload_id}")
+def get_upload_offset(request: Request, upload_id: str):
+    """Where to resume: the number of bytes already received."""
+    user = _require_user(request)
+    session = _get_session(upload_id, user)
+    return JSONResponse(_session_state(session, _current_offset(upload_id)), headers=_cors_headers())
+
+
+def _write_at(path: str, offset: int, data: bytes):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+@router.put("/{upload_id}")
+async def append_chunk(request: Request, upload_id: str, offset: int):
+    """Append the raw request body at `offset`, which must equal the current offset."""
+    user = await run_in_threadpool(_require_user, request)
+    session = await run_in_threadpool(_get_session, upload_id, user)
+    size = int(session.get("size") or 0)
+
+    now = _now()
+    leased = await run_in_threadpool(
+        upload_sessions_collection.update_one,
+        {"_id": upload_id, "status": "open", "$or": [{"leaseUntil": None}, {"leaseUntil": {"$lt": now.isoformat()}}]},
+        {"$set": {"leaseUntil": (now + APPEND_LEASE).isoformat()}},
+    )
+    if not leased.modified_count:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Another chunk is being written")
+
+    path = _part_path(upload_id)
+    written = 0
+    buffer = bytearray()
+    try:
+        # Checked under the lease so a concurrent append can't move it underneath us
+        current = _current_offset(upload_id)
+        if offset != current:
+            return JSONResponse(
+                {"error": "offset mismatch", **_session_state(session, current)},
+                status_code=409,
+                headers=_cors_headers(),
+            )
+
+        async for piece in request.stream():
+            if not piece:
+                continue
+            written += len(piece)
+            if written > MAX_CHUNK_BYTES or offset + written > size:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Chunk exceeds declared size")
+            buffer.extend(piece)
+            if len(buffer) >= _WRITE_BUFFER_BYTES:
+                await run_in_threadpool(_write_at, path, offset + written - len(buffer), bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(_write_at, path, offset + written - len(buffer), bytes(buffer))
+    finally:
+        new_offset = _current_offset(upload_id)
+        await run_in_threadpool(
+            upload_sessions_collection.update_one,
+            {"_id": upload_id},
+            {"$set": {"offset": new_offset, "updatedAt": _now().isoformat()}, "$unset": {"leaseUntil": ""}},
+        )
+
+    return JSONResponse(_session_state(session, new_offset), headers=_cors_headers())
+
+
+def _sha256_of(path: str):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_WRITE_BUFFER_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stage_finalization(session):
+    """Stage a claimed session's bytes and file document.
+
+    Safe to repeat after a crash or a failed attempt: an already staged file
+    and an already created file document are reused.
+    """
+    upload_id = session["_id"]
+    staged = _staged_path(upload_id)
+    if not os.path.exists(staged):
+        # Move the part file out of the session dir so a retry can't touch it
+        os.replace(_part_path(upload_id), staged)
+    sha256 = _sha256_of(staged)
+
+    doc_id = ObjectId(session["fileId"]) if session.get("fileId") else None
+    if doc_id is None or not files_collection.count_documents({"_id": doc_id}, limit=1):
+        doc_id = files_collection.insert_one({
+            "userId": session.get("userId"),
+            "filename": session.get("filename"),
+            "mimetype": session.get("mimetype"),
+            "size": int(session.get("size") or 0),
+            "status": "uploading",
+            "createdAt": _now().isoformat(),
+        }).inserted_id
+        upload_sessions_collection.update_one({"_id": upload_id}, {"$set": {"fileId": str(doc_id)}})
+    return doc_id, staged, sha256
+
+
+def _lease_free(field: str, now: str):
+    return {"$or": [{field: None}, {field: {"$lt": now}}]}
+
+
+def _claim_finalization(upload_id: str):
+    """Take the finalize lease; returns the claimed session, or None if someone holds it.
+
+    Open sessions must not be mid-append; "finalizing" ones are claimable
+    only once their holder's lease has lapsed.
+    """
+    now = _now()
+    claimed = upload_sessions_collection.find_one_and_update(
+        {
+            "_id": upload_id,
+            "status": {"$in": ["open", "finalizing"]},
+            "$and": [_lease_free("finalizeLeaseUntil", now.isoformat()), _lease_free("leaseUntil", now.isoformat())],
+        },
+        {"$set": {
+            "status": "finalizing",
+            "finalizeOwner": _FINALIZE_OWNER,
+            "finalizeLeaseUntil": (now + FINALIZE_LEASE).isoformat(),
+            "updatedAt": now.isoformat(),
+        }},
+        return_document=ReturnDocument.AFTER,
+    )
+    if claimed:
+        _active_finalizations.add(upload_id)
+    return claimed
+
+
+def _end_finalization(upload_id: str, **fields):
+    """Give up this process's finalize lease, optionally settling the session.
+
+    A session left "finalizing" is picked up again by a retry or the sweeper.
+    """
+    _active_finalizations.discard(upload_id)
+    upload_sessions_collection.update_one(
+        {"_id": upload_id, "finalizeOwner": _FINALIZE_OWNER},
+        {"$set": {"updatedAt": _now().isoformat(), **fields}, "$unset": {"finalizeOwner": "", "finalizeLeaseUntil": ""}},
+    )
+
+
+def _renew_finalize_leases():
+    """Extend the leases of every finalization queued or running here."""
+    if not _active_finalizations:
+        return 0
+    return upload_sessions_collection.update_many(
+        {"_id": {"$in": list(_active_finalizations)}, "status": "finalizing", "finalizeOwner": _FINALIZE_OWNER},
+        {"$set": {"finalizeLeaseUntil": (_now() + FINALIZE_LEASE).isoformat()}},
+    ).modified_count
+
+
+def _finalize_session(upload_id: str, user):
+    session = upload_sessions_collection.find_one({"_id": upload_id, "userId": str(user.get("id"))})
+    if not session:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    if session.get("status") not in ("open", "finalizing"):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Upload session is {session.get('status')}")
+
+    size = int(session.get("size") or 0)
+    if session.get("status") == "open" and not os.path.exists(_staged_path(upload_id)):
+        offset = _current_offset(upload_id)
+        if offset != size:
+            return session, None, {"error": "upload incomplete", **_session_state(session, offset)}
+
+    claimed = _claim_finalization(upload_id)
+    if not claimed:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload session is already being finalized")
+    # The state may have moved on since the read; settle it if a past attempt got far enough
+    if _close_abandoned_finalization(claimed):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload session is already finalized")
+    try:
+        job = _stage_finalization(claimed)
+    except Exception:
+        _end_finalization(upload_id)
+        raise
+    return claimed, job, None
+
+
+def _finish_session_upload(upload_id, doc_id, staged, name, mime_type, sha256):
+    """Upload worker job: store the staged bytes, then close the session."""
+    final_status = None
+    try:
+        result = _do_upload_and_update(doc_id, staged, name, mime_type, sha256)
+        final_status = "completed" if result.get("status") == "done" else "failed"
+        return result
+    finally:
+        _end_finalization(upload_id, **({"status": final_status} if final_status else {}))
+
+
+def _submit_finalization(user_id, upload_id, session, job):
+    """Queue a staged session; the caller must hold an upload_workers reservation."""
+    doc_id, staged, sha256 = job
+    upload_workers.submit(
+        _finish_session_upload, upload_id, doc_id, staged, session.get("filename"), session.get("mimetype"), sha256,
+        on_complete=_status_notifier(user_id),
+    )
+
+
+@router.post("/{upload_id}/finalize")
+async def finalize_upload(request: Request, upload_id: str):
+    """Hand a complete upload to the normal storage, de-duplication and preview path.
+
+    A session left "finalizing" by a restart or a failed attempt can be
+    finalized again.
+    """
+    user = await run_in_threadpool(_require_user, request)
+    # The session stays open if the workers are saturated, so the client can simply retry
+    try:
+        upload_workers.reserve()
+    except UploadQueueFull as exc:
+        return _queue_full_response(exc)
+
+    try:
+        session, job, incomplete = await run_in_threadpool(_finalize_session, upload_id, user)
+    except Exception:
+        upload_workers.release()
+        raise
+    if incomplete:
+        upload_workers.release()
+        return JSONResponse(incomplete, status_code=409, headers=_cors_headers())
+
+    _submit_finalization(user.get("id"), upload_id, session, job)
+    return JSONResponse(
+        {"status": "accepted", "file_id": str(job[0]), "filename": session.get("filename"), "size": session.get("size")},
+        headers=_cors_headers(),
+    )
+
+
+def _close_abandoned_finalization(session):
+    """Settle a claimed finalizing session that can't be re-run; returns True when it was settled."""
+    upload_id = session["_id"]
+    if session.get("fileId"):
+        file_doc = files_collection.find_one({"_id": ObjectId(session["fileId"])}, {"status": 1})
+        if file_doc and file_doc.get("status") == "done":
+            # Stored before the restart; only the session update was lost
+            _end_finalization(upload_id, status="completed")
+            try:
+                os.remove(_staged_path(upload_id))
+            except OSError:
+                pass
+            return True
+    if not os.path.exists(_staged_path(upload_id)) and not os.path.exists(_part_path(upload_id)):
+        _end_finalization(upload_id, status="failed", error="upload data lost")
+        if session.get("fileId"):
+            files_collection.update_one(
+                {"_id": ObjectId(session["fileId"]), "status": "uploading"},
+                {"$set": {"status": "error", "error": "upload data lost"}},
+            )
+        return True
+    return False
+
+
+def _claim_abandoned_finalizations():
+    """Finalizing sessions whose lease lapsed, claimed, staged and ready to queue."""
+    jobs = []
+    stale = {"status": "finalizing", **_lease_free("finalizeLeaseUntil", _now().isoformat())}
+    for candidate in upload_sessions_collection.find(stale, {"_id": 1}).limit(_SWEEP_BATCH):
+        upload_id = candidate["_id"]
+        session = _claim_finalization(upload_id)
+        if not session or _close_abandoned_finalization(session):
+            continue
+        try:
+            jobs.append((session, _stage_finalization(session)))
+        except Exception as exc:
+            _end_finalization(upload_id)
+            logger.warning("Failed to resume finalization of upload %s: %s", upload_id, exc)
+    return jobs
+
+
+class UploadSessionSweeper:
+    """Expires stale resumable sessions and resumes interrupted finalizations.
+
+    Runs once at startup, so sessions a restart left "finalizing" are queued
+    again once their lease lapses, and then every `interval` seconds. A
+    second task renews the leases of this process's own finalizations.
+    """
+
+    def __init__(self, interval: float, renew_interval: float):
+        self.interval = interval
+        self.renew_interval = renew_interval
+        self._task: asyncio.Task | None = None
+        self._renew_task: asyncio.Task | None = None
+        self.expired_total = 0
+        self.resumed_total = 0
+
+    async def sweep(self):
+        self.expired_total += await run_in_threadpool(_expire_stale_sessions)
+        for session, job in await run_in_threadpool(_claim_abandoned_finalizations):
+            try:
+                upload_workers.reserve()
+            except UploadQueueFull:
+                # Picked up on the next sweep, or by a client retry
+                await run_in_threadpool(_end_finalization, session["_id"])
+                continue
+            _submit_finalization(session.get("userId"), session["_id"], session, job)
+            self.resumed_total += 1
+
+    def start(self):
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+        self._renew_task = asyncio.create_task(self._renew())
+
+    async def stop(self):
+        for task in (self._task, self._renew_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._renew_task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as exc:
+                logger.warning("Upload session sweep failed: %s", exc)
+            await asyncio.sleep(self.interval)
+
+    async def _renew(self):
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                await run_in_threadpool(_renew_finalize_leases)
+            except Exception as exc:
+                logger.warning("Failed to renew finalize leases: %s", exc)
+
+
+session_sweeper = UploadSessionSweeper(
+    interval=SESSION_SWEEP_INTERVAL_SECONDS,
+    renew_interval=FINALIZE_LEASE.total_seconds() / 3,
+)
+
+
+@router.delete("/{upload_id}")
+def abort_upload(request: Request, upload_id: str):
+    user = _require_user(request)
+    _get_session(upload_id, user)
+    upload_sessions_collection.update_one({"_id": upload_id}, {"$set": {"status": "aborted", "updatedAt": _now().isoformat()}})
+    _remove_part(upload_id)
+    return Response(status_code=204, headers=_cors_headers())
@@ -1,5 +1,9 @@
 from fastapi import APIRouter, Request, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from starlette import status
+from app.bootstrap_cache import bootstrap_cache
+from app.membership_cache import membership_cache, space_member_ids
+from app.recommendations import recommendations
 from app.database import spaces_collection, users_collection
 from app.routes.messages import _get_user_id_from_request
 from app.ws_manager import manager
@@ -16,24 +20,41 @@ def _space_id_candidates(space_id):
         pass
     return candidates
 
+def _membership_filter(user_id):
+    return {
+        "$or": [
+            {"ownerId": user_id},
+            {"ownerId": str(user_id)},
+            {"createdBy": user_id},
+            {"createdBy": str(user_id)},
+            {"members": {"$in": [user_id, str(user_id)]}},
+            {"channels.members": {"$in": [user_id, str(user_id)]}},
+        ]
+    }
+
+
+def member_space_ids(user_id):
+    """Ids of every space the user owns or belongs to (space or channel member)."""
+    if user_id is None:
+        return []
+    return [doc.get("id") for doc in spaces_collection.find(_membership_filter(user_id), {"_id": 0, "id": 1})]
+
+
+def _is_space_member(space, user_id):
+    uid = str(user_id)
+    if str(space.get("ownerId")) == uid or str(space.get("createdBy")) == uid:
+        return True
+    if any(str(m) == uid for m in space.get("members") or []):
+        return True
+    return any(str(m) == uid for ch in space.get("channels") or [] for m in ch.get("members") or [])
+
+
 @router.get("/")
 def get_spaces(request: Request):
     user_id = _get_user_id_from_request(request)
     if user_id is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication required")
-    spaces = list(spaces_collection.find(
-        {
-            "$or": [
-                {"ownerId": user_id},
-                {"ownerId": str(user_id)},
-                {"createdBy": user_id},
-                {"createdBy": str(user_id)},
-                {"members": {"$in": [user_id, str(user_id)]}},
-                {"channels.members": {"$in": [user_id, str(user_id)]}},
-            ]
-        },
-        {"_id": 0},
-    ))
+    spaces = list(spaces_collection.find(_membership_filter(user_id), {"_id": 0}))
 
     # Normalize legacy records in-memory for reads; avoid writes on hot read paths.
     for space in spaces:
@@ -64,12 +85,22 @@ def get_spaces(request: Request):
 
 
 @router.post("/channel/role")
-def set_channel_role(request: Request, payload: dict):
+async def set_channel_role(request: Request, payload: dict):
     """Set a user's role in a channel. Only space Owner can promote/demote to Owner/Admin."""
     user_id = _get_user_id_from_request(request)
     if user_id is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication required")
 
+    space_id, channel_id, roles = await run_in_threadpool(_apply_channel_role, user_id, payload)
+    # broadcast role change to everyone subscribed to the space
+    try:
+        await manager.publish_space(space_id, {'type': 'channel_roles_updated', 'space_id': space_id, 'channel_id': channel_id, 'roles': roles})
+    except Exception:
+        pass
+    return {'status': 'ok', 'roles': roles}
+
+
+def _apply_channel_role(user_id, payload: dict):
     space_id = payload.get('space_id')
     channel_id = payload.get('channel_id')
     target_user = payload.get('user_id')
@@ -99,23 +130,39 @@ def set_channel_role(request: Request, payload: dict):
 
     if updated:
         spaces_collection.update_one({'id': space_id}, {'$set': {'channels': channels}})
-        # broadcast role change
-        try:
-            manager.broadcast(str(space_id), {'type': 'channel_roles_updated', 'space_id': space_id, 'channel_id': channel_id, 'roles': roles})
-        except Exception:
-            pass
-        return {'status': 'ok', 'roles': roles}
+        bootstrap_cache.invalidate_space(space_id)
+        return space_id, channel_id, roles
 
     raise HTTPException(status_code=404, detail='Channel not found')
 
 
 @router.post('/channel/member')
-def modify_channel_member(request: Request, payload: dict):
+async def modify_channel_member(request: Request, payload: dict):
     """Add or remove a member from a channel. Owner/Admin allowed (Owner required for owner role changes)."""
     user_id = _get_user_id_from_request(request)
     if user_id is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication required")
 
+    change = await run_in_threadpool(_apply_channel_member_change, user_id, payload)
+    space_id = change['space_id']
+    target_user = change['target_user']
+    event = {'type': 'channel_member_changed', 'space_id': space_id, 'channel_id': change['channel_id'], 'members': change['members'], 'roles': change['roles']}
+
+    # Added users join the space topic before the event goes out so their
+    # other tabs see it; removed users hear it once before they leave.
+    if change['still_member']:
+        manager.subscribe_user_to_space(target_user, space_id)
+    try:
+        await manager.publish_space(space_id, event)
+    except Exception:
+        pass
+    if not change['still_member']:
+        manager.unsubscribe_user_from_space(target_user, space_id)
+
+    return {'status': 'ok', 'members': change['members'], 'roles': change['roles']}
+
+
+def _apply_channel_member_change(user_id, payload: dict):
     action = payload.get('action')  # 'add' or 'remove'
     space_id = payload.get('space_id')
     channel_id = payload.get('channel_id')
@@ -186,21 +233,45 @@ def modify_channel_member(request: Request, payload: dict):
             break
 
     spaces_collection.update_one({'id': space_id}, {'$set': {'channels': channels}})
-
-    # broadcast change
-    try:
-        manager.broadcast(str(space_id), {'type': 'channel_member_changed', 'space_id': space_id, 'channel_id': channel_id, 'members': members, 'roles': roles_map})
-    except Exception:
-        pass
-
-    return {'status': 'ok', 'members': members, 'roles': roles_map}
+    bootstrap_cache.invalidate_space(space_id)
+    membership_cache.invalidate_space(space_id, target_user)
+
+    space['channels'] = channels
+    return {
+        'space_id': space_id,
+        'channel_id': channel_id,
+        'target_user': target_user,
+        'members': members,
+        'roles': roles_map,
+        'still_member': _is_space_member(space, target_user),
+    }
 
 @router.post("/")
-def save_space(request: Request, space: dict):
+async def save_space(request: Request, space: dict):
     user_id = _get_user_id_from_request(request)
     if user_id is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication required")
 
+    space, roles_broadcasts = await run_in_threadpool(_persist_space, user_id, space)
+
+    # Make sure every member's open sockets follow this space before any event
+    member_ids = {str(m) for m in space.get("members") or [] if m is not None}
+    for ch in space.get("channels") or []:
+        member_ids.update(str(m) for m in ch.get("members") or [] if m is not None)
+    for member_id in member_ids:
+        manager.subscribe_user_to_space(member_id, space["id"])
+
+    # Broadcast roles for newly created channels so clients update in real-time
+    for rb in roles_broadcasts:
+        try:
+            await manager.publish_space(rb['space_id'], {'type': 'channel_roles_updated', 'space_id': rb['space_id'], 'channel_id': rb['channel_id'], 'roles': rb['roles']})
+        except Exception:
+            pass
+
+    return space
+
+
+def _persist_space(user_id, space: dict):
     # Ensure creator is in members array
     existing = spaces_collection.find_one({"id": space.get("id")})
     if existing:
@@ -257,15 +328,10 @@ def save_space(request: Request, space: dict):
             {"id": space["id"]},
             {"$set": {"channels": channels, "members": space["members"]}}
         )
+    bootstrap_cache.invalidate_space(space["id"])
+    membership_cache.invalidate_space(space["id"], *space_member_ids(space))
 
-    # Broadcast roles for newly created channels so clients update in real-time
-    for rb in roles_broadcasts:
-        try:
-            manager.broadcast(str(rb['space_id']), {'type': 'channel_roles_updated', 'space_id': rb['space_id'], 'channel_id': rb['channel_id'], 'roles': rb['roles']})
-        except Exception:
-            pass
-
-    return space
+    return space, roles_broadcasts
 
 @router.delete("/{space_id}")
 async def delete_space(request: Request, space_id: str):
@@ -289,6 +355,9 @@ async def delete_space(request: Request, space_id: str):
     result = spaces_collection.delete_one({"id": stored_space_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Space not found")
+    bootstrap_cache.invalidate_space(stored_space_id)
+    membership_cache.invalidate_space(stored_space_id)
+    recommendations.mark_dirty(*(space.get("members") or []))
 
     users_collection.update_many(
         {"spaces": {"$in": space_ids}},
@@ -313,6 +382,7 @@ async def delete_space(request: Request, space_id: str):
             })
         except Exception:
             pass
+    manager.drop_space_topic(stored_space_id)
 
     return {"status": "deleted", "spaceId": stored_space_id}
 
@@ -1,16 +1,41 @@
-from fastapi import APIRouter, UploadFile, File, BackgroundTasks, HTTPException, Request, Response
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
 from starlette import status
-from app.database import files_collection, messages_collection
-from app.deps import get_request_user
-from app.routes.messages import _check_channel_access
+from app.core.file_storage import (
+    content_length,
+    dedupe_report,
+    has_content,
+    iter_file_chunks,
+    iter_file_range,
+    local_path,
+    record_access,
+    release_content,
+    store_deduplicated,
+)
+from app.core.previews import (
+    DEFAULT_THUMBNAIL_SIZE,
+    delete_previews,
+    get_or_render_preview,
+    is_previewable,
+    queue_previews,
+    thumbnail_size,
+)
+from app.core.avatars import AVATAR_FILE_PURPOSE
+from app.core.attachment_refs import attachment_file_ids, chat_ids_for_file, refs_ready
+from app.core.signed_urls import seconds_until, sign_file_url, signed_expiry, verify_file_signature
+from app.core.zip_stream import stream_zip, unique_archive_names
+from app.database import attachment_refs_collection, files_collection, messages_collection
+from app.deps import get_request_user, require_admin_user
+from app.routes.messages import _accessible_chat_ids, _check_channel_access, _has_access_to_any_chat
+from app.upload_workers import UploadQueueFull, upload_workers
+from app.ws_manager import manager
 import tempfile
+import hashlib
 import os
-import shutil
+import re
 from datetime import datetime, timezone
 from bson import ObjectId
-from bson.binary import Binary
-import io
 import logging
 from pymongo.errors import PyMongoError
 
@@ -21,7 +46,7 @@ logger = logging.getLogger("app.routes.upload")
 def _cors_headers():
     return {
         "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+        "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
         "Access-Control-Allow-Headers": "*",
     }
 
@@ -34,44 +59,66 @@ def options_file_metadata(file_id: str):
 def options_file_download(file_id: str):
     return Response(status_code=200, headers=_cors_headers())
 
-# Directory to store uploaded files inside the backend
-STORAGE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "uploaded_files"))
-os.makedirs(STORAGE_DIR, exist_ok=True)
+@router.options("/file/{file_id}/thumbnail")
+def options_file_thumbnail(file_id: str):
+    return Response(status_code=200, headers=_cors_headers())
+
+@router.options("/archive")
+def options_archive():
+    return Response(status_code=200, headers=_cors_headers())
+
+TEMP_COPY_CHUNK_BYTES = 1024 * 1024
 
 
 def _save_temp(upload: UploadFile):
-    # Save uploaded file to a temporary file and return path and size
+    # Save uploaded file to a temporary file and return path, size and SHA-256,
+    # hashing while the bytes stream through so the file is only read once
     suffix = ""
     if upload.filename and "." in upload.filename:
         suffix = "." + upload.filename.rsplit(".", 1)[1]
 
+    digest = hashlib.sha256()
     tf = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
     try:
-        shutil.copyfileobj(upload.file, tf)
+        while True:
+            chunk = upload.file.read(TEMP_COPY_CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+            tf.write(chunk)
         tf.flush()
         size = os.path.getsize(tf.name)
-        return tf.name, size
+        return tf.name, size, digest.hexdigest()
     finally:
         tf.close()
 
 
-def _do_upload_and_update(doc_id, path, name, mime_type):
+def _do_upload_and_update(doc_id, path, name, mime_type, sha256):
+    """Store an accepted upload and return the status event sent to the uploader."""
     try:
-        # Read file bytes and store them in MongoDB (files_collection)
+        # Link to identical content if it is already stored, otherwise hand the
+        # temp file to the active storage backend; the metadata doc keeps a pointer
         try:
-            with open(path, "rb") as f:
-                data = f.read()
+            final_size = os.path.getsize(path)
+            stored, deduplicated = store_deduplicated(path, name, sha256, final_size, file_doc_id=doc_id)
         except Exception as e:
             files_collection.update_one({"_id": doc_id}, {"$set": {"status": "error", "error": str(e)}})
-            return
-
-        final_size = len(data) if data is not None else None
+            return {"fileId": str(doc_id), "filename": name, "status": "error", "error": str(e)}
 
         download_path = f"/upload/file/{str(doc_id)}/download"
 
-        files_collection.update_one({"_id": doc_id}, {"$set": {"status": "done", "fileId": str(doc_id), "name": name, "size": final_size, "webViewLink": download_path, "data": Binary(data)}})
+        files_collection.update_one({"_id": doc_id}, {"$set": {"status": "done", "fileId": str(doc_id), "name": name, "size": final_size, "webViewLink": download_path, "sha256": sha256, "deduplicated": deduplicated, "contentLinked": True, **stored}})
+
+        # Preview stage: thumbnails render in the preview process pool and are
+        # stored when ready; failures only mean the thumbnail is built lazily
+        try:
+            queue_previews({"_id": doc_id, "filename": name, "mimetype": mime_type, "sha256": sha256, **stored, "size": final_size})
+        except Exception as e:
+            logger.warning("Failed to queue previews for file %s: %s", doc_id, e)
+        return {"fileId": str(doc_id), "filename": name, "status": "done", "size": final_size, "webViewLink": download_path}
     except Exception as e:
         files_collection.update_one({"_id": doc_id}, {"$set": {"status": "error", "error": str(e)}})
+        return {"fileId": str(doc_id), "filename": name, "status": "error", "error": str(e)}
     finally:
         # Ensure temp file is removed
         try:
@@ -81,6 +128,29 @@ def _do_upload_and_update(doc_id, path, name, mime_type):
             pass
 
 
+def _status_notifier(user_id):
+    async def _notify(result):
+        if result:
+            await manager.send_to_user(str(user_id), {"type": "upload_status", **result})
+    return _notify
+
+
+def _queue_full_response(exc: UploadQueueFull):
+    return JSONResponse(
+        {"error": "upload queue full", "retry_after": exc.retry_after},
+        status_code=429,
+        headers={**_cors_headers(), "Retry-After": str(exc.retry_after)},
+    )
+
+
+def enqueue_upload(user_id, doc_id, path, name, mime_type, sha256):
+    """Hand an accepted upload to the worker pool; the caller must hold a reservation."""
+    upload_workers.submit(
+        _do_upload_and_update, doc_id, path, name, mime_type, sha256,
+        on_complete=_status_notifier(user_id),
+    )
+
+
 def _owns_file(user, doc):
     if not user or not doc:
         return False
@@ -91,6 +161,20 @@ def _file_is_attached_to_accessible_chat(user, file_id: str):
     if not user or not file_id:
         return False
 
+    try:
+        chat_ids = chat_ids_for_file(file_id)
+        if _has_access_to_any_chat(chat_ids, user.get("id")):
+            return True
+        if refs_ready():
+            return False
+    except Exception as e:
+        logger.warning("Attachment ref lookup failed for file %s: %s", file_id, e)
+
+    # Until the attachment_refs backfill has run, fall back to scanning messages
+    return _scan_messages_for_attachment(user, file_id)
+
+
+def _scan_messages_for_attachment(user, file_id: str):
     attachment_match = {
         "$or": [
             {"message.attachments.fileId": file_id},
@@ -113,22 +197,32 @@ def _file_is_attached_to_accessible_chat(user, file_id: str):
 
 
 def _can_access_file(user, file_id: str, doc):
+    # Avatars are shown on every user card, like the inline images they replace
+    if doc.get("purpose") == AVATAR_FILE_PURPOSE:
+        return bool(user)
     return _owns_file(user, doc) or _file_is_attached_to_accessible_chat(user, file_id)
 
 
 @router.post("/file")
-async def upload_file(request: Request, background: BackgroundTasks, file: UploadFile = File(...)):
+async def upload_file(request: Request, file: UploadFile = File(...)):
     user = get_request_user(request)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication required")
-    # Accept file and schedule upload in background so chat routes are not blocked.
+    # Accept file and hand it to the upload workers so chat routes are not blocked.
     if not file:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No file uploaded")
 
-    # Save to temp file quickly
+    # Refuse when the workers are already saturated. Starlette has spooled the
+    # multipart body by now; this saves the temp copy, hashing and storage work
+    try:
+        upload_workers.reserve()
+    except UploadQueueFull as exc:
+        return _queue_full_response(exc)
+
     try:
-        tmp_path, size = _save_temp(file)
+        tmp_path, size, sha256 = await run_in_threadpool(_save_temp, file)
     except Exception as e:
+        upload_workers.release()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
     doc = {
@@ -140,11 +234,16 @@ async def upload_file(request: Request, background: BackgroundTasks, file: Uploa
         # Use UTC ISO string so clients can convert to local time reliably
         "createdAt": datetime.now(timezone.utc).isoformat(),
     }
-    res = files_collection.insert_one(doc)
+    try:
+        res = await run_in_threadpool(files_collection.insert_one, doc)
+    except Exception:
+        upload_workers.release()
+        os.remove(tmp_path)
+        raise
     doc_id = res.inserted_id
 
-    # Schedule background upload
-    background.add_task(_do_upload_and_update, doc_id, tmp_path, file.filename, file.content_type)
+    # Completion (or failure) is pushed to the uploader as an upload_status event
+    enqueue_upload(user.get("id"), doc_id, tmp_path, file.filename, file.content_type, sha256)
 
     # Return metadata document (without blocking for Drive upload)
     return {"status": "accepted", "file_id": str(doc_id), "filename": file.filename, "size": size}
@@ -160,7 +259,7 @@ def get_file_metadata(request: Request, file_id: str):
     except Exception:
         return JSONResponse({"error": "invalid id"}, headers=_cors_headers())
     try:
-        doc = files_collection.find_one({"_id": oid}, {"_id": 0, "data": 0})
+        doc = files_collection.find_one({"_id": oid}, {"_id": 0, "data": 0, "blobId": 0, "storageKey": 0, "driveFileId": 0, "contentLinked": 0})
     except PyMongoError as exc:
         logger.error("Failed to fetch metadata for file %s: %s", file_id, exc)
         return JSONResponse(
@@ -186,14 +285,99 @@ def get_file_metadata(request: Request, file_id: str):
     # For image/pdf preview, allow `previewUrl` to point to same download endpoint
     if not doc.get("previewUrl"):
         doc["previewUrl"] = web_link
+    # Galleries and file tabs should load the small rendered variant instead
+    if doc.get("status") == "done" and is_previewable(doc):
+        doc.setdefault("thumbnailLink", f"/upload/file/{file_id}/thumbnail?size={DEFAULT_THUMBNAIL_SIZE}")
+
+    # Short-lived links that skip the user/access lookups on every fetch; only
+    # hand them out for content the caller may already read, and never persist them
+    if doc.get("status") == "done":
+        expires = signed_expiry()
+        doc["signedDownloadLink"] = sign_file_url(f"/upload/file/{file_id}/download", file_id, expires)
+        if doc.get("thumbnailLink"):
+            doc["signedThumbnailLink"] = sign_file_url(doc["thumbnailLink"], file_id, expires)
+        doc["signedLinkExpiresAt"] = datetime.fromtimestamp(expires, timezone.utc).isoformat()
 
     return JSONResponse(doc, headers=_cors_headers())
 
 
+# Content behind a file id never changes, so responses can be cached for good.
+# `private` because downloads are authorized per user.
+DOWNLOAD_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# A single byte range; multi-range requests get the whole file
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _signed_request(request: Request, file_id: str):
+    """Expiry of a valid exp/sig pair on the request, or None."""
+    expires = request.query_params.get("exp")
+    if expires and verify_file_signature(file_id, expires, request.query_params.get("sig")):
+        return int(expires)
+    return None
+
+
+def _cache_control(signed_expires):
+    # A signed URL is itself the credential, so shared caches may keep the
+    # response, but not beyond the link's own expiry
+    if signed_expires:
+        return f"public, max-age={seconds_until(signed_expires)}, immutable"
+    return DOWNLOAD_CACHE_CONTROL
+
+
+class _RangeNotSatisfiable(Exception):
+    pass
+
+
+def _file_etag(doc):
+    # Strong validator: derived from the content hash, or from the immutable
+    # blob id for files stored before hashes were recorded
+    if doc.get("sha256"):
+        return f'"{doc["sha256"]}"'
+    if doc.get("blobId") is not None:
+        return f'"blob-{doc["blobId"]}"'
+    return None
+
+
+def _etag_matches(header_value, etag):
+    if not header_value or not etag:
+        return False
+    if header_value.strip() == "*":
+        return True
+    return any(candidate.strip() == etag for candidate in header_value.split(","))
+
+
+def _parse_range(header_value, size: int):
+    """Return (start, end) for a single byte range, or None to serve the whole file.
+
+    Multi-range and malformed headers are ignored (full 200 response), which
+    RFC 9110 permits; syntactically valid but unsatisfiable ranges raise.
+    """
+    if not header_value:
+        return None
+    match = _RANGE_RE.match(header_value.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise _RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise _RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
 @router.get("/file/{file_id}/download")
 def download_file(request: Request, file_id: str):
-    user = get_request_user(request)
-    if not user:
+    signed_expires = _signed_request(request, file_id)
+    user = None if signed_expires else get_request_user(request)
+    if not signed_expires and not user:
         return JSONResponse({"error": "authentication required"}, status_code=401, headers=_cors_headers())
     try:
         oid = ObjectId(file_id)
@@ -203,7 +387,7 @@ def download_file(request: Request, file_id: str):
     try:
         doc = files_collection.find_one(
             {"_id": oid},
-            {"filename": 1, "mimetype": 1, "data": 1, "userId": 1},
+            {"filename": 1, "mimetype": 1, "storage": 1, "blobId": 1, "storageKey": 1, "driveFileId": 1, "data": 1, "userId": 1, "size": 1, "sha256": 1, "purpose": 1},
         )
     except PyMongoError as exc:
         logger.error("Failed to download file %s: %s", file_id, exc)
@@ -214,25 +398,250 @@ def download_file(request: Request, file_id: str):
         )
     if not doc:
         return JSONResponse({"error": "not found"}, status_code=404, headers=_cors_headers())
-    if not _can_access_file(user, file_id, doc):
+    if not signed_expires and not _can_access_file(user, file_id, doc):
         return JSONResponse({"error": "forbidden"}, status_code=403, headers=_cors_headers())
 
-    data = doc.get("data")
-    if not data:
+    if not has_content(doc):
         return JSONResponse({"error": "file not found"}, status_code=404, headers=_cors_headers())
-
-    # `data` may be a bson.Binary; convert to bytes
     try:
-        raw = bytes(data)
-    except Exception:
-        raw = data
+        record_access(doc)
+    except PyMongoError as exc:
+        logger.warning("Failed to record access for file %s: %s", file_id, exc)
+
+    size = content_length(doc) or 0
+    etag = _file_etag(doc)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": _cache_control(signed_expires),
+        "Access-Control-Expose-Headers": "Accept-Ranges, Content-Length, Content-Range, ETag",
+        **_cors_headers(),
+    }
+    if etag:
+        headers["ETag"] = etag
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    # Only honour Range when If-Range is absent or still matches our ETag
+    if not if_range or (etag and if_range.strip() == etag):
+        try:
+            byte_range = _parse_range(request.headers.get("range"), size)
+        except _RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
 
     # Use inline disposition so browsers can preview images / PDFs; user can still save from UI
+    headers["Content-Disposition"] = f"inline; filename=\"{doc.get('filename')}\""
+    # Keep GZipMiddleware away from file bodies: compressing would invalidate
+    # Content-Length / Content-Range, and most uploads are already compressed
+    headers["Content-Encoding"] = "identity"
+
+    path = local_path(doc)
+    if path:
+        # Zero-copy path: FileResponse sends the file itself (pathsend where
+        # the server supports it) and applies Range / If-Range using our ETag
+        return FileResponse(path, media_type=doc.get("mimetype"), headers=headers)
+
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            iter_file_range(doc, start, end),
+            status_code=206,
+            media_type=doc.get("mimetype"),
+            headers=headers,
+        )
+
+    headers["Content-Length"] = str(size)
     return StreamingResponse(
-        io.BytesIO(raw),
+        iter_file_chunks(doc),
         media_type=doc.get("mimetype"),
-        headers={
-            "Content-Disposition": f"inline; filename=\"{doc.get('filename')}\"",
-            **_cors_headers()
-        }
+        headers=headers,
     )
+
+
+@router.get("/file/{file_id}/thumbnail")
+def get_file_thumbnail(request: Request, file_id: str, size: int = DEFAULT_THUMBNAIL_SIZE):
+    signed_expires = _signed_request(request, file_id)
+    user = None if signed_expires else get_request_user(request)
+    if not signed_expires and not user:
+        return JSONResponse({"error": "authentication required"}, status_code=401, headers=_cors_headers())
+    try:
+        oid = ObjectId(file_id)
+    except Exception:
+        return JSONResponse({"error": "invalid id"}, status_code=400, headers=_cors_headers())
+
+    doc = files_collection.find_one(
+        {"_id": oid},
+        {"filename": 1, "mimetype": 1, "storage": 1, "blobId": 1, "storageKey": 1, "driveFileId": 1, "data": 1, "userId": 1, "size": 1, "sha256": 1, "status": 1, "purpose": 1},
+    )
+    if not doc:
+        return JSONResponse({"error": "not found"}, status_code=404, headers=_cors_headers())
+    if not signed_expires and not _can_access_file(user, file_id, doc):
+        return JSONResponse({"error": "forbidden"}, status_code=403, headers=_cors_headers())
+    if doc.get("status") != "done" or not is_previewable(doc):
+        return JSONResponse({"error": "no preview available"}, status_code=404, headers=_cors_headers())
+
+    variant_size = thumbnail_size(size)
+    etag = f'"{doc.get("sha256") or file_id}-{variant_size}"'
+    headers = {"ETag": etag, "Cache-Control": _cache_control(signed_expires), **_cors_headers()}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        preview = get_or_render_preview(doc, variant_size)
+    except Exception as e:
+        logger.warning("Thumbnail render failed for file %s: %s", file_id, e)
+        preview = None
+    if not preview:
+        return JSONResponse({"error": "no preview available"}, status_code=404, headers=_cors_headers())
+
+    return Response(content=bytes(preview["data"]), media_type=preview.get("mimetype"), headers=headers)
+
+
+ARCHIVE_MAX_FILES = int(os.getenv("ARCHIVE_MAX_FILES", "500"))
+_ARCHIVE_PROJECTION = {"filename": 1, "mimetype": 1, "storage": 1, "blobId": 1, "storageKey": 1, "driveFileId": 1, "data": 1, "userId": 1, "size": 1, "sha256": 1, "status": 1, "createdAt": 1}
+
+
+def _object_ids(values):
+    oids = []
+    for value in values:
+        try:
+            oids.append(ObjectId(str(value)))
+        except Exception:
+            continue
+    return oids
+
+
+class _ArchiveTooLarge(Exception):
+    pass
+
+
+def _archive_docs_for_chat(user, chat_id: str):
+    """Files attached anywhere in a chat, in message order, if the user can read it.
+
+    Raises _ArchiveTooLarge when the chat has more than ARCHIVE_MAX_FILES.
+    """
+    if not _check_channel_access(chat_id, user.get("id")):
+        return None
+    file_ids = []
+    cursor = messages_collection.find(
+        {"chatId": chat_id, "message.attachments.0": {"$exists": True}},
+        {"message.attachments": 1},
+    ).sort("message.timestamp", 1)
+    for message_doc in cursor:
+        for file_id in attachment_file_ids(message_doc.get("message")):
+            if file_id not in file_ids:
+                file_ids.append(file_id)
+        if len(file_ids) > ARCHIVE_MAX_FILES:
+            raise _ArchiveTooLarge()
+    oids = _object_ids(file_ids)
+    docs = {str(doc["_id"]): doc for doc in files_collection.find({"_id": {"$in": oids}}, _ARCHIVE_PROJECTION)}
+    return [docs[str(oid)] for oid in oids if str(oid) in docs]
+
+
+def _archive_docs_for_ids(user, file_ids):
+    """Requested files, checked in bulk; returns (docs, forbidden ids)."""
+    oids = _object_ids(file_ids)
+    docs = {str(doc["_id"]): doc for doc in files_collection.find({"_id": {"$in": oids}}, _ARCHIVE_PROJECTION)}
+    unowned = [file_id for file_id, doc in docs.items() if not _owns_file(user, doc)]
+
+    allowed = set()
+    if unowned:
+        chats_by_file = {}
+        for ref in attachment_refs_collection.find({"fileIds": {"$in": unowned}}, {"chatId": 1, "fileIds": 1}):
+            for file_id in ref.get("fileIds") or []:
+                chats_by_file.setdefault(file_id, set()).add(ref.get("chatId"))
+        readable = _accessible_chat_ids(set().union(*chats_by_file.values()) if chats_by_file else set(), user.get("id"))
+        allowed = {file_id for file_id in unowned if chats_by_file.get(file_id, set()) & readable}
+        if not refs_ready():
+            allowed |= {file_id for file_id in unowned if file_id not in allowed and _scan_messages_for_attachment(user, file_id)}
+
+    forbidden = [file_id for file_id in unowned if file_id not in allowed]
+    ordered = [docs[str(oid)] for oid in oids if str(oid) in docs and str(oid) not in forbidden]
+    return ordered, forbidden
+
+
+def _archive_entries(docs):
+    names = unique_archive_names(doc.get("filename") for doc in docs)
+    for name, doc in zip(names, docs):
+        yield name, content_length(doc) or doc.get("size") or 0, doc.get("mimetype"), doc.get("createdAt"), (lambda doc=doc: iter_file_chunks(doc))
+
+
+@router.get("/archive")
+def download_archive(request: Request, ids: str = "", chat_id: str = ""):
+    """Stream a ZIP of several files (?ids=a,b,c) or of every attachment in a chat (?chat_id=)."""
+    user = get_request_user(request)
+    if not user:
+        return JSONResponse({"error": "authentication required"}, status_code=401, headers=_cors_headers())
+
+    if chat_id:
+        try:
+            docs = _archive_docs_for_chat(user, chat_id)
+        except _ArchiveTooLarge:
+            return JSONResponse(
+                {"error": f"chat has more than {ARCHIVE_MAX_FILES} files; download them by ids in batches"},
+                status_code=400,
+                headers=_cors_headers(),
+            )
+        if docs is None:
+            return JSONResponse({"error": "forbidden"}, status_code=403, headers=_cors_headers())
+        archive_name = f"chat-{re.sub(r'[^A-Za-z0-9_.-]', '_', chat_id)}-files.zip"
+    else:
+        requested = [value.strip() for value in ids.split(",") if value.strip()]
+        if not requested:
+            return JSONResponse({"error": "ids or chat_id required"}, status_code=400, headers=_cors_headers())
+        if len(requested) > ARCHIVE_MAX_FILES:
+            return JSONResponse({"error": f"at most {ARCHIVE_MAX_FILES} files per archive"}, status_code=400, headers=_cors_headers())
+        docs, forbidden = _archive_docs_for_ids(user, requested)
+        if forbidden:
+            return JSONResponse({"error": "forbidden", "fileIds": forbidden}, status_code=403, headers=_cors_headers())
+        archive_name = "files.zip"
+
+    docs = [doc for doc in docs if doc.get("status", "done") == "done" and has_content(doc)]
+    if not docs:
+        return JSONResponse({"error": "no files to archive"}, status_code=404, headers=_cors_headers())
+
+    headers = {
+        "Content-Disposition": f"attachment; filename=\"{archive_name}\"",
+        "Cache-Control": "private, no-store",
+        # Entries are already deflated where it helps; keep GZipMiddleware off
+        "Content-Encoding": "identity",
+        **_cors_headers(),
+    }
+    return StreamingResponse(stream_zip(_archive_entries(docs)), media_type="application/zip", headers=headers)
+
+
+@router.delete("/file/{file_id}")
+def delete_file(request: Request, file_id: str):
+    user = get_request_user(request)
+    if not user:
+        return JSONResponse({"error": "authentication required"}, status_code=401, headers=_cors_headers())
+    try:
+        oid = ObjectId(file_id)
+    except Exception:
+        return JSONResponse({"error": "invalid id"}, status_code=400, headers=_cors_headers())
+
+    doc = files_collection.find_one({"_id": oid}, {"data": 0})
+    if not doc:
+        return JSONResponse({"error": "not found"}, status_code=404, headers=_cors_headers())
+    if not _owns_file(user, doc):
+        return JSONResponse({"error": "forbidden"}, status_code=403, headers=_cors_headers())
+
+    # Remove the record first so nothing new is served from it, then drop its
+    # content reference; shared bytes stay until their last reference goes
+    files_collection.delete_one({"_id": oid})
+    try:
+        if release_content(doc):
+            delete_previews(doc)
+    except Exception as e:
+        logger.error("Failed to release content for file %s: %s", file_id, e)
+
+    return JSONResponse({"status": "deleted", "file_id": file_id}, headers=_cors_headers())
+
+
+@router.get("/dedupe/report")
+def get_dedupe_report(admin=Depends(require_admin_user)):
+    return dedupe_report()
@@ -3,21 +3,34 @@ import json
 import re
 import time
 import urllib.request
+from collections import Counter
 from urllib.parse import urlparse, urlunparse
 
 from bson import ObjectId
 from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pymongo import UpdateOne
 from pymongo.errors import PyMongoError
 
-from app.auth import create_access_token, hash_password, verify_password
+from app.auth import create_access_token
+from app.bootstrap_cache import bootstrap_cache
+from app.core.avatars import avatar_file_url, is_data_url, release_avatar, store_avatar
+from app.core.json_response import FastJSONResponse
+from app.core.connections import connections_ready, relationship_states
+from app.core.user_search import build_search_tokens, relevance, search_terms, token_filter
 from app.database import organizations_collection, spaces_collection, users_collection
+from app.membership_cache import membership_cache
+from app.password_hasher import PasswordHashingBusy, password_hasher
+from app.profile_fanout import profile_fanout
+from app.recommendations import recommendations
 from app.deps import clear_auth_cookie, get_request_user, set_auth_cookie
 from app.models import ProfessionalProfilePayload
+from app.routes.orgs import is_public_domain
 from app.ws_manager import manager
 
 logger = logging.getLogger("app.routes.users")
 
-USER_LIST_PROJECTION = {"_id": 0, "password": 0, "notifications": 0}
+USER_LIST_PROJECTION = {"_id": 0, "password": 0, "notifications": 0, "search_tokens": 0}
 SPACE_LIST_PROJECTION = {"_id": 0}
 FRIEND_CARD_PROJECTION = {
     "_id": 0,
@@ -37,6 +50,7 @@ FRIEND_CARD_PROJECTION = {
     "isOnline": 1,
     "status": 1,
     "lastActive": 1,
+    "profile_normalized": 1,
 }
 USER_SEARCH_PROJECTION = {
     "_id": 0,
@@ -55,13 +69,65 @@ USER_SEARCH_PROJECTION = {
     "avatar_preset": 1,
     "avatar_version": 1,
     "avatar_updated_at": 1,
+    "profile_normalized": 1,
     "notifications.id": 1,
     "notifications.type": 1,
     "notifications.status": 1,
     "notifications.fromId": 1,
 }
 MAX_SEARCH_LIMIT = 50
+# Recommendation scoring weights and candidate caps
+RECOMMENDATION_SHARED_SPACE_WEIGHT = 3
+RECOMMENDATION_MUTUAL_WEIGHT = 2
+RECOMMENDATION_SAME_ORG_WEIGHT = 1
+RECOMMENDATION_ORG_SAMPLE = 200
+USER_LIST_DEFAULT_LIMIT = 200
+USER_LIST_MAX_LIMIT = 500
+# Top-level fields a client may ask for with GET /users/?fields=
+USER_LIST_SELECTABLE_FIELDS = {
+    "name",
+    "email",
+    "professionalProfile",
+    "avatar_url",
+    "avatar_preset",
+    "avatar_version",
+    "avatar_updated_at",
+    "isOnline",
+    "status",
+    "lastActive",
+    "organizationId",
+    "role",
+    "friends",
+    "spaces",
+    "invitePermissions",
+}
 PROFILE_FIELD_ALIASES = ("companyName", "position", "linkedInUrl", "linkedinUrl", "linkedinURL")
+PROFILE_SOURCE_FIELDS = ("professionalProfile", *PROFILE_FIELD_ALIASES)
+# What other users may see of a user; auth, integrations, notifications and
+# index fields never leave the server for anyone but the user themselves
+PUBLIC_USER_FIELDS = (
+    "id",
+    "name",
+    "email",
+    "avatar_url",
+    "avatar_preset",
+    "avatar_version",
+    "avatar_updated_at",
+    "status",
+    "isOnline",
+    "lastActive",
+    "role",
+    "organizationId",
+    "spaces",
+    "friends",
+    "invitePermissions",
+)
+PUBLIC_USER_PROJECTION = {
+    "_id": 0,
+    **{field: 1 for field in PUBLIC_USER_FIELDS},
+    **{field: 1 for field in PROFILE_SOURCE_FIELDS},
+    "profile_normalized": 1,
+}
 
 router = APIRouter(prefix="/users")
 
@@ -120,6 +186,7 @@ def build_user_index_fields(source):
         "email_normalized": normalize_email(email),
         "email_domain": extract_email_domain(email),
         "name_search": normalize_search_name(name),
+        "search_tokens": build_search_tokens(source),
     }
 
 
@@ -253,6 +320,7 @@ def normalize_professional_profile(source, strict=False):
 def build_profile_update_ops(profile):
     if not profile:
         return {
+            "$set": {"profile_normalized": True},
             "$unset": {
                 "professionalProfile": "",
                 "companyName": "",
@@ -260,7 +328,7 @@ def build_profile_update_ops(profile):
                 "linkedInUrl": "",
                 "linkedinUrl": "",
                 "linkedinURL": "",
-            }
+            },
         }
 
     set_doc = {
@@ -268,6 +336,7 @@ def build_profile_update_ops(profile):
         "companyName": profile.get("companyName"),
         "position": profile.get("position"),
         "linkedInUrl": profile.get("linkedInUrl"),
+        "profile_normalized": True,
     }
     unset_doc = {
         "linkedinUrl": "",
@@ -284,6 +353,22 @@ def build_profile_update_ops(profile):
     return ops
 
 
+def backfill_normalized_profiles(batch_size: int = 500):
+    """Store normalized profiles on users written before `profile_normalized` existed."""
+    projection = {"_id": 1, **{field: 1 for field in PROFILE_SOURCE_FIELDS}}
+    ops = []
+    updated = 0
+    for user in users_collection.find({"profile_normalized": {"$ne": True}}, projection).batch_size(batch_size):
+        ops.append(UpdateOne({"_id": user["_id"]}, build_profile_update_ops(normalize_professional_profile(user))))
+        if len(ops) >= batch_size:
+            updated += users_collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += users_collection.bulk_write(ops, ordered=False).modified_count
+    logger.info("Profile normalization backfill updated %d users", updated)
+    return {"updated": updated}
+
+
 def serialize_user(user, include_notifications=False):
     if not user:
         return None
@@ -293,6 +378,8 @@ def serialize_user(user, include_notifications=False):
     sanitized.pop("email_normalized", None)
     sanitized.pop("email_domain", None)
     sanitized.pop("name_search", None)
+    sanitized.pop("search_tokens", None)
+    sanitized.pop("profile_normalized", None)
 
     profile = normalize_professional_profile(sanitized)
     if profile:
@@ -317,8 +404,44 @@ def serialize_user(user, include_notifications=False):
     return sanitized
 
 
+def serialize_public_user(user):
+    """Fast `serialize_user` for other users: copies PUBLIC_USER_FIELDS only.
+
+    Profiles written through `build_profile_update_ops` are stored normalized
+    (`profile_normalized`), so only older documents pay for
+    `normalize_professional_profile`.
+    """
+    if not user:
+        return None
+
+    serialized = {field: user[field] for field in PUBLIC_USER_FIELDS if field in user}
+    organization_id = serialized.get("organizationId")
+    if isinstance(organization_id, ObjectId):
+        serialized["organizationId"] = str(organization_id)
+
+    if user.get("profile_normalized"):
+        profile = user.get("professionalProfile")
+    elif any(field in user for field in PROFILE_SOURCE_FIELDS):
+        profile = normalize_professional_profile(user)
+    else:
+        profile = None
+    if profile:
+        serialized["professionalProfile"] = profile
+
+    if not serialized.get("status") and isinstance(user.get("isOnline"), bool):
+        serialized["status"] = "online" if user["isOnline"] else "offline"
+    return serialized
+
+
 def build_bootstrap_payload(requester):
-    serialized_user = serialize_user(requester, include_notifications=True)
+    return {
+        "user": serialize_user(requester, include_notifications=True),
+        **build_bootstrap_relations(requester),
+    }
+
+
+def build_bootstrap_relations(requester):
+    """Friends, spaces and member profiles for the bootstrap payload (cached per user)."""
     friend_ids = requester.get("friends") or []
     space_ids = requester.get("spaces") or []
 
@@ -334,7 +457,7 @@ def build_bootstrap_payload(requester):
         seen.add(friend_id)
         friend = friends_by_id.get(friend_id)
         if friend:
-            ordered_friends.append(serialize_user(friend))
+            ordered_friends.append(serialize_public_user(friend))
 
     spaces_raw = fetch_spaces_by_ids(space_ids)
     spaces_by_id = {str(space.get("id")): space for space in spaces_raw if space.get("id") is not None}
@@ -381,7 +504,7 @@ def build_bootstrap_payload(requester):
             for member_id in (channel.get("roles") or {}).keys():
                 add_member_id(member_id)
 
-    members_raw = fetch_users_by_ids(member_ids, USER_LIST_PROJECTION)
+    members_raw = fetch_users_by_ids(member_ids, PUBLIC_USER_PROJECTION)
     members_by_id = {str(member.get("id")): member for member in members_raw if member.get("id") is not None}
     ordered_members = []
     seen_profile_ids = set()
@@ -392,10 +515,9 @@ def build_bootstrap_payload(requester):
         seen_profile_ids.add(member_id)
         member = members_by_id.get(member_id)
         if member:
-            ordered_members.append(serialize_user(member))
+            ordered_members.append(serialize_public_user(member))
 
     return {
-        "user": serialized_user,
         "friends": ordered_friends,
         "spaces": ordered_spaces,
         "users": ordered_members,
@@ -491,6 +613,10 @@ def fetch_spaces_by_ids(space_ids):
     return [normalize_space_record(space) for space in spaces]
 
 
+bootstrap_cache.builder = build_bootstrap_relations
+bootstrap_cache.loader = get_user_by_id
+
+
 def resolve_requester(request: Request):
     return get_request_user(request)
 
@@ -498,51 +624,7 @@ def resolve_requester(request: Request):
 def users_share_workspace(requester, candidate):
     if not requester or not candidate:
         return False
-
-    requester_id = requester.get("id")
-    candidate_id = candidate.get("id")
-    if requester_id is None or candidate_id is None:
-        return False
-
-    requester_ids = expand_user_ids_for_query([requester_id])
-    candidate_ids = expand_user_ids_for_query([candidate_id])
-    if not requester_ids or not candidate_ids:
-        return False
-
-    requester_space_ids = {str(space_id) for space_id in (requester.get("spaces") or []) if space_id is not None}
-    candidate_space_ids = {str(space_id) for space_id in (candidate.get("spaces") or []) if space_id is not None}
-    if requester_space_ids and requester_space_ids.intersection(candidate_space_ids):
-        return True
-
-    requester_membership_query = {
-        "$or": [
-            {"ownerId": {"$in": requester_ids}},
-            {"createdBy": {"$in": requester_ids}},
-            {"members": {"$in": requester_ids}},
-            {"channels.members": {"$in": requester_ids}},
-        ]
-    }
-    candidate_membership_query = {
-        "$or": [
-            {"ownerId": {"$in": candidate_ids}},
-            {"createdBy": {"$in": candidate_ids}},
-            {"members": {"$in": candidate_ids}},
-            {"channels.members": {"$in": candidate_ids}},
-        ]
-    }
-
-    requester_space_query_ids = expand_user_ids_for_query(list(requester_space_ids))
-    if requester_space_query_ids:
-        requester_membership_query["$or"].append({"id": {"$in": requester_space_query_ids}})
-
-    candidate_space_query_ids = expand_user_ids_for_query(list(candidate_space_ids))
-    if candidate_space_query_ids:
-        candidate_membership_query["$or"].append({"id": {"$in": candidate_space_query_ids}})
-
-    return bool(spaces_collection.find_one(
-        {"$and": [requester_membership_query, candidate_membership_query]},
-        {"_id": 1},
-    ))
+    return membership_cache.shares_space(requester.get("id"), candidate.get("id"))
 
 
 def can_requester_see_user(requester, candidate):
@@ -566,6 +648,78 @@ def can_requester_see_user(requester, candidate):
     return bool(requester_domain and requester_domain == candidate_domain)
 
 
+def organization_id_variants(organization_id):
+    variants = [organization_id, str(organization_id)]
+    if not isinstance(organization_id, ObjectId) and ObjectId.is_valid(str(organization_id)):
+        variants.append(ObjectId(str(organization_id)))
+    return variants
+
+
+def email_domain_filter(domain):
+    # Older documents may predate the email_domain index field
+    return {
+        "$or": [
+            {"email_domain": domain},
+            {"email_domain": {"$exists": False}, "email": {"$regex": f"@{re.escape(domain)}$", "$options": "i"}},
+        ]
+    }
+
+
+def build_organization_filter(requester, include_public_domains=True):
+    """Mongo filter for users in the requester's organization.
+
+    Same-org users, plus users without an organization on the requester's
+    email domain; by domain alone when the requester has no organization.
+    Matches `can_requester_see_user` for company-only requesters. With
+    `include_public_domains=False` a public email domain (gmail.com, ...)
+    does not count as an organization.
+    """
+    requester_domain = extract_email_domain(requester.get("email"))
+    if requester_domain and not include_public_domains and is_public_domain(requester_domain):
+        requester_domain = None
+    requester_org = requester.get("organizationId")
+    if requester_org:
+        branches = [{"organizationId": {"$in": organization_id_variants(requester_org)}}]
+        if requester_domain:
+            branches.append({
+                "$and": [
+                    {"organizationId": {"$in": [None, ""]}},
+                    email_domain_filter(requester_domain),
+                ]
+            })
+        return {"$or": branches}
+    if requester_domain:
+        return email_domain_filter(requester_domain)
+    return {"id": requester.get("id")}
+
+
+def build_visibility_filter(requester):
+    """Mongo equivalent of `can_requester_see_user`; None when unrestricted."""
+    permissions = requester.get("invitePermissions") or {}
+    if not permissions.get("canInviteCompanyOnly") or permissions.get("canInviteAll"):
+        return None
+    return build_organization_filter(requester)
+
+
+def build_user_list_projection(fields):
+    if not fields:
+        return {**PUBLIC_USER_PROJECTION, "_id": 1}
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - USER_LIST_SELECTABLE_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    projection = {"_id": 1, "id": 1}
+    for field in requested:
+        projection[field] = 1
+    if "professionalProfile" in requested:
+        for key in PROFILE_FIELD_ALIASES:
+            projection[key] = 1
+        projection["profile_normalized"] = 1
+    if "status" in requested:
+        projection["isOnline"] = 1
+    return projection
+
+
 def build_relationship_state(requester, candidate):
     if not requester:
         return "can_connect", None
@@ -605,9 +759,29 @@ def build_relationship_state(requester, candidate):
     return "can_connect", None
 
 
-def build_user_search_result(candidate, requester):
-    serialized = serialize_user(candidate)
-    relationship_status, notification_id = build_relationship_state(requester, candidate)
+def build_relationship_states(requester, candidates):
+    """Relationship with each candidate, keyed by str id; one edge query once connections are backfilled."""
+    if not requester or not connections_ready():
+        return {str(candidate.get("id")): build_relationship_state(requester, candidate) for candidate in candidates}
+
+    requester_id = str(requester.get("id"))
+    requester_friends = {str(friend_id) for friend_id in requester.get("friends") or []}
+    states = relationship_states(requester_id, [candidate.get("id") for candidate in candidates])
+    results = {}
+    for candidate in candidates:
+        candidate_id = str(candidate.get("id"))
+        if candidate_id == requester_id:
+            results[candidate_id] = ("self", None)
+        elif candidate_id in requester_friends:
+            results[candidate_id] = ("connected", None)
+        else:
+            results[candidate_id] = states.get(candidate_id, ("can_connect", None))
+    return results
+
+
+def build_user_search_result(candidate, requester, relationship=None):
+    serialized = serialize_public_user(candidate)
+    relationship_status, notification_id = relationship or build_relationship_state(requester, candidate)
     return {
         "id": serialized.get("id"),
         "name": serialized.get("name") or "",
@@ -630,95 +804,126 @@ def search_users_core(query: str, request: Request, limit: int = 25):
     if not normalized_query:
         return []
 
-    escaped_query = re.escape(normalized_query)
+    terms = search_terms(normalized_query)
+    if not terms:
+        return []
     search_query = normalize_search_name(normalized_query) or normalized_query.lower()
-    escaped_search_query = re.escape(search_query)
-    prefix_pattern = f"^{escaped_query}"
-    indexed_prefix_pattern = f"^{escaped_search_query}"
-    contains_pattern = escaped_query
-    indexed_contains_pattern = escaped_search_query
-    query_length = len(normalized_query)
-    should_run_contains_fallback = query_length >= 3
+    # Fetch a few more than requested so ranking still leaves a full page
+    fetch_limit = min(max(safe_limit * 4, 40), 200)
+    visibility = build_visibility_filter(requester)
+
+    def scoped(clause):
+        return {"$and": [clause, visibility]} if visibility else clause
 
     try:
-        prefix_limit = safe_limit if query_length > 1 else min(safe_limit, 10)
+        # Names starting with the query first, in name order, so an exact
+        # match always sorts to the top. This also finds users created before
+        # search_tokens existed (until backfilled).
         candidates = list(
             users_collection.find(
-                {"name_search": {"$regex": indexed_prefix_pattern}},
+                scoped({"name_search": {"$regex": f"^{re.escape(search_query)}"}}),
                 USER_SEARCH_PROJECTION,
-            ).limit(prefix_limit)
+            ).sort("name_search", 1).limit(fetch_limit)
         )
-
-        if len(candidates) < prefix_limit:
-            existing_ids = {str(candidate.get("id")) for candidate in candidates}
-            legacy_prefix_candidates = list(
-                users_collection.find(
-                    {
-                        "name": {"$regex": prefix_pattern, "$options": "i"},
-                        "id": {"$nin": [candidate.get("id") for candidate in candidates if candidate.get("id") is not None]},
-                    },
-                    USER_SEARCH_PROJECTION,
-                ).limit(prefix_limit)
-            )
-            for candidate in legacy_prefix_candidates:
-                candidate_id = str(candidate.get("id"))
-                if candidate_id in existing_ids:
-                    continue
-                candidates.append(candidate)
-                existing_ids.add(candidate_id)
-                if len(candidates) >= prefix_limit:
-                    break
-
-        if should_run_contains_fallback and len(candidates) < safe_limit:
-            existing_ids = {str(candidate.get("id")) for candidate in candidates}
-            remaining = max(safe_limit - len(candidates), 0)
-            fallback_limit = min(max(remaining + 4, 6), safe_limit + 4)
-            fallback_candidates = list(
-                users_collection.find(
-                    {
-                        "name_search": {"$regex": indexed_contains_pattern},
-                        "id": {"$nin": [candidate.get("id") for candidate in candidates if candidate.get("id") is not None]},
-                    },
-                    USER_SEARCH_PROJECTION,
-                )
-                .limit(fallback_limit)
-            )
-            for candidate in fallback_candidates:
-                candidate_id = str(candidate.get("id"))
-                if candidate_id in existing_ids:
-                    continue
-                candidates.append(candidate)
-                existing_ids.add(candidate_id)
-                if len(candidates) >= safe_limit:
-                    break
-
-            if len(candidates) < safe_limit:
-                legacy_fallback_candidates = list(
-                    users_collection.find(
-                        {
-                            "name": {"$regex": contains_pattern, "$options": "i"},
-                            "id": {"$nin": [candidate.get("id") for candidate in candidates if candidate.get("id") is not None]},
-                        },
-                        USER_SEARCH_PROJECTION,
-                    )
-                    .limit(fallback_limit)
-                )
-                for candidate in legacy_fallback_candidates:
-                    candidate_id = str(candidate.get("id"))
-                    if candidate_id in existing_ids:
-                        continue
+        # Prefix matches outrank everything else; only look further when
+        # they don't fill the page
+        if len(candidates) < safe_limit:
+            seen_ids = {str(candidate.get("id")) for candidate in candidates}
+            token_matches = users_collection.find(scoped(token_filter(terms)), USER_SEARCH_PROJECTION)
+            for candidate in token_matches.sort("name_search", 1).limit(fetch_limit):
+                if str(candidate.get("id")) not in seen_ids:
                     candidates.append(candidate)
-                    existing_ids.add(candidate_id)
-                    if len(candidates) >= safe_limit:
-                        break
     except PyMongoError as exc:
         logger.error("Failed to search users for query %s: %s", normalized_query, exc)
         raise HTTPException(status_code=503, detail="Database is temporarily unavailable. Please retry.")
 
-    visible_candidates = [candidate for candidate in candidates if can_requester_see_user(requester, candidate)]
-    visible_candidates.sort(key=lambda candidate: (candidate.get("name") or "").lower())
-    results = [build_user_search_result(candidate, requester) for candidate in visible_candidates[:safe_limit]]
-    return results
+    candidates.sort(
+        key=lambda candidate: (relevance(candidate, normalized_query, terms), (candidate.get("name") or "").lower())
+    )
+    page = candidates[:safe_limit]
+    try:
+        relationships = build_relationship_states(requester, page)
+    except PyMongoError as exc:
+        logger.error("Failed to load relationships for user search: %s", exc)
+        raise HTTPException(status_code=503, detail="Database is temporarily unavailable. Please retry.")
+    return [build_user_search_result(candidate, requester, relationships[str(candidate.get("id"))]) for candidate in page]
+
+
+def build_recommendations(requester, top_k):
+    """Rank people the requester may know by shared spaces, mutual connections and organization."""
+    requester_id = str(requester.get("id"))
+    friend_ids = [friend_id for friend_id in requester.get("friends") or []]
+    excluded = {requester_id} | {str(friend_id) for friend_id in friend_ids}
+
+    shared_spaces = Counter()
+    space_query_ids = expand_user_ids_for_query(requester.get("spaces") or [])
+    if space_query_ids:
+        space_projection = {"_id": 0, "members": 1, "ownerId": 1, "createdBy": 1}
+        for space in spaces_collection.find({"id": {"$in": space_query_ids}}, space_projection):
+            members = {str(member) for member in space.get("members") or []}
+            members |= {str(space[key]) for key in ("ownerId", "createdBy") if space.get(key) is not None}
+            shared_spaces.update(members - excluded)
+
+    mutual_connections = Counter()
+    friend_query_ids = expand_user_ids_for_query(friend_ids)
+    if friend_query_ids:
+        for friend in users_collection.find({"id": {"$in": friend_query_ids}}, {"_id": 0, "friends": 1}):
+            mutual_connections.update({str(v) for v in friend.get("friends") or []} - excluded)
+
+    same_org = set()
+    requester_org = requester.get("organizationId")
+    if requester_org:
+        org_users = users_collection.find(
+            {"organizationId": {"$in": organization_id_variants(requester_org)}}, {"_id": 0, "id": 1}
+        ).sort("_id", -1).limit(RECOMMENDATION_ORG_SAMPLE)
+        same_org = {str(user.get("id")) for user in org_users} - excluded
+
+    scores = {}
+    for candidate_id in set(shared_spaces) | set(mutual_connections) | same_org:
+        scores[candidate_id] = (
+            RECOMMENDATION_SHARED_SPACE_WEIGHT * shared_spaces[candidate_id]
+            + RECOMMENDATION_MUTUAL_WEIGHT * mutual_connections[candidate_id]
+            + RECOMMENDATION_SAME_ORG_WEIGHT * (candidate_id in same_org)
+        )
+
+    # Only keep candidates that still exist and that the requester may see
+    visibility = build_visibility_filter(requester)
+    visible_ids = set()
+    if scores:
+        query = {"id": {"$in": expand_user_ids_for_query(list(scores))}}
+        if visibility:
+            query = {"$and": [query, visibility]}
+        visible_ids = {str(user.get("id")) for user in users_collection.find(query, {"_id": 0, "id": 1})}
+
+    ranked = sorted(visible_ids, key=lambda candidate_id: (-scores[candidate_id], candidate_id))[:top_k]
+    entries = [
+        {
+            "id": candidate_id,
+            "score": scores[candidate_id],
+            "sharedSpaces": shared_spaces[candidate_id],
+            "mutualConnections": mutual_connections[candidate_id],
+            "sameOrganization": candidate_id in same_org,
+        }
+        for candidate_id in ranked
+    ]
+
+    # Cold start: pad with recently joined users the requester can see
+    if len(entries) < top_k:
+        taken = excluded | {entry["id"] for entry in entries}
+        query = visibility or {}
+        for user in users_collection.find(query, {"_id": 0, "id": 1}).sort("_id", -1).limit(top_k + len(taken)):
+            candidate_id = str(user.get("id"))
+            if candidate_id in taken:
+                continue
+            taken.add(candidate_id)
+            entries.append({"id": candidate_id, "score": 0, "sharedSpaces": 0, "mutualConnections": 0, "sameOrganization": False})
+            if len(entries) >= top_k:
+                break
+    return entries
+
+
+recommendations.builder = build_recommendations
+recommendations.loader = get_user_by_id
 
 
 def discover_people_core(request: Request, limit: int = 8):
@@ -728,55 +933,84 @@ def discover_people_core(request: Request, limit: int = 8):
     safe_limit = max(1, min(int(limit or 8), 24))
 
     try:
-        candidates = list(
-            users_collection.find({}, USER_SEARCH_PROJECTION).sort("name_search", 1).limit(200)
-        )
+        ranked = recommendations.get(requester)
+        # Read a little past the limit to cover connections made since the last refresh
+        ranked = ranked[: safe_limit * 2]
+        candidates = fetch_users_by_ids([entry["id"] for entry in ranked], USER_SEARCH_PROJECTION)
+        relationships = build_relationship_states(requester, candidates)
     except PyMongoError as exc:
         logger.error("Failed to load discover users: %s", exc)
         raise HTTPException(status_code=503, detail="Database is temporarily unavailable. Please retry.")
 
+    candidates_by_id = {str(candidate.get("id")): candidate for candidate in candidates}
     results = []
-    for candidate in candidates:
-        if not can_requester_see_user(requester, candidate):
+    for entry in ranked:
+        candidate = candidates_by_id.get(str(entry["id"]))
+        # The stored list was filtered when it was built; permissions or
+        # organizations may have changed since
+        if not candidate or not can_requester_see_user(requester, candidate):
             continue
-
-        card = build_user_search_result(candidate, requester)
+        card = build_user_search_result(candidate, requester, relationships[str(candidate.get("id"))])
         if card["relationshipStatus"] in {"self", "connected"}:
             continue
-
         results.append(card)
-
-    relationship_order = {
-        "incoming_request": 0,
-        "can_connect": 1,
-        "outgoing_request": 2,
-    }
-    results.sort(key=lambda item: (relationship_order.get(item["relationshipStatus"], 3), item["name"].lower()))
-    return results[:safe_limit]
+        if len(results) >= safe_limit:
+            break
+    return results
 
 
 @router.get("/")
-def get_users(request: Request):
+def get_users(
+    request: Request,
+    scope: str = Query(default="all", pattern="^(org|all)$"),
+    limit: int = Query(default=USER_LIST_DEFAULT_LIMIT, ge=1, le=USER_LIST_MAX_LIMIT),
+    cursor: str | None = Query(default=None, max_length=24),
+    fields: str | None = Query(default=None, max_length=400),
+):
+    """One page of the users the requester can see, ordered by `_id`.
+
+    `scope=all` (default) lists everyone the visibility rules allow;
+    `scope=org` narrows that to the requester's organization, where a
+    public email domain is not an organization. Pass the returned
+    `nextCursor` back as `cursor` for the next page.
+    """
     requester = resolve_requester(request)
     if not requester:
         raise HTTPException(status_code=401, detail="Authentication required")
 
+    clauses = []
+    if scope == "org":
+        scope_filter = build_organization_filter(requester, include_public_domains=False)
+    else:
+        scope_filter = build_visibility_filter(requester)
+    if scope_filter:
+        clauses.append(scope_filter)
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        clauses.append({"_id": {"$gt": ObjectId(cursor)}})
+    query = {"$and": clauses} if len(clauses) > 1 else (clauses[0] if clauses else {})
+    projection = build_user_list_projection(fields)
+
     try:
-        users_raw = list(users_collection.find({}, USER_LIST_PROJECTION))
+        users_raw = list(users_collection.find(query, projection).sort("_id", 1).limit(limit + 1))
     except PyMongoError as exc:
         logger.error("Failed to load users list: %s", exc)
         raise HTTPException(status_code=503, detail="Database is temporarily unavailable. Please retry.")
 
+    has_more = len(users_raw) > limit
+    users_raw = users_raw[:limit]
+    next_cursor = str(users_raw[-1]["_id"]) if has_more else None
+
     users = []
-    requester_id = str(requester.get("id")) if requester else None
+    requester_id = str(requester.get("id"))
     for user in users_raw:
-        if requester and str(user.get("id")) == requester_id:
+        if str(user.get("id")) == requester_id and not fields:
             users.append(serialize_user(requester, include_notifications=True))
-            continue
-        if can_requester_see_user(requester, user):
-            users.append(serialize_user(user))
+        else:
+            users.append(serialize_public_user(user))
 
-    return users
+    return FastJSONResponse({"users": users, "nextCursor": next_cursor})
 
 
 @router.get("/me")
@@ -794,11 +1028,18 @@ def get_bootstrap_data(request: Request):
         raise HTTPException(status_code=401, detail="Authentication required")
 
     try:
-        return build_bootstrap_payload(requester)
+        body, etag = bootstrap_cache.get(requester, serialize_user(requester, include_notifications=True))
     except PyMongoError as exc:
         logger.error("Failed to build bootstrap payload for %s: %s", requester.get("id"), exc)
         raise HTTPException(status_code=503, detail="Database is temporarily unavailable. Please retry.")
 
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match") or ""
+    if etag in {candidate.strip() for candidate in if_none_match.split(",")}:
+        bootstrap_cache.not_modified_total += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 
 @router.post("/by-ids")
 def get_users_by_ids(user_ids: list, request: Request):
@@ -809,12 +1050,27 @@ def get_users_by_ids(user_ids: list, request: Request):
     requester_friend_ids = {str(friend_id) for friend_id in (requester.get("friends") or [])} if requester else set()
 
     try:
-        users_raw = fetch_users_by_ids(user_ids, USER_LIST_PROJECTION)
+        users_raw = fetch_users_by_ids(user_ids, PUBLIC_USER_PROJECTION)
     except PyMongoError as exc:
         logger.error("Failed to load users by ids %s: %s", user_ids, exc)
         raise HTTPException(status_code=503, detail="Database is temporarily unavailable. Please retry.")
 
     users_by_id = {str(user.get("id")): user for user in users_raw if user.get("id") is not None}
+    # Only candidates that are neither friends nor otherwise visible need
+    # the shared-workspace check, done for all of them at once
+    undecided_ids = {
+        user_id
+        for user_id, candidate in users_by_id.items()
+        if user_id != requester_id
+        and user_id not in requester_friend_ids
+        and not can_requester_see_user(requester, candidate)
+    }
+    try:
+        sharing_ids = membership_cache.sharing_with(requester_id, undecided_ids) if undecided_ids else set()
+    except PyMongoError as exc:
+        logger.error("Failed to check shared workspace visibility for %s: %s", undecided_ids, exc)
+        raise HTTPException(status_code=503, detail="Database is temporarily unavailable. Please retry.")
+
     ordered_users = []
     seen = set()
 
@@ -829,40 +1085,51 @@ def get_users_by_ids(user_ids: list, request: Request):
             continue
 
         candidate = users_by_id.get(user_id)
-        try:
-            shares_workspace = users_share_workspace(requester, candidate) if candidate else False
-        except PyMongoError as exc:
-            logger.error("Failed to check shared workspace visibility for %s: %s", user_id, exc)
-            raise HTTPException(status_code=503, detail="Database is temporarily unavailable. Please retry.")
+        if candidate and (user_id not in undecided_ids or user_id in sharing_ids):
+            ordered_users.append(serialize_public_user(candidate))
+
+    return FastJSONResponse(ordered_users)
 
-        if candidate and (
-            user_id in requester_friend_ids
-            or shares_workspace
-            or can_requester_see_user(requester, candidate)
-        ):
-            ordered_users.append(serialize_user(candidate))
 
-    return ordered_users
+def password_hashing_busy_error(exc: PasswordHashingBusy):
+    return HTTPException(
+        status_code=429,
+        detail="Too many sign-in attempts in progress, please retry shortly",
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 
-@router.post("/signup")
-def signup(user: dict, response: Response):
-    logger.info("[users.signup] received signup for: %s", user.get("email"))
-    normalized_email = normalize_email(user.get("email"))
+def find_registered_user(email):
+    normalized_email = normalize_email(email)
     existing = users_collection.find_one({"email_normalized": normalized_email}) if normalized_email else None
-    if not existing and user.get("email"):
+    if not existing and email:
         existing = users_collection.find_one(
-            {"email": {"$regex": f"^{re.escape(user['email'])}$", "$options": "i"}}
+            {"email": {"$regex": f"^{re.escape(email)}$", "$options": "i"}}
         )
-    if existing:
+    return existing
+
+
+# signup, login and set-password are async so the slow password hash can be
+# awaited on the password_hasher pool; their database work runs in the threadpool.
+@router.post("/signup")
+async def signup(user: dict, response: Response):
+    logger.info("[users.signup] received signup for: %s", user.get("email"))
+    if await run_in_threadpool(find_registered_user, user.get("email")):
         return {"error": "Email already registered"}
 
     raw_user = user
     try:
-        hashed_password = hash_password(raw_user["password"])
+        hashed_password = await password_hasher.hash(raw_user["password"])
+    except PasswordHashingBusy as exc:
+        raise password_hashing_busy_error(exc)
     except Exception as exc:
         raise HTTPException(status_code=400, detail=f"Password hashing failed: {exc}")
 
+    return await run_in_threadpool(create_signup_user, raw_user, hashed_password, response)
+
+
+def create_signup_user(raw_user: dict, hashed_password: str, response: Response):
+    normalized_email = normalize_email(raw_user.get("email"))
     user = {
         "id": int(time.time() * 1000),
         "name": clean_optional_text(raw_user.get("name"), 120) or (normalized_email.split("@")[0] if normalized_email else "User"),
@@ -872,6 +1139,15 @@ def signup(user: dict, response: Response):
     for key in ("avatar_url", "avatar_preset", "avatar_version", "avatar_updated_at"):
         if raw_user.get(key) is not None:
             user[key] = raw_user.get(key)
+    if is_data_url(user.get("avatar_url")):
+        try:
+            avatar_file_id = store_avatar(user["id"], user["avatar_url"])
+        except Exception as exc:
+            avatar_file_id = None
+            logger.warning("Failed to store avatar at signup for %s: %s", user.get("email"), exc)
+        if avatar_file_id:
+            user["avatar_url"] = avatar_file_url(avatar_file_id, user.get("avatar_version") or user["id"])
+            user["avatar_file_id"] = avatar_file_id
 
     user.update(organization_defaults_for_email(user.get("email")))
 
@@ -882,6 +1158,7 @@ def signup(user: dict, response: Response):
     profile = normalize_professional_profile(raw_user, strict=True)
     if profile:
         user["professionalProfile"] = profile
+    user["profile_normalized"] = True
 
     user.update(build_user_index_fields(user))
 
@@ -891,14 +1168,12 @@ def signup(user: dict, response: Response):
     return {"user": serialize_user(user, include_notifications=True), "token": token}
 
 
-@router.post("/login")
-def login(data: dict, response: Response):
-    logger.info("[users.login] login attempt for: %s", data.get("email"))
-    normalized_email = normalize_email(data.get("email"))
+def find_login_user(email):
+    normalized_email = normalize_email(email)
     user = users_collection.find_one({"email_normalized": normalized_email}) if normalized_email else None
-    if not user and data.get("email"):
+    if not user and email:
         user = users_collection.find_one(
-            {"email": {"$regex": f"^{re.escape(data['email'])}$", "$options": "i"}}
+            {"email": {"$regex": f"^{re.escape(email)}$", "$options": "i"}}
         )
         if user:
             try:
@@ -908,9 +1183,35 @@ def login(data: dict, response: Response):
                 )
             except Exception:
                 pass
+    return user
+
 
-    if not user or not verify_password(data["password"], user.get("password")):
+def store_rehashed_password(user: dict, new_hash: str):
+    # Only replace the hash we verified against, in case the password changed meanwhile
+    try:
+        users_collection.update_one({"id": user.get("id"), "password": user.get("password")}, {"$set": {"password": new_hash}})
+    except Exception as exc:
+        logger.warning("Failed to store rehashed password for %s: %s", user.get("id"), exc)
+
+
+@router.post("/login")
+async def login(data: dict, response: Response):
+    logger.info("[users.login] login attempt for: %s", data.get("email"))
+    user = await run_in_threadpool(find_login_user, data.get("email"))
+    if not user:
+        return {"error": "Invalid credentials"}
+    password = data["password"]
+    try:
+        verified, new_hash = await password_hasher.verify(password, user.get("password"))
+    except PasswordHashingBusy as exc:
+        raise password_hashing_busy_error(exc)
+    except Exception as exc:
+        logger.error("[users.login] password verification failed for %s: %s", data.get("email"), exc)
+        raise HTTPException(status_code=503, detail="Sign-in is temporarily unavailable, please retry")
+    if not verified:
         return {"error": "Invalid credentials"}
+    if new_hash:
+        await run_in_threadpool(store_rehashed_password, user, new_hash)
 
     token = create_access_token({"user_id": user["id"]})
     set_auth_cookie(response, token)
@@ -988,32 +1289,32 @@ def find_user_by_email(email: str, request: Request):
         normalized_email = normalize_email(email)
         user = users_collection.find_one(
             {"email_normalized": normalized_email},
-            USER_LIST_PROJECTION,
+            PUBLIC_USER_PROJECTION,
         ) if normalized_email else None
         if not user:
             user = users_collection.find_one(
                 {"email": {"$regex": f"^{re.escape(email)}$", "$options": "i"}},
-                USER_LIST_PROJECTION,
+                PUBLIC_USER_PROJECTION,
             )
     except PyMongoError as exc:
         logger.error("Failed to look up user by email %s: %s", email, exc)
         raise HTTPException(status_code=503, detail="Database is temporarily unavailable. Please retry.")
-    return serialize_user(user) if user else None
+    return serialize_public_user(user) if user else None
 
 
 @router.get("/search")
 def search_users_query(request: Request, q: str = Query(..., min_length=1), limit: int = Query(25, ge=1, le=MAX_SEARCH_LIMIT)):
-    return search_users_core(q, request, limit)
+    return FastJSONResponse(search_users_core(q, request, limit))
 
 
 @router.get("/search/{query}")
 def search_users_legacy(query: str, request: Request, limit: int = Query(25, ge=1, le=MAX_SEARCH_LIMIT)):
-    return search_users_core(query, request, limit)
+    return FastJSONResponse(search_users_core(query, request, limit))
 
 
 @router.get("/discover")
 def discover_people(request: Request, limit: int = Query(8, ge=1, le=24)):
-    return discover_people_core(request, limit)
+    return FastJSONResponse(discover_people_core(request, limit))
 
 
 @router.get("/by-domain/{domain}")
@@ -1036,13 +1337,27 @@ def users_by_domain(domain: str, request: Request):
 
 
 @router.post("/set-password")
-def set_password(payload: dict, response: Response):
+async def set_password(payload: dict, response: Response):
     email = payload.get("email")
     password = payload.get("password")
     setup_token = clean_optional_text(payload.get("setupToken"), 200)
     if not email or not password or not setup_token:
         raise HTTPException(status_code=400, detail="email, password and setupToken required")
 
+    org, user = await run_in_threadpool(find_password_setup_target, email, setup_token)
+
+    try:
+        hashed = await password_hasher.hash(password)
+    except PasswordHashingBusy as exc:
+        raise password_hashing_busy_error(exc)
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to hash password")
+
+    return await run_in_threadpool(apply_password_setup, org, user, email, hashed, response)
+
+
+def find_password_setup_target(email: str, setup_token: str):
+    """(organization, existing user or None) for a valid password setup token."""
     normalized_email = normalize_email(email)
     org = organizations_collection.find_one(
         {
@@ -1058,12 +1373,11 @@ def set_password(payload: dict, response: Response):
     user = users_collection.find_one({"email_normalized": normalized_email}) if normalized_email else None
     if not user:
         user = users_collection.find_one({"email": {"$regex": f"^{re.escape(email)}$", "$options": "i"}})
+    return org, user
 
-    try:
-        hashed = hash_password(password)
-    except Exception:
-        raise HTTPException(status_code=500, detail="Failed to hash password")
 
+def apply_password_setup(org: dict, user, email: str, hashed: str, response: Response):
+    normalized_email = normalize_email(email)
     if user:
         try:
             users_collection.update_one(
@@ -1083,6 +1397,7 @@ def set_password(payload: dict, response: Response):
             )
         except Exception:
             raise HTTPException(status_code=500, detail="Failed to set password")
+        recommendations.mark_dirty(user["id"])
         updated = users_collection.find_one({"id": user["id"]}, {"_id": 0})
         token = create_access_token({"user_id": updated["id"]})
         set_auth_cookie(response, token)
@@ -1138,7 +1453,11 @@ async def update_professional_profile(user_id: str, payload: ProfessionalProfile
 
     normalized_profile = normalize_professional_profile(payload.model_dump(), strict=True)
     update_ops = build_profile_update_ops(normalized_profile)
+    update_ops.setdefault("$set", {})["search_tokens"] = build_search_tokens(
+        {"name": existing_user.get("name"), "email": existing_user.get("email"), "professionalProfile": normalized_profile or {}}
+    )
     users_collection.update_one({"id": actual_id}, update_ops)
+    bootstrap_cache.invalidate_user(actual_id)
     updated = get_user_by_id(actual_id)
     return serialize_user(updated, include_notifications=bool(requester and str(requester.get("id")) == str(actual_id)))
 
@@ -1165,6 +1484,9 @@ async def update_user(user_id: str, user: dict, request: Request):
         "name_search",
         "spaces",
         "friends",
+        "search_tokens",
+        "profile_normalized",
+        "avatar_file_id",
     }
     for field in protected_fields:
         update_doc.pop(field, None)
@@ -1206,12 +1528,36 @@ async def update_user(user_id: str, user: dict, request: Request):
             update_doc.pop(key, None)
         update_doc.pop("professionalProfile", None)
 
+    if is_data_url(update_doc.get("avatar_url")):
+        # Inline images go to the file store; the avatar block below versions the URL
+        try:
+            avatar_file_id = await run_in_threadpool(store_avatar, actual_id, update_doc["avatar_url"])
+        except Exception as exc:
+            avatar_file_id = None
+            logger.warning("Failed to store avatar for %s: %s", actual_id, exc)
+        if avatar_file_id:
+            update_doc["avatar_url"] = avatar_file_url(avatar_file_id)
+            update_doc["avatar_file_id"] = avatar_file_id
+
+    # The stored avatar file this update replaces, released once it is written
+    replaced_avatar_file_id = existing_user.get("avatar_file_id")
+    if "avatar_url" not in update_doc or (replaced_avatar_file_id and replaced_avatar_file_id in str(update_doc.get("avatar_url") or "")):
+        replaced_avatar_file_id = None
+
     update_ops = {}
     set_doc = dict(update_doc)
     unset_doc = {}
+    if replaced_avatar_file_id and "avatar_file_id" not in update_doc:
+        unset_doc["avatar_file_id"] = ""
 
-    if "name" in update_doc or "email" in update_doc:
+    if "name" in update_doc or "email" in update_doc or profile_fields_present:
         indexed_source = {**existing_user, **update_doc}
+        if profile_fields_present:
+            indexed_source = {
+                "name": indexed_source.get("name"),
+                "email": indexed_source.get("email"),
+                "professionalProfile": normalized_profile or {},
+            }
         for key, value in build_user_index_fields(indexed_source).items():
             if value is None:
                 unset_doc[key] = ""
@@ -1234,7 +1580,18 @@ async def update_user(user_id: str, user: dict, request: Request):
 
     result = users_collection.update_one({"id": actual_id}, update_ops)
     if result.matched_count == 0:
+        if update_doc.get("avatar_file_id"):
+            await run_in_threadpool(release_avatar, update_doc["avatar_file_id"])
         return {"error": "User not found"}
+    bootstrap_cache.invalidate_user(actual_id)
+    if "invitePermissions" in update_doc or "email" in update_doc:
+        # Visibility depends on both; rebuild the stored discover list
+        recommendations.mark_dirty(actual_id)
+    if replaced_avatar_file_id:
+        try:
+            await run_in_threadpool(release_avatar, replaced_avatar_file_id)
+        except Exception as exc:
+            logger.warning("Failed to release avatar file %s: %s", replaced_avatar_file_id, exc)
 
     updated = get_user_by_id(actual_id)
     serialized_updated = serialize_user(
@@ -1305,44 +1662,7 @@ async def update_user(user_id: str, user: dict, request: Request):
                 "name": updated.get("name"),
             }
 
-            recipients = set()
-            for friend_id in updated.get("friends") or []:
-                if friend_id and str(friend_id) != str(actual_id):
-                    recipients.add(str(friend_id))
-
-            user_spaces = updated.get("spaces") or []
-            for space in spaces_collection.find({"id": {"$in": user_spaces}}):
-                for member_id in space.get("members", []):
-                    if member_id and str(member_id) != str(actual_id):
-                        recipients.add(str(member_id))
-
-            notification = {
-                "type": "avatar_updated",
-                "userId": str(actual_id),
-                "avatarData": avatar_data,
-                "timestamp": int(time.time()),
-            }
-
-            for recipient_id in recipients:
-                try:
-                    await manager.send_to_user(str(recipient_id), {"type": "notification", "notification": notification})
-                except Exception:
-                    pass
-
-            try:
-                await manager.broadcast(
-                    "notifications",
-                    {
-                        "type": "profileUpdated",
-                        "userId": str(actual_id),
-                        "avatar_url": avatar_url,
-                        "avatar_preset": updated.get("avatar_preset"),
-                        "avatar_version": timestamp,
-                        "avatar_updated_at": timestamp,
-                    },
-                )
-            except Exception:
-                pass
+            profile_fanout.publish(actual_id, updated.get("friends") or [], avatar_data)
     except Exception as exc:
         logger.warning("avatar broadcast failed for %s: %s", actual_id, exc)
 
@@ -2,11 +2,15 @@ from http.cookies import SimpleCookie
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from app.ws_manager import manager
+from app.presence_writer import presence_writer
+from app.ws_admission import WS_TRY_AGAIN_LATER, HandshakeRejected, handshake_admission
 from app.auth import verify_ws_token
 from app.database import organizations_collection, users_collection
 from app.deps import AUTH_COOKIE_NAME
 from app.routes.messages import _check_channel_access
+from app.routes.spaces import member_space_ids
 import logging
+import re
 import time
 
 logger = logging.getLogger(__name__)
@@ -62,6 +66,89 @@ def _resolve_ws_user(websocket: WebSocket):
     user = users_collection.find_one({"id": {"$in": _user_id_candidates(user_id)}})
     return user
 
+
+def _user_domain(user):
+    # prefer explicit organizationId -> lookup org domain
+    org_id = user.get("organizationId")
+    if org_id:
+        try:
+            org = organizations_collection.find_one({"_id": org_id})
+            if org and org.get("domain"):
+                return org.get("domain")
+        except Exception:
+            pass
+    # fallback to parsing email domain
+    m = re.search(r"@([A-Za-z0-9.-]+)$", user.get("email") or "")
+    return m.group(1).lower() if m else None
+
+
+def _prepare_chat_handshake(websocket: WebSocket, chat_id: str):
+    """Blocking part of the chat socket handshake; runs on the threadpool."""
+    user = _resolve_ws_user(websocket)
+    if not user:
+        return None, False
+    return user, _check_channel_access(chat_id, user.get("id"))
+
+
+def _prepare_notifications_handshake(websocket: WebSocket):
+    """Blocking part of the notifications socket handshake; runs on the threadpool."""
+    user = _resolve_ws_user(websocket)
+    if not user:
+        return None
+
+    # Determine user's domain and role (best-effort) to allow domain-scoped admin notifications
+    domain = None
+    try:
+        domain = _user_domain(user)
+    except Exception:
+        pass
+
+    # Recent org_verified events are replayed to the connecting socket so
+    # clients that connected after a verification don't miss the notification.
+    recent_verified = []
+    try:
+        cutoff = int(time.time()) - 600
+        recent_verified = list(organizations_collection.find({"verified": True, "verifiedAt": {"$gte": cutoff}}, {"_id": 0, "domain": 1}))
+    except Exception as e:
+        logger.debug("Failed to load recent org_verified events: %s", e)
+
+    space_ids = []
+    try:
+        space_ids = member_space_ids(user.get("id"))
+    except Exception as e:
+        logger.debug("Failed to load space memberships for ws topics: %s", e)
+
+    return {"user": user, "domain": domain, "role": user.get("role"), "recent_verified": recent_verified, "space_ids": space_ids}
+
+
+async def _close_try_again_later(websocket: WebSocket, retry_after: int):
+    try:
+        # Accept first so the close code reaches the client; closing
+        # before accept surfaces as a bare HTTP 403 instead.
+        await websocket.accept()
+        await websocket.close(code=WS_TRY_AGAIN_LATER, reason=f"retry_after={retry_after}")
+    except Exception:
+        pass
+
+
+async def _admit(websocket: WebSocket, fn, *args):
+    """Run a handshake step through admission control.
+
+    Returns `(True, result)` when admitted. When the server is draining or
+    over capacity the socket is closed with 1013 and a jittered
+    `retry_after=<seconds>` reason, and `(False, None)` is returned.
+    """
+    if manager.draining:
+        await _close_try_again_later(websocket, max(1, round(manager.reconnect_delay_seconds())))
+        return False, None
+    try:
+        return True, await handshake_admission.run(fn, *args)
+    except HandshakeRejected as exc:
+        logger.info("WS handshake rejected (%s); retry after %ss", exc.reason, exc.retry_after)
+        await _close_try_again_later(websocket, exc.retry_after)
+        return False, None
+
+
 @router.websocket("/ws/chat/{chat_id}")
 async def websocket_endpoint(
     websocket: WebSocket,
@@ -73,13 +160,16 @@ async def websocket_endpoint(
     except Exception:
         pass
 
-    user = _resolve_ws_user(websocket)
+    admitted, result = await _admit(websocket, _prepare_chat_handshake, websocket, chat_id)
+    if not admitted:
+        return
+    user, has_access = result
     if not user:
         await websocket.close(code=1008, reason="Authentication required")
         return
 
     user_id = user.get("id")
-    if not _check_channel_access(chat_id, user_id):
+    if not has_access:
         await websocket.close(code=1008, reason="Access denied")
         return
 
@@ -118,8 +208,10 @@ async def websocket_notifications(websocket: WebSocket):
     except Exception:
         pass
 
-    user = _resolve_ws_user(websocket)
-    if not user:
+    admitted, handshake = await _admit(websocket, _prepare_notifications_handshake, websocket)
+    if not admitted:
+        return
+    if not handshake:
         await websocket.close(code=1008, reason="Authentication required")
         return
 
@@ -129,40 +221,16 @@ async def websocket_notifications(websocket: WebSocket):
         logger.error("Failed to accept notifications websocket: %s", e)
         return
 
-    user_id = user.get("id")
-
-    # Determine user's domain and role (best-effort) to allow domain-scoped admin notifications
-    domain = None
-    role = None
-    u = user
-    try:
-        if u:
-            role = u.get("role")
-            # prefer explicit organizationId -> lookup org domain
-            org_id = u.get("organizationId")
-            if org_id:
-                try:
-                    org = organizations_collection.find_one({"_id": org_id})
-                    if org:
-                        domain = org.get("domain")
-                except Exception:
-                    pass
-            # fallback to parsing email domain
-            if not domain:
-                email = u.get("email", "")
-                import re
-                m = re.search(r"@([A-Za-z0-9.-]+)$", email)
-                if m:
-                    domain = m.group(1).lower()
-            # mark user as online
-            try:
-                users_collection.update_one({"id": u.get("id")}, {"$set": {"isOnline": True, "lastActive": int(time.time())}})
-            except Exception:
-                pass
-    except Exception:
-        pass
+    u = handshake["user"]
+    user_id = u.get("id")
+    domain = handshake["domain"]
+    role = handshake["role"]
 
     await manager.connect("notifications", websocket, user_id=user_id, meta={"user_id": str(user_id) if user_id else None, "domain": domain, "role": role})
+    # Membership and role events for the user's spaces arrive on this socket
+    manager.subscribe_spaces(websocket, handshake["space_ids"])
+    # mark user as online (buffered; flushed in bulk off the socket path)
+    presence_writer.record(user_id, True)
 
     # Notify connected org admins about this user's presence (domain-scoped)
     try:
@@ -171,18 +239,11 @@ async def websocket_notifications(websocket: WebSocket):
     except Exception:
         pass
 
-    # Send any recent org_verified events to the connecting socket so clients
-    # that connected after a verification don't miss the notification.
-    try:
-        cutoff = int(time.time()) - 600
-        recent = list(organizations_collection.find({"verified": True, "verifiedAt": {"$gte": cutoff}}, {"_id": 0, "domain": 1}))
-        for org in recent:
-            try:
-                await websocket.send_json({"type": "org_verified", "domain": org.get("domain")})
-            except Exception:
-                pass
-    except Exception as e:
-        logger.debug("Failed to send recent org_verified events: %s", e)
+    for org in handshake["recent_verified"]:
+        try:
+            await websocket.send_json({"type": "org_verified", "domain": org.get("domain")})
+        except Exception:
+            pass
 
     try:
         while True:
@@ -204,16 +265,19 @@ async def websocket_notifications(websocket: WebSocket):
     except (WebSocketDisconnect, RuntimeError):
         pass
     finally:
-        # mark user offline and update lastActive
-        try:
-            if user_id:
-                users_collection.update_one({"id": user_id}, {"$set": {"isOnline": False, "lastActive": int(time.time())}})
-        except Exception:
-            pass
-        # Notify admins about offline event
+        # Notify admins about offline event (not while draining: the user is
+        # about to reconnect to another instance)
         try:
-            if domain and user_id:
+            if domain and user_id and not manager.draining:
                 await manager.send_to_admins_for_domain(domain, {"type": "user_presence", "event": "offline", "userId": str(user_id), "email": u.get("email") if u else None, "timestamp": int(time.time())})
         except Exception:
             pass
         await manager.disconnect("notifications", websocket, user_id=user_id)
+        # update lastActive and mark offline unless another tab/device is still
+        # connected; a drain keeps the user online while they reconnect and
+        # settles them later (ConnectionManager.settle_drained_presence)
+        if user_id:
+            if manager.draining and str(user_id) not in manager.online_users:
+                presence_writer.record(user_id, True, manager.note_drained(user_id))
+            else:
+                presence_writer.record(user_id, str(user_id) in manager.online_users)
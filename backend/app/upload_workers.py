@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import math
+import os
+import random
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger("app.upload_workers")
+
+
+class UploadQueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("upload queue full")
+        self.retry_after = retry_after
+
+
+class UploadWorkerPool:
+    """Fixed set of workers that finish accepted uploads (store, dedupe, previews).
+
+    Callers `reserve()` a queue slot before doing any expensive work for an
+    upload and `submit()` the job once it is ready; when `queue_limit` jobs
+    are already waiting or running, `reserve()` raises UploadQueueFull with a
+    retry-after derived from the current backlog. Each job runs on the
+    threadpool and its result is handed to an optional async callback, used
+    to push status to the uploader.
+    """
+
+    def __init__(self, workers: int, queue_limit: int, retry_after_min: int, retry_after_max: int):
+        self.workers = max(1, workers)
+        self.queue_limit = max(1, queue_limit)
+        self.retry_after_min = max(1, retry_after_min)
+        self.retry_after_max = max(self.retry_after_min, retry_after_max)
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self.pending = 0
+        self.in_flight = 0
+        self.peak_pending = 0
+        self.accepted_total = 0
+        self.rejected_total = 0
+        self.completed_total = 0
+        self.failed_total = 0
+        self.job_seconds_total = 0.0
+
+    def retry_after(self) -> int:
+        # Roughly how long until the backlog ahead of a new job clears
+        finished = self.completed_total + self.failed_total
+        avg_job = self.job_seconds_total / finished if finished else 1.0
+        estimate = math.ceil(avg_job * self.pending / self.workers)
+        base = min(max(estimate, self.retry_after_min), self.retry_after_max)
+        return min(self.retry_after_max, base + random.randint(0, self.retry_after_min))
+
+    def reserve(self):
+        if self.pending >= self.queue_limit:
+            self.rejected_total += 1
+            raise UploadQueueFull(self.retry_after())
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+
+    def release(self):
+        """Give back a reserved slot whose job will never be submitted."""
+        self.pending = max(0, self.pending - 1)
+
+    def submit(self, fn, *args, on_complete=None):
+        """Queue `fn(*args)` against a slot taken earlier with `reserve()`."""
+        self.start()
+        self.accepted_total += 1
+        self._queue.put_nowait((fn, args, on_complete))
+
+    def start(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._tasks = [task for task in self._tasks if not task.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self, timeout: float = 30.0):
+        """Let queued uploads finish (up to `timeout`), then cancel the workers."""
+        if self._queue is not None and self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Stopping upload workers with %d uploads unfinished", self.pending)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            fn, args, on_complete = await self._queue.get()
+            self.in_flight += 1
+            started = time.monotonic()
+            result = None
+            try:
+                result = await run_in_threadpool(fn, *args)
+                self.completed_total += 1
+            except Exception as exc:
+                self.failed_total += 1
+                logger.warning("Upload job failed: %s", exc)
+            finally:
+                self.job_seconds_total += time.monotonic() - started
+                self.in_flight -= 1
+                self.pending = max(0, self.pending - 1)
+                self._queue.task_done()
+            if on_complete is not None:
+                try:
+                    await on_complete(result)
+                except Exception as exc:
+                    logger.warning("Upload completion callback failed: %s", exc)
+
+    def snapshot(self):
+        finished = self.completed_total + self.failed_total
+        return {
+            "workers": self.workers,
+            "queueLimit": self.queue_limit,
+            "pending": self.pending,
+            "inFlight": self.in_flight,
+            "peakPending": self.peak_pending,
+            "accepted": self.accepted_total,
+            "rejected": self.rejected_total,
+            "completed": self.completed_total,
+            "failed": self.failed_total,
+            "avgJobMs": round(self.job_seconds_total * 1000 / finished, 2) if finished else 0.0,
+        }
+
+
+upload_workers = UploadWorkerPool(
+    workers=int(os.getenv("UPLOAD_WORKERS", "4")),
+    queue_limit=int(os.getenv("UPLOAD_QUEUE_LIMIT", "64")),
+    retry_after_min=int(os.getenv("UPLOAD_RETRY_AFTER_MIN_SECONDS", "2")),
+    retry_after_max=int(os.getenv("UPLOAD_RETRY_AFTER_MAX_SECONDS", "60")),
+)
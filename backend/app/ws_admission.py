@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import os
+import random
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger("app.ws_admission")
+
+# RFC 6455 "Try Again Later": the server is overloaded and the client should
+# reconnect after the delay carried in the close reason.
+WS_TRY_AGAIN_LATER = 1013
+
+
+class HandshakeRejected(Exception):
+    def __init__(self, retry_after: int, reason: str = "over capacity"):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class HandshakeAdmission:
+    """Concurrency-limited pipeline for WebSocket handshakes.
+
+    At most `concurrency` handshakes run their blocking work (Mongo lookups)
+    at once, each on the threadpool so the event loop stays free. Up to
+    `queue_limit` further handshakes may wait for a slot; anything beyond that,
+    or anything that waits longer than `queue_timeout` seconds, is rejected
+    with a jittered retry-after so reconnect storms spread out over time.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        queue_limit: int,
+        queue_timeout: float,
+        retry_after_min: int,
+        retry_after_max: int,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.queue_limit = max(0, queue_limit)
+        self.queue_timeout = queue_timeout
+        self.retry_after_min = max(1, retry_after_min)
+        self.retry_after_max = max(self.retry_after_min, retry_after_max)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self.queued = 0
+        self.in_flight = 0
+        self.peak_queued = 0
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.timed_out_total = 0
+        self.failed_total = 0
+        self.queue_wait_total_seconds = 0.0
+
+    def retry_after(self) -> int:
+        return random.randint(self.retry_after_min, self.retry_after_max)
+
+    def _reject(self, reason: str):
+        self.rejected_total += 1
+        return HandshakeRejected(self.retry_after(), reason)
+
+    async def run(self, fn, *args):
+        """Run `fn(*args)` off the event loop once a handshake slot is free."""
+        if self.in_flight >= self.concurrency and self.queued >= self.queue_limit:
+            raise self._reject("handshake queue full")
+
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out_total += 1
+            raise self._reject("handshake queue timeout")
+        finally:
+            self.queued -= 1
+            self.queue_wait_total_seconds += time.monotonic() - started
+
+        self.in_flight += 1
+        self.admitted_total += 1
+        try:
+            return await run_in_threadpool(fn, *args)
+        except Exception:
+            self.failed_total += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def snapshot(self):
+        admitted = self.admitted_total
+        return {
+            "concurrency": self.concurrency,
+            "queueLimit": self.queue_limit,
+            "queued": self.queued,
+            "inFlight": self.in_flight,
+            "peakQueued": self.peak_queued,
+            "admitted": admitted,
+            "rejected": self.rejected_total,
+            "timedOut": self.timed_out_total,
+            "failed": self.failed_total,
+            "avgQueueWaitMs": round(self.queue_wait_total_seconds * 1000 / admitted, 2) if admitted else 0.0,
+        }
+
+
+handshake_admission = HandshakeAdmission(
+    concurrency=int(os.getenv("WS_HANDSHAKE_CONCURRENCY", "16")),
+    queue_limit=int(os.getenv("WS_HANDSHAKE_QUEUE_LIMIT", "512")),
+    queue_timeout=float(os.getenv("WS_HANDSHAKE_QUEUE_TIMEOUT_SECONDS", "5")),
+    retry_after_min=int(os.getenv("WS_RETRY_AFTER_MIN_SECONDS", "2")),
+    retry_after_max=int(os.getenv("WS_RETRY_AFTER_MAX_SECONDS", "20")),
+)
@@ -1,6 +1,33 @@
 from typing import Dict, List, Set, Any
 from fastapi import WebSocket
 import asyncio
+import json
+import logging
+import math
+import os
+import random
+import time
+
+from app.presence_writer import presence_writer
+
+# Presence changes within this window are folded into a single broadcast so a
+# reconnect storm does not fan out one full presence list per connecting socket.
+PRESENCE_COALESCE_SECONDS = float(os.getenv("WS_PRESENCE_COALESCE_SECONDS", "0.25"))
+
+# Drain: sockets are closed in WS_DRAIN_WAVES waves spread over WS_DRAIN_SECONDS,
+# and each client is told to wait a random delay in the reconnect window first.
+WS_DRAIN_WAVES = int(os.getenv("WS_DRAIN_WAVES", "10"))
+WS_DRAIN_SECONDS = float(os.getenv("WS_DRAIN_SECONDS", "8"))
+WS_DRAIN_RECONNECT_MIN_SECONDS = float(os.getenv("WS_DRAIN_RECONNECT_MIN_SECONDS", "1"))
+WS_DRAIN_RECONNECT_MAX_SECONDS = float(os.getenv("WS_DRAIN_RECONNECT_MAX_SECONDS", "30"))
+# Drained users stay online in the DB so they don't flicker while reconnecting
+# elsewhere; those that haven't come back this long after the drain are
+# marked offline
+WS_DRAIN_OFFLINE_AFTER_SECONDS = float(os.getenv("WS_DRAIN_OFFLINE_AFTER_SECONDS", "60"))
+# RFC 6455 "Service Restart"
+WS_SERVICE_RESTART = 1012
+
+logger = logging.getLogger("app.ws_manager")
 
 class ConnectionManager:
     def __init__(self):
@@ -12,6 +39,20 @@ class ConnectionManager:
         self.online_users: Set[str] = set()
         # socket metadata: websocket -> metadata dict (user_id, domain, role)
         self.socket_info: Dict[Any, Dict[str, Any]] = {}
+        # pending coalesced presence broadcast, if one is scheduled
+        self._presence_task: asyncio.Task | None = None
+        # set once drain() starts: new sockets are refused and offline
+        # presence is suppressed while existing sockets are closed in waves
+        self.draining = False
+        # space_id -> sockets subscribed to that space's membership/role events
+        self.space_topics: Dict[str, Set[WebSocket]] = {}
+        # socket -> space_ids it is subscribed to (only topic-enabled sockets)
+        self.socket_spaces: Dict[Any, Set[str]] = {}
+        self._drain_task: asyncio.Task | None = None
+        self._settle_task: asyncio.Task | None = None
+        # str user id -> (user id, lastActive written) for users whose last
+        # socket a drain closed
+        self._drained_users: Dict[str, tuple] = {}
 
     async def connect(self, chat_id: str, websocket: WebSocket, user_id: str = None, meta: dict = None):
         # websocket.accept() must be called by the route once before handing
@@ -31,8 +72,8 @@ class ConnectionManager:
             except Exception:
                 pass
 
-        # Broadcast the updated list to EVERYONE immediately
-        await self.broadcast_presence()
+        # Broadcast the updated list to everyone (coalesced with other changes)
+        self.schedule_presence_broadcast()
 
     async def disconnect(self, chat_id: str, websocket: WebSocket, user_id: str = None):
         if chat_id in self.active_connections:
@@ -55,6 +96,8 @@ class ConnectionManager:
                     del self.user_connections[uid]
                     self.online_users.discard(uid)
 
+        self.unsubscribe_socket(websocket)
+
         # Remove socket metadata if present
         try:
             if websocket in self.socket_info:
@@ -62,8 +105,11 @@ class ConnectionManager:
         except Exception:
             pass
 
-        # Broadcast the updated presence list to everyone
-        await self.broadcast_presence()
+        # Broadcast the updated presence list to everyone (coalesced). While
+        # draining the users are about to reconnect elsewhere, so don't flip
+        # them offline for everyone else.
+        if not self.draining:
+            self.schedule_presence_broadcast()
 
     async def send_to_user(self, user_id: str, message: dict):
         """Sends a private real-time update to a specific user"""
@@ -76,6 +122,16 @@ class ConnectionManager:
             if tasks:
                 await asyncio.gather(*tasks, return_exceptions=True)
 
+    async def send_to_users(self, user_ids, message: dict) -> int:
+        """Deliver one event to every socket of the given users, encoding it once."""
+        sockets = {ws for uid in user_ids for ws in self.user_connections.get(str(uid), ())}
+        if not sockets:
+            return 0
+        text = json.dumps(message, default=str)
+        tasks = [asyncio.create_task(self._safe_send_text(ws, text)) for ws in sockets]
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return len(sockets)
+
     async def broadcast(self, chat_id: str, message: dict):
         # Send concurrently to all clients in the chat to reduce latency
         tasks = [asyncio.create_task(self._safe_send(ws, message))
@@ -83,6 +139,19 @@ class ConnectionManager:
         if tasks:
             await asyncio.gather(*tasks, return_exceptions=True)
 
+    def schedule_presence_broadcast(self):
+        """Queue one presence broadcast covering every change in the coalesce window."""
+        if self._presence_task and not self._presence_task.done():
+            return
+        self._presence_task = asyncio.create_task(self._coalesced_presence_broadcast())
+
+    async def _coalesced_presence_broadcast(self):
+        try:
+            await asyncio.sleep(PRESENCE_COALESCE_SECONDS)
+        finally:
+            self._presence_task = None
+        await self.broadcast_presence()
+
     async def broadcast_presence(self):
         presence_msg = {"type": "presence_update", "online_users": list(self.online_users)}
         # Send this list to every websocket across all chats concurrently
@@ -114,6 +183,176 @@ class ConnectionManager:
         if tasks:
             await asyncio.gather(*tasks, return_exceptions=True)
 
+    def subscribe_spaces(self, websocket: WebSocket, space_ids):
+        """Subscribe a socket to space topics and enable it for later membership changes."""
+        subscribed = self.socket_spaces.setdefault(websocket, set())
+        for space_id in space_ids or []:
+            if space_id is None:
+                continue
+            sid = str(space_id)
+            subscribed.add(sid)
+            self.space_topics.setdefault(sid, set()).add(websocket)
+
+    def unsubscribe_socket(self, websocket: WebSocket):
+        for sid in self.socket_spaces.pop(websocket, set()):
+            topic = self.space_topics.get(sid)
+            if topic is None:
+                continue
+            topic.discard(websocket)
+            if not topic:
+                del self.space_topics[sid]
+
+    def _topic_sockets_for_user(self, user_id):
+        return [ws for ws in self.user_connections.get(str(user_id), []) if ws in self.socket_spaces]
+
+    def subscribe_user_to_space(self, user_id, space_id):
+        """Add every topic-enabled socket of a user to a space topic."""
+        for ws in self._topic_sockets_for_user(user_id):
+            self.subscribe_spaces(ws, [space_id])
+
+    def unsubscribe_user_from_space(self, user_id, space_id):
+        sid = str(space_id)
+        topic = self.space_topics.get(sid)
+        for ws in self._topic_sockets_for_user(user_id):
+            self.socket_spaces.get(ws, set()).discard(sid)
+            if topic is not None:
+                topic.discard(ws)
+        if topic is not None and not topic:
+            del self.space_topics[sid]
+
+    def drop_space_topic(self, space_id):
+        sid = str(space_id)
+        for ws in self.space_topics.pop(sid, set()):
+            self.socket_spaces.get(ws, set()).discard(sid)
+
+    async def publish_space(self, space_id, message: dict):
+        """Deliver one event to every socket subscribed to a space, encoding it once."""
+        sockets = list(self.space_topics.get(str(space_id), ()))
+        if not sockets:
+            return
+        text = json.dumps(message, default=str)
+        tasks = [asyncio.create_task(self._safe_send_text(ws, text)) for ws in sockets]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def all_sockets(self) -> List[WebSocket]:
+        seen = set()
+        sockets = []
+        for chat_group in self.active_connections.values():
+            for ws in chat_group:
+                if id(ws) not in seen:
+                    seen.add(id(ws))
+                    sockets.append(ws)
+        return sockets
+
+    def reconnect_delay_seconds(self) -> float:
+        return random.uniform(WS_DRAIN_RECONNECT_MIN_SECONDS, max(WS_DRAIN_RECONNECT_MIN_SECONDS, WS_DRAIN_RECONNECT_MAX_SECONDS))
+
+    def start_drain(self, offline_after: float = WS_DRAIN_OFFLINE_AFTER_SECONDS, **kwargs):
+        """Run drain() in the background, then settle drained users' presence after `offline_after`."""
+        if self.draining:
+            return None
+        # Set here, not in the task, so a second request can't start another drain
+        self.draining = True
+        self._drain_task = asyncio.create_task(self._close_in_waves(**kwargs))
+        self._settle_task = asyncio.create_task(self._settle_after_drain(self._drain_task, offline_after))
+        return self._drain_task
+
+    def end_drain(self):
+        """Accept sockets again, e.g. when a drain is not followed by a restart.
+
+        Waves not yet closed are left open; presence of users already drained
+        is still settled after the drain window.
+        """
+        if not self.draining:
+            return False
+        if self._drain_task and not self._drain_task.done():
+            self._drain_task.cancel()
+        self.draining = False
+        self.schedule_presence_broadcast()
+        return True
+
+    def note_drained(self, user_id) -> int:
+        """Remember a user whose last socket a drain closed; returns the lastActive to record."""
+        last_active = int(time.time())
+        self._drained_users[str(user_id)] = (user_id, last_active)
+        return last_active
+
+    async def _settle_after_drain(self, drain_task: asyncio.Task, delay: float):
+        try:
+            await drain_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        await asyncio.sleep(delay)
+        try:
+            await self.settle_drained_presence()
+        except Exception as exc:
+            logger.warning("Failed to settle presence of drained users: %s", exc)
+
+    async def settle_drained_presence(self) -> int:
+        """Mark drained users that have not reconnected here as offline.
+
+        Users whose presence was written since (they reconnected to another
+        instance) are left alone; see PresenceWriteBuffer.settle_offline().
+        """
+        drained, self._drained_users = self._drained_users, {}
+        states = [state for key, state in drained.items() if key not in self.online_users]
+        if not states:
+            return 0
+        return await presence_writer.settle_offline(states)
+
+    async def drain(self, waves: int = WS_DRAIN_WAVES, duration: float = WS_DRAIN_SECONDS):
+        """Stop accepting sockets and close the existing ones gradually.
+
+        Every socket first receives a `reconnect_after` frame with its own
+        randomized delay, then sockets are closed with 1012 in `waves` batches
+        spaced evenly over `duration` seconds. Returns the number of sockets
+        that were drained; calling it again while draining is a no-op.
+        """
+        if self.draining:
+            return 0
+        self.draining = True
+        return await self._close_in_waves(waves, duration)
+
+    async def _close_in_waves(self, waves: int = WS_DRAIN_WAVES, duration: float = WS_DRAIN_SECONDS):
+        sockets = self.all_sockets()
+        random.shuffle(sockets)
+        logger.info("Draining %s websocket(s) in up to %s wave(s) over %ss", len(sockets), waves, duration)
+        if not sockets:
+            return 0
+
+        hints = [
+            asyncio.create_task(self._safe_send(ws, {
+                "type": "reconnect_after",
+                "reason": "server_draining",
+                "delayMs": int(self.reconnect_delay_seconds() * 1000),
+            }))
+            for ws in sockets
+        ]
+        await asyncio.gather(*hints, return_exceptions=True)
+
+        wave_count = max(1, min(waves, len(sockets)))
+        wave_size = math.ceil(len(sockets) / wave_count)
+        pause = duration / wave_count if wave_count > 1 else 0
+        for start in range(0, len(sockets), wave_size):
+            if start:
+                await asyncio.sleep(pause)
+            closes = [asyncio.create_task(self._safe_close(ws, WS_SERVICE_RESTART, "server draining"))
+                      for ws in sockets[start:start + wave_size]]
+            await asyncio.gather(*closes, return_exceptions=True)
+        return len(sockets)
+
+    async def _safe_close(self, ws: WebSocket, code: int, reason: str):
+        try:
+            await ws.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    async def _safe_send_text(self, ws: WebSocket, text: str):
+        try:
+            await ws.send_text(text)
+        except Exception:
+            pass
+
     async def _safe_send(self, ws: WebSocket, message: dict):
         try:
             await ws.send_json(message)
@@ -0,0 +1,10 @@
+"""Compute edge n-gram search tokens for existing users so typeahead search
+can use the search_tokens index.
+
+Run from the backend folder: python backfill_search_tokens.py
+"""
+import json
+
+from app.core.user_search import backfill_search_tokens
+
+print(json.dumps(backfill_search_tokens()))
@@ -0,0 +1,96 @@
+"""Compare the full `serialize_user` + default JSON rendering against the
+PUBLIC_USER_PROJECTION fast path on synthetic user documents.
+
+Run from the backend folder: python bench_user_serializers.py [count] [repeat]
+No database access is needed.
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault("MONGO_SERVER_SELECTION_TIMEOUT_MS", "100")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.core.json_response import FastJSONResponse
+from app.routes.users import (
+    PUBLIC_USER_PROJECTION,
+    build_user_index_fields,
+    normalize_professional_profile,
+    serialize_public_user,
+    serialize_user,
+)
+
+
+def make_user(n):
+    user = {
+        "id": 1700000000000 + n,
+        "name": f"User Number {n}",
+        "email": f"user{n}@example{n % 50}.com",
+        "password": "$2b$12$" + "x" * 53,
+        "avatar_url": f"https://cdn.example.com/avatars/{n}.png",
+        "avatar_version": n % 7,
+        "status": "online" if n % 3 else "",
+        "isOnline": bool(n % 2),
+        "lastActive": 1700000000000 + n * 1000,
+        "role": "member",
+        "organizationId": f"org-{n % 50}",
+        "spaces": list(range(n % 10)),
+        "friends": [1700000000000 + (n + k) % 10000 for k in range(1, 20)],
+        "invitePermissions": {"canInviteAll": False, "canInviteCompanyOnly": True},
+        "integrations": {"google": {"connected": True, "email": f"user{n}@example.com"}},
+        "notifications": [{"id": f"notif-{n}-{k}", "type": "info", "status": "read"} for k in range(10)],
+    }
+    raw_profile = {"companyName": f" Company {n % 50} ", "position": "Engineer", "linkedinUrl": f"www.linkedin.com/in/user{n}"}
+    if n % 3 == 0:
+        # Older document: aliases at the top level, never normalized
+        user.update(raw_profile)
+    else:
+        profile = normalize_professional_profile(raw_profile)
+        user.update({"professionalProfile": profile, **profile, "profile_normalized": True})
+    user.update(build_user_index_fields(user))
+    return user
+
+
+def project(doc, projection):
+    return {key: value for key, value in doc.items() if projection.get(key)}
+
+
+def current_path(docs):
+    users = [serialize_user(doc) for doc in docs]
+    return JSONResponse(jsonable_encoder(users)).body
+
+
+def fast_path(docs):
+    users = [serialize_public_user(doc) for doc in docs]
+    return FastJSONResponse(users).body
+
+
+def best_of(fn, docs, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn(docs)
+        timings.append(time.perf_counter() - started)
+    return min(timings), len(body)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    docs = [make_user(n) for n in range(count)]
+    # What Mongo returns for each path's projection
+    full_docs = [{k: v for k, v in doc.items() if k not in ("password", "notifications", "search_tokens")} for doc in docs]
+    public_docs = [project(doc, PUBLIC_USER_PROJECTION) for doc in docs]
+
+    current_seconds, current_bytes = best_of(current_path, full_docs, repeat)
+    fast_seconds, fast_bytes = best_of(fast_path, public_docs, repeat)
+    print(f"{count} users, best of {repeat}")
+    print(f"  serialize_user + JSONResponse:            {current_seconds * 1000:8.1f} ms  {current_bytes:>10} bytes")
+    print(f"  serialize_public_user + FastJSONResponse: {fast_seconds * 1000:8.1f} ms  {fast_bytes:>10} bytes")
+    print(f"  speedup: {current_seconds / fast_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
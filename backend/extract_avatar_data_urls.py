@@ -0,0 +1,13 @@
+"""Move inline data-URL avatars out of user documents into the file store,
+with resized variants, and point `avatar_url` at the versioned thumbnail.
+
+Run from the backend folder: python extract_avatar_data_urls.py [batch_size] [limit]
+"""
+import json
+import sys
+
+from app.core.avatars import extract_avatar_data_urls
+
+batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+limit = int(sys.argv[2]) if len(sys.argv) > 2 else None
+print(json.dumps(extract_avatar_data_urls(batch_size=batch_size, limit=limit)))
@@ -0,0 +1,10 @@
+"""Index the file attachments of existing messages into attachment_refs so
+download access checks stop scanning the messages collection.
+
+Run from the backend folder: python migrate_attachment_refs.py
+"""
+import json
+
+from app.core.attachment_refs import backfill_attachment_refs
+
+print(json.dumps(backfill_attachment_refs()))
@@ -0,0 +1,11 @@
+"""Load existing friendships and pending connection requests into the
+connections edge collection so relationship checks stop scanning the
+notifications embedded in user documents.
+
+Run from the backend folder: python migrate_connections.py
+"""
+import json
+
+from app.core.connections import backfill_connections
+
+print(json.dumps(backfill_connections()))
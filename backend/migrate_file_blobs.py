@@ -0,0 +1,13 @@
+"""Move legacy inline file blobs (files.data) into chunked GridFS storage,
+then link already-stored files to shared, reference-counted content.
+
+Run from the backend folder: python migrate_file_blobs.py [limit]
+"""
+import json
+import sys
+
+from app.core.file_storage import backfill_content_refs, migrate_inline_blobs
+
+limit = int(sys.argv[1]) if len(sys.argv) > 1 else None
+print(json.dumps(migrate_inline_blobs(limit=limit)))
+print(json.dumps(backfill_content_refs()))
@@ -0,0 +1,10 @@
+"""Store normalized professional profiles (flagged `profile_normalized`) on
+existing users so the public user serializer can skip re-normalizing them.
+
+Run from the backend folder: python normalize_user_profiles.py
+"""
+import json
+
+from app.routes.users import backfill_normalized_profiles
+
+print(json.dumps(backfill_normalized_profiles()))
@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import mongomock
+import pytest
+from pymongo import UpdateOne
+
+# Keep import-time side effects (storage dirs, Mongo client) away from real paths
+_STORAGE_ROOT = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.setdefault("FILE_STORAGE_DIR", os.path.join(_STORAGE_ROOT, "uploaded_files"))
+os.environ.setdefault("DRIVE_CACHE_DIR", os.path.join(_STORAGE_ROOT, "drive_cache"))
+os.environ.setdefault("MONGO_SERVER_SELECTION_TIMEOUT_MS", "100")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _bulk_write(collection, requests, ordered=True, **kwargs):
+    # mongomock's bulk API predates pymongo 4's UpdateOne(sort=...); apply
+    # the updates the app uses one at a time instead
+    matched = modified = 0
+    for request in requests:
+        if not isinstance(request, UpdateOne):
+            raise NotImplementedError(f"bulk {type(request).__name__} in tests")
+        result = collection.update_one(request._filter, request._doc, upsert=request._upsert)
+        matched += result.matched_count
+        modified += result.modified_count
+    return SimpleNamespace(matched_count=matched, modified_count=modified)
+
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", _bulk_write)
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture
+def local_store(tmp_path, monkeypatch, mongo_db):
+    """Local content-addressed storage in a temp dir, with collections in mongo_db."""
+    from app.core import file_storage
+
+    backend = file_storage.LocalStorageBackend(str(tmp_path / "store"))
+    monkeypatch.setitem(file_storage.STORAGE_BACKENDS, "local", backend)
+    monkeypatch.setattr(file_storage, "FILE_STORAGE_BACKEND", "local")
+    monkeypatch.setattr(file_storage, "file_contents_collection", mongo_db.file_contents)
+    monkeypatch.setattr(file_storage, "files_collection", mongo_db.files)
+    return backend
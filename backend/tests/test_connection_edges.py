@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from app.core import connections
+from app.core.connections import edge_between, edge_id
+from app.routes import actions, notifications
+
+ALICE = {"id": 1, "name": "Alice", "email": "alice@acme.com", "friends": []}
+BOB = {"id": 2, "name": "Bob", "email": "bob@acme.com", "friends": []}
+
+
+@pytest.fixture
+def people(monkeypatch, mongo_db):
+    monkeypatch.setattr(actions, "users_collection", mongo_db.users)
+    monkeypatch.setattr(notifications, "users_collection", mongo_db.users)
+    monkeypatch.setattr(notifications, "notifications_collection", mongo_db.notifications)
+    monkeypatch.setattr(connections, "connections_collection", mongo_db.connections)
+    monkeypatch.setattr(connections, "users_collection", mongo_db.users)
+    monkeypatch.setattr(connections, "_ready_cache", {"ready": False, "checkedAt": float("-inf")})
+    # mongomock lacks the positional projection of the embedded-array lookup;
+    # read through its notifications-collection fallback instead
+    monkeypatch.setattr(
+        notifications,
+        "_get_user_notification",
+        lambda user_id, notification_id: notifications.normalize_notification(
+            mongo_db.notifications.find_one({"id": notification_id, "recipientId": str(user_id)}, {"_id": 0})
+        ),
+    )
+    # Edges are authoritative once the backfill marker exists
+    connections.backfill_connections()
+    mongo_db.users.insert_many([dict(ALICE), dict(BOB)])
+    return mongo_db.users
+
+
+def _act_as(monkeypatch, people, user_id):
+    actor = people.find_one({"id": user_id})
+    monkeypatch.setattr(actions, "require_actor", lambda request: actor)
+    monkeypatch.setattr(notifications, "_get_actor", lambda request: actor)
+
+
+def _send_request(monkeypatch, people):
+    _act_as(monkeypatch, people, 1)
+    result = asyncio.run(actions.send_friend_request(None, {"toUserId": 2}))
+    assert result["status"] == "sent"
+    return result["notificationId"]
+
+
+def test_send_records_a_pending_edge(monkeypatch, people):
+    notification_id = _send_request(monkeypatch, people)
+
+    edge = edge_between(1, 2)
+    assert edge["_id"] == edge_id(2, 1)
+    assert (edge["state"], edge["fromId"], edge["requestId"]) == ("pending", "1", notification_id)
+    # A repeat send is answered from the edge
+    assert asyncio.run(actions.send_friend_request(None, {"toUserId": 2})) == {"status": "pending"}
+
+
+def test_accept_friend_connects_the_edge(monkeypatch, people):
+    notification_id = _send_request(monkeypatch, people)
+    _act_as(monkeypatch, people, 2)
+
+    assert asyncio.run(actions.accept_friend(None, {"friendId": 1, "notificationId": notification_id})) == {"status": "accepted"}
+    assert edge_between(1, 2)["state"] == "connected"
+
+
+def test_accept_notification_connects_the_edge(monkeypatch, people):
+    notification_id = _send_request(monkeypatch, people)
+
+    asyncio.run(notifications.accept_notification_for_user(2, notification_id))
+    assert edge_between(2, 1)["state"] == "connected"
+    # Requests can't downgrade a connection
+    connections.record_request(1, 2, "late")
+    assert edge_between(1, 2)["state"] == "connected"
+
+
+def test_reject_friend_drops_the_pending_edge(monkeypatch, people):
+    notification_id = _send_request(monkeypatch, people)
+    _act_as(monkeypatch, people, 2)
+
+    assert asyncio.run(actions.reject_friend(None, {"friendId": 1, "notificationId": notification_id}))["status"] == "rejected"
+    assert edge_between(1, 2) is None
+
+
+def test_decline_notification_drops_the_pending_edge(monkeypatch, people):
+    notification_id = _send_request(monkeypatch, people)
+
+    asyncio.run(notifications.decline_notification_for_user(2, notification_id))
+    assert edge_between(1, 2) is None
+
+
+def test_decline_leaves_an_existing_connection(monkeypatch, people):
+    notification_id = _send_request(monkeypatch, people)
+    connections.record_connection(1, 2)
+
+    asyncio.run(notifications.decline_notification_for_user(2, notification_id))
+    assert edge_between(1, 2)["state"] == "connected"
+
+
+def test_withdraw_from_sender_copy_drops_the_pending_edge(monkeypatch, people):
+    notification_id = _send_request(monkeypatch, people)
+    copy = asyncio.run(notifications.create_notification(
+        recipient_id=1,
+        sender_id=1,
+        type="connection_invite",
+        action_status="pending",
+        metadata={"recipientId": "2", "managedNotificationId": notification_id, "senderCopy": True},
+    ))
+    _act_as(monkeypatch, people, 1)
+
+    assert notifications.withdraw_notification(None, copy["id"])["status"] == "withdrawn"
+    assert edge_between(1, 2) is None
+
+
+def test_withdraw_by_recipient_drops_the_pending_edge(monkeypatch, people):
+    notification_id = _send_request(monkeypatch, people)
+    _act_as(monkeypatch, people, 2)
+
+    notifications.withdraw_notification(None, notification_id)
+    assert edge_between(1, 2) is None
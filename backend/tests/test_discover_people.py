@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from app import recommendations as recommendations_module
+from app.core import connections
+from app.routes import users
+
+COMPANY_ONLY = {"canInviteAll": False, "canInviteCompanyOnly": True}
+EVERYONE = {"canInviteAll": True, "canInviteCompanyOnly": False}
+
+
+@pytest.fixture
+def people(monkeypatch, mongo_db):
+    monkeypatch.setattr(users, "users_collection", mongo_db.users)
+    monkeypatch.setattr(users, "organizations_collection", mongo_db.organizations)
+    monkeypatch.setattr(recommendations_module, "recommendations_collection", mongo_db.recommendations)
+    monkeypatch.setattr(connections, "connections_collection", mongo_db.connections)
+    monkeypatch.setattr(connections, "_ready_cache", {"ready": False, "checkedAt": float("-inf")})
+    monkeypatch.setattr(users.recommendations, "_dirty", set())
+    mongo_db.users.insert_many([
+        {"id": 1, "name": "Requester", "email": "req@acme.com", "organizationId": "acme", "invitePermissions": EVERYONE, "friends": []},
+        {"id": 2, "name": "Colleague", "email": "col@acme.com", "organizationId": "acme", "friends": []},
+        {"id": 3, "name": "Outsider", "email": "out@globex.com", "organizationId": "globex", "friends": []},
+    ])
+    # Built while the requester could still see everyone
+    mongo_db.recommendations.insert_one({"userId": "1", "candidates": [{"id": "3", "score": 2}, {"id": "2", "score": 1}]})
+    return mongo_db.users
+
+
+def _discover(monkeypatch, people):
+    monkeypatch.setattr(users, "resolve_requester", lambda request: people.find_one({"id": 1}, {"_id": 0}))
+    return [card["id"] for card in users.discover_people_core(None)]
+
+
+def _ids(cards):
+    return [str(card_id) for card_id in cards]
+
+
+def test_stored_list_is_filtered_by_current_permissions(monkeypatch, people):
+    assert _ids(_discover(monkeypatch, people)) == ["3", "2"]
+
+    people.update_one({"id": 1}, {"$set": {"invitePermissions": COMPANY_ONLY}})
+    assert _ids(_discover(monkeypatch, people)) == ["2"]
+
+
+def test_candidate_organization_change_applies_before_refresh(monkeypatch, people):
+    people.update_one({"id": 1}, {"$set": {"invitePermissions": COMPANY_ONLY}})
+    people.update_one({"id": 3}, {"$set": {"organizationId": "acme"}})
+
+    assert _ids(_discover(monkeypatch, people)) == ["3", "2"]
+
+
+def test_permission_change_marks_the_list_dirty(monkeypatch, people):
+    requester = people.find_one({"id": 1}, {"_id": 0})
+    monkeypatch.setattr(users, "resolve_requester", lambda request: requester)
+
+    asyncio.run(users.update_user("1", {"name": "Renamed"}, None))
+    assert users.recommendations.snapshot()["pendingRefreshes"] == 0
+
+    asyncio.run(users.update_user("1", {"invitePermissions": COMPANY_ONLY}, None))
+    assert users.recommendations._dirty == {"1"}
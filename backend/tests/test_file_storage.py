@@ -0,0 +1,110 @@
+import hashlib
+import os
+
+import pytest
+
+from app.core import file_storage
+
+
+def _temp_file(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path), hashlib.sha256(data).hexdigest()
+
+
+def test_store_deduplicated_links_identical_content(tmp_path, local_store):
+    first_path, sha256 = _temp_file(tmp_path, "a.txt", b"same bytes")
+    second_path, _ = _temp_file(tmp_path, "b.txt", b"same bytes")
+
+    first, first_deduplicated = file_storage.store_deduplicated(first_path, "a.txt", sha256, 10)
+    second, second_deduplicated = file_storage.store_deduplicated(second_path, "b.txt", sha256, 10)
+
+    assert not first_deduplicated
+    assert second_deduplicated
+    assert first == second == {"storage": "local", "storageKey": local_store.key_for(sha256), "size": 10}
+    assert file_storage.file_contents_collection.find_one({"_id": sha256})["refCount"] == 2
+    # The duplicate upload is left for the caller's temp cleanup, not moved in
+    assert os.path.exists(second_path)
+
+
+def test_release_content_deletes_bytes_with_last_reference(tmp_path, local_store):
+    data = b"shared"
+    sha256 = hashlib.sha256(data).hexdigest()
+    docs = []
+    for name in ("a", "b"):
+        path, _ = _temp_file(tmp_path, name, data)
+        fields, _ = file_storage.store_deduplicated(path, name, sha256, len(data))
+        docs.append({"sha256": sha256, "contentLinked": True, **fields})
+    stored_path = local_store.local_path(docs[0])
+
+    assert file_storage.release_content(docs[0]) is False
+    assert os.path.exists(stored_path)
+    assert file_storage.file_contents_collection.find_one({"_id": sha256})["refCount"] == 1
+
+    assert file_storage.release_content(docs[1]) is True
+    assert not os.path.exists(stored_path)
+    assert file_storage.file_contents_collection.find_one({"_id": sha256}) is None
+
+
+def test_store_deduplicated_does_not_link_content_being_released(tmp_path, local_store):
+    path, sha256 = _temp_file(tmp_path, "a", b"payload")
+    file_storage.file_contents_collection.insert_one({"_id": sha256, "refCount": 0, "storage": "local", "storageKey": "gone"})
+
+    with pytest.raises(RuntimeError):
+        file_storage.store_deduplicated(path, "a", sha256, 7)
+
+
+def test_release_content_keeps_unshared_location_still_referenced(tmp_path, local_store):
+    path, sha256 = _temp_file(tmp_path, "legacy", b"legacy bytes")
+    fields = local_store.store(path, "legacy", sha256=sha256)
+    file_storage.files_collection.insert_many([{"_id": 1, **fields}, {"_id": 2, **fields}])
+
+    assert file_storage.release_content({"_id": 1, **fields}) is False
+    assert local_store.local_path(fields)
+
+    file_storage.files_collection.delete_one({"_id": 1})
+    assert file_storage.release_content({"_id": 2, **fields}) is True
+    assert local_store.local_path(fields) is None
+
+
+def test_release_content_of_unlinked_doc_keeps_shared_reference(tmp_path, local_store):
+    data = b"backfill pending"
+    sha256 = hashlib.sha256(data).hexdigest()
+    path, _ = _temp_file(tmp_path, "linked", data)
+    fields, _ = file_storage.store_deduplicated(path, "linked", sha256, len(data))
+    linked = {"_id": "linked", "sha256": sha256, "contentLinked": True, **fields}
+    # A pre-dedupe copy of the same bytes under its own key, not yet backfilled
+    legacy_path, _ = _temp_file(tmp_path, "legacy", data)
+    legacy_key = os.path.join("legacy", sha256)
+    os.makedirs(os.path.join(local_store.root, "legacy"))
+    os.replace(legacy_path, os.path.join(local_store.root, legacy_key))
+    unlinked = {"_id": "unlinked", "sha256": sha256, "storage": "local", "storageKey": legacy_key}
+    file_storage.files_collection.insert_one(linked)
+
+    assert file_storage.release_content(unlinked) is True
+    assert local_store.local_path(unlinked) is None
+    assert local_store.local_path(linked)
+    assert file_storage.file_contents_collection.find_one({"_id": sha256})["refCount"] == 1
+
+
+def test_release_content_of_unlinked_doc_at_shared_location(tmp_path, local_store):
+    data = b"same key"
+    sha256 = hashlib.sha256(data).hexdigest()
+    path, _ = _temp_file(tmp_path, "linked", data)
+    fields, _ = file_storage.store_deduplicated(path, "linked", sha256, len(data))
+    file_storage.files_collection.insert_one({"_id": "linked", "sha256": sha256, "contentLinked": True, **fields})
+
+    assert file_storage.release_content({"_id": "unlinked", "sha256": sha256, **fields}) is False
+    assert local_store.local_path(fields)
+    assert file_storage.file_contents_collection.find_one({"_id": sha256})["refCount"] == 1
+
+
+def test_incomplete_backend_fails_at_instantiation():
+    class WriteOnly(file_storage.StorageBackend):
+        name = "write-only"
+
+        def store(self, path, filename, sha256=None, file_doc_id=None):
+            return {}
+
+    with pytest.raises(TypeError):
+        WriteOnly()
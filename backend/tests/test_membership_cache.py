@@ -0,0 +1,87 @@
+import pytest
+
+from app import membership_cache as membership_module
+from app.membership_cache import MembershipCache
+
+
+@pytest.fixture
+def cache(monkeypatch, mongo_db):
+    monkeypatch.setattr(membership_module, "spaces_collection", mongo_db.spaces)
+    monkeypatch.setattr(membership_module, "users_collection", mongo_db.users)
+    mongo_db.spaces.insert_many([
+        {"id": 1, "ownerId": 10, "members": [11]},
+        {"id": 2, "createdBy": "12", "channels": [{"members": [13]}]},
+    ])
+    mongo_db.users.insert_many([
+        {"id": 10, "spaces": [1]},
+        {"id": 14, "spaces": [2]},
+    ])
+    return MembershipCache(max_entries=100, ttl=600)
+
+
+def test_loads_membership_from_spaces_and_user_documents(cache):
+    assert cache.space_ids_for(10) == {"1"}
+    assert cache.space_ids_for("13") == {"2"}
+    assert cache.space_ids_for(14) == {"2"}
+    assert cache.space_ids_for(99) == frozenset()
+    assert cache.sharing_with(12, [13, 14, 10, 99]) == {"13", "14"}
+
+
+def test_serves_from_cache_until_space_is_invalidated(cache, mongo_db):
+    assert cache.space_ids_for(11) == {"1"}
+    mongo_db.spaces.update_one({"id": 1}, {"$pull": {"members": 11}})
+
+    assert cache.space_ids_for(11) == {"1"}
+    assert cache.hits_total == 1
+
+    cache.invalidate_space(1)
+    assert cache.space_ids_for(11) == frozenset()
+
+
+def test_invalidate_space_drops_newly_added_members(cache, mongo_db):
+    assert not cache.shares_space(10, 15)
+    mongo_db.spaces.update_one({"id": 1}, {"$push": {"members": 15}})
+
+    # 15 had no spaces, so only passing it explicitly reaches its entry
+    cache.invalidate_space(1, 15)
+    assert cache.shares_space(10, 15)
+
+
+def test_invalidate_space_leaves_unrelated_entries(cache):
+    cache.space_ids_for_many([10, 13])
+    cache.invalidate_space(1)
+
+    assert cache.snapshot()["entries"] == 1
+    cache.space_ids_for(13)
+    assert cache.hits_total == 1
+
+
+def test_invalidate_user(cache, mongo_db):
+    assert cache.space_ids_for(14) == {"2"}
+    mongo_db.users.update_one({"id": 14}, {"$set": {"spaces": [1, 2]}})
+
+    cache.invalidate_user("14")
+    assert cache.space_ids_for(14) == {"1", "2"}
+
+
+def test_load_overlapping_an_invalidation_is_not_cached(cache, monkeypatch):
+    real_find = membership_module.users_collection.find
+
+    def find_then_invalidate(*args, **kwargs):
+        cache.invalidate_user(10)
+        return real_find(*args, **kwargs)
+
+    monkeypatch.setattr(membership_module.users_collection, "find", find_then_invalidate)
+    assert cache.space_ids_for(10) == {"1"}
+    assert cache.snapshot()["entries"] == 0
+
+
+def test_evicts_least_recently_used(cache):
+    cache.max_entries = 2
+    cache.space_ids_for(10)
+    cache.space_ids_for(11)
+    cache.space_ids_for(10)
+    cache.space_ids_for(13)
+
+    assert set(cache._entries) == {"10", "13"}
+    assert "11" not in cache._space_dependents.get("1", set())
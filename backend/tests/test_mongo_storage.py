@@ -0,0 +1,92 @@
+import hashlib
+import io
+
+import pytest
+from mongomock.gridfs import enable_gridfs_integration
+
+from app.core import file_storage
+
+enable_gridfs_integration()
+
+CHUNK = 4
+DATA = bytes(range(23))
+
+
+@pytest.fixture
+def mongo_store(monkeypatch, mongo_db):
+    monkeypatch.setattr(file_storage, "FILE_CHUNK_SIZE_BYTES", CHUNK)
+    backend = file_storage.MongoStorageBackend(mongo_db)
+    # pymongo reads the client-side operation timeout from client.options,
+    # which a mongomock client doesn't have
+    backend.bucket._timeout = None
+    monkeypatch.setitem(file_storage.STORAGE_BACKENDS, "mongo", backend)
+    monkeypatch.setattr(file_storage, "files_collection", mongo_db.files)
+    return backend
+
+
+def _stored(tmp_path, backend, data=DATA):
+    path = tmp_path / "upload.bin"
+    path.write_bytes(data)
+    return {"_id": "doc", **backend.store(str(path), "upload.bin", file_doc_id="doc")}
+
+
+def test_store_writes_bounded_chunks(tmp_path, mongo_store, mongo_db):
+    doc = _stored(tmp_path, mongo_store)
+
+    chunks = list(mongo_db["file_blobs.chunks"].find({"files_id": doc["blobId"]}).sort("n", 1))
+    assert len(chunks) == 6
+    assert all(len(chunk["data"]) <= CHUNK for chunk in chunks)
+    assert mongo_store.blobs.find_one({"_id": doc["blobId"]})["metadata"] == {"fileDocId": "doc"}
+    assert mongo_store.size(doc) == len(DATA)
+
+
+def test_iter_range_streams_in_chunks(tmp_path, mongo_store):
+    doc = _stored(tmp_path, mongo_store)
+
+    pieces = list(mongo_store.iter_range(doc, 0, None, chunk_size=CHUNK))
+    assert b"".join(pieces) == DATA
+    assert max(len(piece) for piece in pieces) <= CHUNK
+
+    assert b"".join(mongo_store.iter_range(doc, 5, 13, chunk_size=CHUNK)) == DATA[5:14]
+    assert b"".join(mongo_store.iter_range(doc, 20, None, chunk_size=CHUNK)) == DATA[20:]
+
+
+def test_legacy_inline_data_is_served(mongo_store):
+    doc = {"_id": "legacy", "data": DATA}
+
+    assert mongo_store.has_content(doc)
+    assert mongo_store.size(doc) == len(DATA)
+    assert b"".join(mongo_store.iter_range(doc, 2, 4)) == DATA[2:5]
+
+
+def test_delete_removes_chunks_and_missing_blobs_yield_nothing(tmp_path, mongo_store, mongo_db):
+    doc = _stored(tmp_path, mongo_store)
+
+    mongo_store.delete(doc)
+    assert mongo_db["file_blobs.chunks"].count_documents({}) == 0
+    assert list(mongo_store.iter_range(doc, 0, None)) == []
+    mongo_store.delete(doc)
+
+
+def test_migrate_inline_blobs_moves_data_to_chunks(mongo_store, mongo_db):
+    mongo_db.files.insert_many([
+        {"_id": "legacy", "filename": "old.bin", "data": DATA},
+        {"_id": "current", "filename": "new.bin", "storage": "mongo", "blobId": "elsewhere"},
+    ])
+
+    assert file_storage.migrate_inline_blobs() == {"migrated": 1, "failed": 0}
+    migrated = mongo_db.files.find_one({"_id": "legacy"})
+    assert "data" not in migrated
+    assert migrated["sha256"] == hashlib.sha256(DATA).hexdigest()
+    assert migrated["size"] == len(DATA)
+    assert b"".join(mongo_store.iter_range(migrated, 0, None)) == DATA
+    assert file_storage.migrate_inline_blobs() == {"migrated": 0, "failed": 0}
+
+
+def test_migrate_reuses_blob_from_interrupted_run(mongo_store, mongo_db):
+    mongo_db.files.insert_one({"_id": "legacy", "filename": "old.bin", "data": DATA})
+    orphan = mongo_store.bucket.upload_from_stream("old.bin", io.BytesIO(DATA), metadata={"fileDocId": "legacy"})
+
+    file_storage.migrate_inline_blobs()
+    assert mongo_db.files.find_one({"_id": "legacy"})["blobId"] == orphan
+    assert mongo_store.blobs.count_documents({}) == 1
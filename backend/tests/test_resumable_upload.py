@@ -0,0 +1,130 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.routes import resumable_upload, upload
+
+USER = {"id": 7}
+DATA = b"resumable bytes"
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch, mongo_db, local_store):
+    monkeypatch.setattr(resumable_upload, "RESUMABLE_UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(resumable_upload, "upload_sessions_collection", mongo_db.upload_sessions)
+    monkeypatch.setattr(resumable_upload, "files_collection", mongo_db.files)
+    monkeypatch.setattr(upload, "files_collection", mongo_db.files)
+    monkeypatch.setattr(upload, "queue_previews", lambda *args, **kwargs: None)
+    monkeypatch.setattr(resumable_upload, "_active_finalizations", set())
+    return mongo_db.upload_sessions
+
+
+def _complete_session(sessions, upload_id="u1", **fields):
+    with open(resumable_upload._part_path(upload_id), "wb") as f:
+        f.write(DATA)
+    sessions.insert_one({
+        "_id": upload_id,
+        "userId": str(USER["id"]),
+        "filename": "notes.txt",
+        "mimetype": "text/plain",
+        "size": len(DATA),
+        "status": "open",
+        **fields,
+    })
+    return upload_id
+
+
+def _finish(session, job):
+    doc_id, staged, sha256 = job
+    return resumable_upload._finish_session_upload(session["_id"], doc_id, staged, "notes.txt", "text/plain", sha256)
+
+
+def test_duplicate_finalize_is_refused_while_the_first_holds_the_lease(sessions, mongo_db):
+    upload_id = _complete_session(sessions)
+    session, job, incomplete = resumable_upload._finalize_session(upload_id, USER)
+    assert incomplete is None
+
+    with pytest.raises(HTTPException) as exc:
+        resumable_upload._finalize_session(upload_id, USER)
+    assert exc.value.status_code == 409
+    assert resumable_upload._claim_abandoned_finalizations() == []
+
+    assert _finish(session, job)["status"] == "done"
+    assert mongo_db.files.count_documents({}) == 1
+    assert mongo_db.file_contents.find_one()["refCount"] == 1
+    finished = sessions.find_one({"_id": upload_id})
+    assert finished["status"] == "completed"
+    assert "finalizeOwner" not in finished and "finalizeLeaseUntil" not in finished
+
+
+def test_live_finalization_elsewhere_is_left_alone(sessions):
+    lease_until = (resumable_upload._now() + timedelta(minutes=5)).isoformat()
+    upload_id = _complete_session(sessions, status="finalizing", finalizeOwner="other-process", finalizeLeaseUntil=lease_until)
+
+    with pytest.raises(HTTPException) as exc:
+        resumable_upload._finalize_session(upload_id, USER)
+    assert exc.value.status_code == 409
+    assert resumable_upload._claim_abandoned_finalizations() == []
+    assert sessions.find_one({"_id": upload_id})["finalizeOwner"] == "other-process"
+
+
+def test_lapsed_lease_is_resumed_once_without_a_second_file(sessions, mongo_db):
+    upload_id = _complete_session(sessions)
+    first, job, _ = resumable_upload._finalize_session(upload_id, USER)
+    # The holder dies after staging: its lease lapses and nothing renews it
+    resumable_upload._active_finalizations.clear()
+    sessions.update_one({"_id": upload_id}, {"$set": {
+        "finalizeOwner": "dead-process",
+        "finalizeLeaseUntil": (resumable_upload._now() - timedelta(seconds=1)).isoformat(),
+    }})
+
+    resumed = resumable_upload._claim_abandoned_finalizations()
+    assert [session["_id"] for session, _job in resumed] == [upload_id]
+    assert resumed[0][1][0] == job[0]
+    assert resumable_upload._claim_abandoned_finalizations() == []
+
+    assert _finish(*resumed[0])["status"] == "done"
+    assert mongo_db.files.count_documents({}) == 1
+    assert sessions.find_one({"_id": upload_id})["status"] == "completed"
+
+
+def test_failed_staging_releases_the_lease_for_a_retry(sessions, monkeypatch):
+    upload_id = _complete_session(sessions)
+    real_stage = resumable_upload._stage_finalization
+
+    def fail_once(session):
+        monkeypatch.setattr(resumable_upload, "_stage_finalization", real_stage)
+        raise OSError("disk full")
+
+    monkeypatch.setattr(resumable_upload, "_stage_finalization", fail_once)
+    with pytest.raises(OSError):
+        resumable_upload._finalize_session(upload_id, USER)
+    assert sessions.find_one({"_id": upload_id})["status"] == "finalizing"
+    assert not resumable_upload._active_finalizations
+
+    session, job, _ = resumable_upload._finalize_session(upload_id, USER)
+    assert _finish(session, job)["status"] == "done"
+
+
+def test_finalize_waits_for_an_append_in_progress(sessions):
+    lease_until = (resumable_upload._now() + timedelta(seconds=60)).isoformat()
+    upload_id = _complete_session(sessions, leaseUntil=lease_until)
+
+    with pytest.raises(HTTPException) as exc:
+        resumable_upload._finalize_session(upload_id, USER)
+    assert exc.value.status_code == 409
+    assert sessions.find_one({"_id": upload_id})["status"] == "open"
+
+
+def test_renew_extends_only_this_process_leases(sessions):
+    ours = _complete_session(sessions, "ours")
+    resumable_upload._finalize_session(ours, USER)
+    theirs_until = (resumable_upload._now() + timedelta(seconds=30)).isoformat()
+    _complete_session(sessions, "theirs", status="finalizing", finalizeOwner="other-process", finalizeLeaseUntil=theirs_until)
+    resumable_upload._active_finalizations.add("theirs")
+    before = sessions.find_one({"_id": ours})["finalizeLeaseUntil"]
+
+    assert resumable_upload._renew_finalize_leases() == 1
+    assert sessions.find_one({"_id": ours})["finalizeLeaseUntil"] >= before
+    assert sessions.find_one({"_id": "theirs"})["finalizeLeaseUntil"] == theirs_until
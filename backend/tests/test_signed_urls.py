@@ -0,0 +1,53 @@
+from urllib.parse import parse_qs, urlsplit
+
+from app.core import signed_urls
+from app.core.signed_urls import sign_file_url, signed_expiry, verify_file_signature
+
+
+def _params(url):
+    query = parse_qs(urlsplit(url).query)
+    return query["exp"][0], query["sig"][0]
+
+
+def test_signed_url_round_trip():
+    url = sign_file_url("/upload/file/abc/download", "abc")
+    expires, signature = _params(url)
+
+    assert url.startswith("/upload/file/abc/download?exp=")
+    assert verify_file_signature("abc", expires, signature)
+
+
+def test_sign_file_url_extends_existing_query():
+    url = sign_file_url("/upload/file/abc/thumbnail?size=256", "abc")
+
+    assert url.startswith("/upload/file/abc/thumbnail?size=256&exp=")
+    assert verify_file_signature("abc", *_params(url))
+
+
+def test_signature_is_bound_to_file_and_expiry():
+    expires, signature = _params(sign_file_url("/f", "abc"))
+
+    assert not verify_file_signature("abd", expires, signature)
+    assert not verify_file_signature("abc", int(expires) + 1, signature)
+    assert not verify_file_signature("abc", expires, signature[:-1] + ("A" if signature[-1] != "A" else "B"))
+
+
+def test_rejects_expired_missing_and_malformed_values():
+    past = 1_000_000
+    expires, signature = _params(sign_file_url("/f", "abc", expires=past))
+
+    assert int(expires) == past
+    assert not verify_file_signature("abc", expires, signature)
+    assert not verify_file_signature("abc", signed_expiry(), "")
+    assert not verify_file_signature("abc", "soon", signature)
+    assert not verify_file_signature("abc", None, signature)
+
+
+def test_expiry_is_stable_within_a_window():
+    ttl = signed_urls.SIGNED_URL_TTL_SECONDS
+    start = 10 * ttl
+
+    assert signed_expiry(start) == signed_expiry(start + ttl - 1) == 12 * ttl
+    assert signed_expiry(start + ttl) == 13 * ttl
+    # Always at least one full window of validity left
+    assert signed_expiry(start + ttl - 1) - (start + ttl - 1) > ttl
@@ -0,0 +1,33 @@
+import pytest
+from bson import ObjectId
+
+from app.routes import upload
+
+
+@pytest.fixture
+def chat(monkeypatch, mongo_db):
+    monkeypatch.setattr(upload, "messages_collection", mongo_db.messages)
+    monkeypatch.setattr(upload, "files_collection", mongo_db.files)
+    monkeypatch.setattr(upload, "_check_channel_access", lambda chat_id, user_id: True)
+    monkeypatch.setattr(upload, "ARCHIVE_MAX_FILES", 3)
+
+    def attach(count):
+        for n in range(count):
+            oid = ObjectId()
+            mongo_db.files.insert_one({"_id": oid, "filename": f"f{n}.txt"})
+            mongo_db.messages.insert_one({"chatId": "c1", "message": {"timestamp": n, "attachments": [{"fileId": str(oid)}]}})
+    return attach
+
+
+def test_chat_archive_within_limit_keeps_message_order(chat):
+    chat(3)
+
+    docs = upload._archive_docs_for_chat({"id": 1}, "c1")
+    assert [doc["filename"] for doc in docs] == ["f0.txt", "f1.txt", "f2.txt"]
+
+
+def test_chat_archive_over_limit_is_refused_not_truncated(chat):
+    chat(4)
+
+    with pytest.raises(upload._ArchiveTooLarge):
+        upload._archive_docs_for_chat({"id": 1}, "c1")
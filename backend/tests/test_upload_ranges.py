@@ -0,0 +1,31 @@
+import pytest
+
+from app.routes.upload import _parse_range, _RangeNotSatisfiable
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, None),
+        ("", None),
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-", (100, 999)),
+        ("bytes=900-5000", (900, 999)),
+        ("bytes=-100", (900, 999)),
+        ("bytes=-5000", (0, 999)),
+        (" bytes=5-5 ", (5, 5)),
+        # Malformed or multi-range: serve the whole file
+        ("bytes=-", None),
+        ("bytes=0-1,5-6", None),
+        ("items=0-1", None),
+        ("bytes=a-b", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert _parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header, size", [("bytes=1000-", 1000), ("bytes=10-5", 1000), ("bytes=-0", 1000), ("bytes=-1", 0), ("bytes=0-", 0)])
+def test_parse_range_unsatisfiable(header, size):
+    with pytest.raises(_RangeNotSatisfiable):
+        _parse_range(header, size)
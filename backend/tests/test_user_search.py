@@ -0,0 +1,42 @@
+from app.core.user_search import build_search_tokens, relevance, search_terms
+
+
+def _rank(candidate, query):
+    return relevance(candidate, query, search_terms(query))
+
+
+def test_relevance_orders_match_kinds():
+    user = {"name": "Ada  Lovelace", "email": "countess@analytical.org", "companyName": "Engines"}
+
+    assert _rank(user, "ada lovelace") == 0
+    assert _rank(user, "  Ada Love") == 1
+    assert _rank(user, "love") == 2
+    assert _rank(user, "lov ad") == 2
+    assert _rank(user, "countess") == 3
+    assert _rank(user, "ada analytical") == 3
+    assert _rank(user, "engines") == 4
+
+
+def test_relevance_tolerates_missing_fields():
+    assert _rank({}, "ada") == 4
+    assert _rank({"name": None, "email": None}, "ada") == 4
+
+
+def test_search_terms_dedupes_and_truncates():
+    assert search_terms("Ada, ada  LOVELACE") == ["ada", "lovelace"]
+    assert search_terms("x" * 30) == ["x" * 20]
+    assert search_terms(" - ") == []
+
+
+def test_build_search_tokens_covers_name_email_and_profile():
+    tokens = build_search_tokens({
+        "name": "Ada Lovelace",
+        "email": "a.king@analytical.org",
+        "professionalProfile": {"position": "Analyst"},
+    })
+
+    for token in ("a", "ad", "ada", "l", "lovelace", "king", "a.king", "analytical", "analyst"):
+        assert token in tokens
+    assert "org" not in tokens
+    assert tokens == sorted(tokens)
+    assert build_search_tokens(None) == []
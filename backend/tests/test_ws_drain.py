@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from app import presence_writer as presence_module
+from app.presence_writer import PresenceWriteBuffer
+from app.ws_manager import ConnectionManager, WS_SERVICE_RESTART
+
+
+class FakeSocket:
+    def __init__(self, manager, user_id, writer):
+        self.manager = manager
+        self.user_id = user_id
+        self.writer = writer
+        self.sent = []
+        self.closed_with = None
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+    async def close(self, code, reason):
+        # What the /ws/notifications handler does once its socket goes away
+        self.closed_with = code
+        await self.manager.disconnect("notifications", self, user_id=self.user_id)
+        if self.manager.draining and str(self.user_id) not in self.manager.online_users:
+            self.writer.record(self.user_id, True, self.manager.note_drained(self.user_id))
+
+
+@pytest.fixture
+def writer(monkeypatch, mongo_db):
+    monkeypatch.setattr(presence_module, "users_collection", mongo_db.users)
+    buffer = PresenceWriteBuffer(interval=60)
+    monkeypatch.setattr("app.ws_manager.presence_writer", buffer)
+    mongo_db.users.insert_many([{"id": user_id, "isOnline": True, "lastActive": 0} for user_id in (1, 2, 3)])
+    return buffer
+
+
+def _connect_all(manager, writer):
+    async def connect():
+        sockets = []
+        for user_id in (1, 2, 3):
+            socket = FakeSocket(manager, user_id, writer)
+            await manager.connect("notifications", socket, user_id=user_id)
+            sockets.append(socket)
+        return sockets
+    return connect()
+
+
+def test_undrain_accepts_sockets_again(writer):
+    async def scenario():
+        manager = ConnectionManager()
+        sockets = await _connect_all(manager, writer)
+        manager.start_drain(waves=1, duration=0, offline_after=60)
+        assert manager.draining
+        assert manager.start_drain() is None
+        await manager._drain_task
+
+        assert all(socket.closed_with == WS_SERVICE_RESTART for socket in sockets)
+        assert all(socket.sent[0]["type"] == "reconnect_after" for socket in sockets)
+        assert manager.end_drain() is True
+        assert not manager.draining
+        assert manager.end_drain() is False
+        manager._settle_task.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_drained_users_that_never_return_go_offline(writer, mongo_db):
+    async def scenario():
+        manager = ConnectionManager()
+        await _connect_all(manager, writer)
+        manager.start_drain(waves=1, duration=0, offline_after=0.05)
+        await manager._drain_task
+        await writer.flush()
+        assert mongo_db.users.count_documents({"isOnline": True}) == 3
+
+        # 2 reconnects to another instance, 3 back to this one after an undrain
+        mongo_db.users.update_one({"id": 2}, {"$set": {"isOnline": True, "lastActive": 10**10}})
+        manager.end_drain()
+        await manager.connect("notifications", FakeSocket(manager, 3, writer), user_id=3)
+        await manager._settle_task
+
+    asyncio.run(scenario())
+    states = {user["id"]: user["isOnline"] for user in mongo_db.users.find()}
+    assert states == {1: False, 2: True, 3: True}
+
+
+def test_settle_flushes_buffered_presence_first(writer, mongo_db):
+    async def scenario():
+        manager = ConnectionManager()
+        manager.draining = True
+        writer.record(1, True, manager.note_drained(1))
+        assert await manager.settle_drained_presence() == 1
+        assert await manager.settle_drained_presence() == 0
+
+    asyncio.run(scenario())
+    assert mongo_db.users.find_one({"id": 1})["isOnline"] is False
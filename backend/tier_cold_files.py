@@ -0,0 +1,13 @@
+"""Move file contents nobody has downloaded for N days to the Google Drive
+cold tier. Downloads of tiered files are proxied through a local cache.
+
+Run from the backend folder (e.g. nightly): python tier_cold_files.py [days] [limit]
+"""
+import json
+import sys
+
+from app.core.file_storage import tier_cold_files
+
+days = int(sys.argv[1]) if len(sys.argv) > 1 else None
+limit = int(sys.argv[2]) if len(sys.argv) > 2 else None
+print(json.dumps(tier_cold_files(days=days, limit=limit)))
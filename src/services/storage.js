@@ -299,6 +299,20 @@ const clearContextCache = chatId => {
   removeSimpleCache(cacheKey, cacheTimeKey)
 }
 
+// GET /users/ is cursor-paginated; walk every page of the org directory
+const fetchUserPages = async () => {
+  const users = []
+  let cursor = null
+  do {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : ""
+    const res = await authFetch(`${API_BASE}/users/${query}`)
+    const data = await safeJson(res)
+    users.push(...ensureArray(data))
+    cursor = data && !Array.isArray(data) ? data.nextCursor : null
+  } while (cursor)
+  return users
+}
+
 export const getUsers = async (options = {}) => {
   const { forceRefresh = false, cacheTtl = 30000 } = options
   const cacheKey = USERS_CACHE_KEY
@@ -315,10 +329,7 @@ export const getUsers = async (options = {}) => {
         if (Date.now() - cacheTime > cacheTtl) {
           ;(async () => {
             try {
-              const res = await authFetch(`${API_BASE}/users/`)
-              const data = await safeJson(res)
-              const arr = ensureArray(data)
-              mergeUsersIntoCache(arr)
+              mergeUsersIntoCache(await fetchUserPages())
             } catch (e) {}
           })()
         }
@@ -335,9 +346,7 @@ export const getUsers = async (options = {}) => {
 
   // No cache - fetch fresh
   const request = (async () => {
-    const res = await authFetch(`${API_BASE}/users/`)
-    const data = await safeJson(res)
-    const arr = ensureArray(data)
+    const arr = await fetchUserPages()
     mergeUsersIntoCache(arr)
     return arr
   })()
@@ -40,11 +40,21 @@ const buildQuery = () => {
   return qs ? `?${qs}` : ""
 }
 
+// Server closes with 1013 ("Try Again Later") and reason "retry_after=<seconds>"
+// when it is shedding handshakes; honour that hint instead of our own backoff.
+const retryAfterFromClose = e => {
+  if (!e || e.code !== 1013) return null
+  const match = /retry_after=(\d+)/.exec(e.reason || "")
+  return match ? Number(match[1]) * 1000 : null
+}
+
 const makeSocketWrapper = (urlFactory, initialOnMessage, name = "socket") => {
   let ws = null
   let closedByUser = false
   let reconnectAttempts = 0
   let reconnectTimer = null
+  // Delay suggested by a "reconnect_after" frame sent before a server drain
+  let drainReconnectDelay = null
   const outQueue = []
   
   // Mutable onMessage callback that can be updated
@@ -92,6 +102,10 @@ const makeSocketWrapper = (urlFactory, initialOnMessage, name = "socket") => {
     ws.onmessage = e => {
       let data = null
       try { data = JSON.parse(e.data) } catch (err) { console.warn("invalid json", err); return }
+      if (data && data.type === "reconnect_after") {
+        drainReconnectDelay = Number(data.delayMs) || null
+        return
+      }
       if (onMessage) onMessage(data)
       if (handlers.onmessage) handlers.onmessage(e)
     }
@@ -99,7 +113,9 @@ const makeSocketWrapper = (urlFactory, initialOnMessage, name = "socket") => {
     ws.onclose = e => {
       log("closed", e.code, e.reason)
       if (handlers.onclose) handlers.onclose(e)
-      if (!closedByUser) scheduleReconnect()
+      const serverDelay = retryAfterFromClose(e) ?? drainReconnectDelay
+      drainReconnectDelay = null
+      if (!closedByUser) scheduleReconnect(serverDelay)
     }
 
     ws.onerror = e => {
@@ -108,9 +124,11 @@ const makeSocketWrapper = (urlFactory, initialOnMessage, name = "socket") => {
     }
   }
 
-  const scheduleReconnect = () => {
+  const scheduleReconnect = (serverDelayMs = null) => {
     reconnectAttempts = Math.min(10, reconnectAttempts + 1)
-    const delay = Math.min(30000, 1000 * Math.pow(1.5, reconnectAttempts))
+    const delay = serverDelayMs != null
+      ? serverDelayMs
+      : Math.min(30000, 1000 * Math.pow(1.5, reconnectAttempts))
     console.warn(`[ws:${name}] scheduling reconnect in`, delay, "ms")
     if (reconnectTimer) clearTimeout(reconnectTimer)
     reconnectTimer = setTimeout(() => {